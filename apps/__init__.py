@@ -49,8 +49,27 @@ conn_args = {
                 'password':'123123', 
                 'database': 'ltcj_x'}
 
+# mincached, maxcached, maxshared, maxconnections, blocking, maxusage, setsession
+# maxcached=0 表示空闲连接数不限(用过的连接全部保留), 不是不保留空闲连接
 args = (0,0,0,100,0,0,None )
 dbpool = PooledDB(pyDB, *args, **conn_args)
+# 30秒内用过的连接取出时不再 ping(省去一次往返), 断开的连接在执行时发现, 查询语句自动重试一次
+dbpool.ping_idle = 30
+# 空闲连接数按最近5分钟的最大并发数加2调整, 超出的连接归还时关闭; dbpool.stats() 查看等待和占用时间等统计
+# 只记录设置, 不建立连接; 预先建立空闲连接在 server.py 启动服务器时执行(dbpool.warmup())
+dbpool.adapt_idle(window=300, spare=2)
+# 线程很多且连接数充足时, 线程归还的连接留给本线程下次使用, 不经过连接池的锁
+#dbpool.use_thread_affinity()
+# Grid分页方言, None 表示按数据库类型选择(SQL Server 默认用 row_number, 支持 2005 和 SQLEXPRESS); SQL Server 2012 及以上可设为 'sqlserver2012' 使用 OFFSET/FETCH
+db_dialect = None
+# 查询结果缓存的表(只在这些表上的查询默认缓存, 经 sql_utils 写入时失效), 如 ('departments', 'personnel_area')
+query_cache_tables = ()
+# 只读副本的连接池, 报表查询按轮询使用, 如 [PooledDB(pyDB, *args, **replica_args)]; 为空时全部使用 dbpool
+replica_pools = []
+# 用户写入后继续读主库的秒数(副本同步延迟)
+replica_sticky_seconds = 5
+# 并发执行查询(Grid 的计数和当前页, sql_utils.run_parallel)的线程数, 应小于连接池的 maxconnections
+parallel_workers = 8
 
 
 # Crud ORM数据库配置
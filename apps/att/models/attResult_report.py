@@ -22,6 +22,8 @@ class OrderAttReport(GridModel):
             ('attdays',u'出勤工作日'),('overtimes',u'加班时间'), ('leaveimes',u'请假时长'),
             ('stopWorkTimes',u'停工时长'),
             ]
+    count_mode = 'estimate'     # 明细覆盖全部历史记录, 按执行计划估算记录数
+    compact_json = True
     option = {
             "usepager": True,
             "useRp": True,
@@ -55,26 +57,25 @@ class OrderAttReport(GridModel):
         #添加数据
         UserID_id = request.params.get("userid", '')
         if UserID_id:
-            self.grid.sql += " and u.userid in (%s)"%UserID_id
+            self.grid.AddIn("u.userid", UserID_id)
             
         deptids = GetAuthoIDs(request.user,1)
         defaultdeptid = request.params.get("DeptID", '')
         if defaultdeptid:
-            self.grid.sql += " and d.DeptID in (%s)"%defaultdeptid
+            self.grid.AddIn("d.DeptID", defaultdeptid)
         elif deptids:
-            self.grid.sql += " and d.DeptID in (%s)"%deptids
+            self.grid.AddIn("d.DeptID", deptids)
             
         badgenumber =  request.params.get("badgenumber", '')
         if badgenumber:
-            self.grid.sql += " and u.badgenumber like ('%%%%%s%%%%')"%badgenumber
+            self.grid.AddFilter("u.badgenumber like ?", '%%%s%%'%badgenumber)
         startDate = request.params.get("startDate", '')
         endDate = request.params.get("endDate", '')
         if startDate:
             startDate = datetime.datetime.strptime(startDate,'%Y-%m-%d')
-            self.grid.sql += " and ar.attdate >= '%s'"%startDate
         if endDate:
             endDate = datetime.datetime.strptime((endDate+" 23:59:59"),'%Y-%m-%d %H:%M:%S')
-            self.grid.sql += " and ar.attdate <= '%s'"%endDate
+        self.grid.AddDateRange("ar.attdate", startDate, endDate)
         pass
     
 class SumAttReport(GridModel):
@@ -89,6 +90,8 @@ class SumAttReport(GridModel):
     menu_index=20
     visible = True
     template = 'attResult_report.html'
+    export_cache_ttl = 600
+    data_tables = ('attshifts', 'att_month_rollup', 'userinfo', 'departments')
     head = [('userid',u'userid'),('DeptID',u'DeptID'),('name',u'姓名'),('badgenumber',u'工号'),
             ('DeptName',u'组织名称'),('attTimes_sum',u'应到'),
             ('attDays_sum',u'实到'),('overtimes_sum',u'加班时间'), ('leaveimes_sum',u'出勤时长'),
@@ -156,29 +159,33 @@ class SumAttReport(GridModel):
    
     def MakeData(self,request,**arg):
         #添加数据
+        startDate = request.params.get("startDate", '')
+        endDate = request.params.get("endDate", '')
+        if startDate:
+            startDate = datetime.datetime.strptime(startDate,'%Y-%m-%d')
+        if endDate:
+            endDate = datetime.datetime.strptime((endDate+" 23:59:59"),'%Y-%m-%d %H:%M:%S')
+        from apps.att.rollup import month_rollup
+        if month_rollup.covers(startDate, endDate):
+            ''' 整月区间改查月度汇总表 '''
+            from mosys.sql_utils import get_sql
+            self.grid.sql = get_sql("attResult","SumAttReportRollup")
         self.grid.sql = self.grid.sql.replace("group by u.userid,u.name,u.badgenumber,d.DeptName,d.DeptID","")
         UserID_id = request.params.get("userid", '')
         if UserID_id:
-            self.grid.sql += " and u.userid in (%s)"%UserID_id
+            self.grid.AddIn("u.userid", UserID_id)
             
         deptids = GetAuthoIDs(request.user,1)
         defaultdeptid = request.params.get("DeptID", '')
         if defaultdeptid:
-            self.grid.sql += " and d.DeptID in (%s)"%defaultdeptid
+            self.grid.AddIn("d.DeptID", defaultdeptid)
         elif deptids:
-            self.grid.sql += " and d.DeptID in (%s)"%deptids
+            self.grid.AddIn("d.DeptID", deptids)
             
         badgenumber =  request.params.get("badgenumber", '')
         if badgenumber:
-            self.grid.sql += " and u.badgenumber like ('%%%%%s%%%%')"%badgenumber
-        startDate = request.params.get("startDate", '')
-        endDate = request.params.get("endDate", '')
-        if startDate:
-            startDate = datetime.datetime.strptime(startDate,'%Y-%m-%d')
-            self.grid.sql += " and ar.attdate >= '%s'"%startDate
-        if endDate:
-            endDate = datetime.datetime.strptime((endDate+" 23:59:59"),'%Y-%m-%d %H:%M:%S')
-            self.grid.sql += " and ar.attdate <= '%s'"%endDate
+            self.grid.AddFilter("u.badgenumber like ?", '%%%s%%'%badgenumber)
+        self.grid.AddDateRange("ar.attdate", startDate, endDate)
         self.grid.sql+=" group by u.userid,u.name,u.badgenumber,d.DeptName,d.DeptID"
         pass
     
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from mosys.custom_model import AppPage,GridModel
+from mosys.data_source import FileDataSource
 
 from mosys import forms
 
@@ -14,6 +15,9 @@ class ChangeInfo(GridModel):
     icon_class = "menu_monitor"
     menu_index=15
     visible = True
+    export_cache_ttl = 3600     # 数据版本为 info.txt 的修改时间和大小
+    compact_json = True         # 不分页, 一次返回全部提交记录
+    compile_meta = True         # __init__ 只设置列属性, 启动时编译一次
 #    template = 'TransInfo_GridModel.html'
     head = [('version',u'提交版本'),('author',u'提交人'),('time',u'提交日期'),('file',u'文件名'),('path',u'文件目录'),('desc',u'修改原因')]
     search_form = [
@@ -49,63 +53,76 @@ class ChangeInfo(GridModel):
         self.grid.fields["file"]["width"]=240
         self.grid.fields["path"]["width"]=300
         self.grid.fields["desc"]["width"]=400
+        self.grid.fields["version"]["sortable"]=True
+        self.grid.fields["author"]["sortable"]=True
+        self.grid.fields["time"]["sortable"]=True
         
    
     def MakeData(self,request,**arg):
        #添加数据
-        m_list = ParseSvnInfo()
+        self.grid.CalculateItems = self.data_source.get()
         m_author = request.POST.get('author', '')
-        self.grid.InitItems()
-        for e in m_list:
-            r = self.grid.NewItem()
-            r["version"] = e["version"]
-            r["author"] = e["author"]
-            if m_author:
-                if r["author"]!=m_author:
-                    continue
-            r["time"] = e["time"]
-            r["desc"] = '%s'%e["desc"]
-            for m in e["action"]:
-                r["file"] = '%s: %s'%(m[0],m[2])
-                r["path"]= m[1]
-                self.grid.AddItem(r)
+        if m_author:
+            self.grid.FilterItems("author", m_author)
         self.Paging(1)
         pass
     
     
     
-def ParseSvnInfo():
-    m_file = open("info.txt")
-    lines = m_file.readlines()
-    
-    m_list = []
-    i = 0
-    m_len = len(lines)
-    while(i<m_len):
-        m_content = lines[i]
-        if len(m_content)==0:
-            continue
-        record = {}
-        record["version"] = m_content.replace('版本: ','').strip()#m_content[8:].strip()
-        i = i + 1
-        record["author"] = lines[i].replace('作者: ','').strip()#lines[i][8:].strip()
-        i = i + 1
-        record["time"] = lines[i].replace('日期: ','').strip()#lines[i][8:].strip()
-        i = i + 2
-        desc = ""
-        while(not lines[i].startswith('----')):
-            desc += '\n'+lines[i]
-            i = i+1
-        record["desc"] = desc.strip()
-        i = i+1
-        action = []
-        while(len(lines[i].strip())!=0):
-            #action += '\n'+lines[i]
-            m_tmp = lines[i].split(":")
-            p_split = m_tmp[1].rindex('/')+1
-            action.append((m_tmp[0].strip(),m_tmp[1][:p_split].strip(),m_tmp[1][p_split:].strip()))
-            i = i+1
-        record["action"] = action
-        m_list.append(record)
+def _ParseSvnRecord(lines):
+    '''
+    解析一条svn日志记录, 每个修改的文件生成一行
+    '''
+    version = lines[0].replace('版本: ','').strip()
+    author = lines[1].replace('作者: ','').strip()
+    time = lines[2].replace('日期: ','').strip()
+    i = 4
+    desc = ""
+    while(not lines[i].startswith('----')):
+        desc += '\n'+lines[i]
         i = i+1
-    return m_list
\ No newline at end of file
+    desc = '%s'%desc.strip()
+    rows = []
+    for m in lines[i+1:]:
+        m_tmp = m.split(":")
+        p_split = m_tmp[1].rindex('/')+1
+        rows.append({
+            "version": version,
+            "author": author,
+            "time": time,
+            "desc": desc,
+            "file": '%s: %s'%(m_tmp[0].strip(),m_tmp[1][p_split:].strip()),
+            "path": m_tmp[1][:p_split].strip(),
+        })
+    return rows
+
+def ParseSvnRecords(f):
+    '''
+    从文件当前位置解析svn日志, 文件尾不完整的记录留到下次解析
+    记录格式: 版本/作者/日期/信息 四行, 说明, '----', 修改的文件列表, 空行
+    @return    (行列表, 最后一条完整记录之后的偏移)
+    '''
+    pos = end = f.tell()
+    rows = []
+    lines = []
+    in_action = False
+    for line in iter(f.readline, ''):
+        pos += len(line)
+        if pos==len(line) and line.startswith('\xef\xbb\xbf'):
+            line = line[3:]
+        if not lines and not line.strip():
+            end = pos
+            continue
+        if in_action and not line.strip():
+            rows.extend(_ParseSvnRecord(lines))
+            lines = []
+            in_action = False
+            end = pos
+            continue
+        if not in_action and line.startswith('----') and len(lines)>=4:
+            in_action = True
+        lines.append(line)
+    return rows, end
+
+ChangeInfo.data_source = FileDataSource("info.txt", ParseSvnRecords,
+                                        columns=[e[0] for e in ChangeInfo.head])
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+'''
+考勤月度汇总(att_month_rollup)
+按 (人员, 月份) 预先汇总 attshifts, 汇总报表查询整月区间时改查汇总表, 不再扫描历年的排班记录.
+部门在查询时通过 userinfo 关联, 与原报表按人员当前部门分组的结果一致.
+
+增量刷新: att_rollup_state 记录已汇总的 attshifts 最大 id(水位),
+刷新时只重建水位之后新增记录所在的月份, 以及最近 RECENT_MONTHS 个月(考勤重算会删除并重建这些月份的记录).
+刷新在后台线程中每 REFRESH_INTERVAL 秒执行一次, 报表请求只检查汇总表是否可用, 不等待刷新.
+重算更早的月份后需调用 month_rollup.invalidate(start, end)
+'''
+import time
+import datetime
+import threading
+import traceback
+
+REFRESH_INTERVAL = 60   # 后台刷新的间隔(秒)
+MAX_LAG = 3*REFRESH_INTERVAL    # 超过这个时间没有成功刷新时报表回退到查询 attshifts
+RECENT_MONTHS = 2       # 每次刷新都重建的最近月份数
+STATE_NAME = 'att_month_rollup'
+
+def month_start(d):
+    return datetime.datetime(d.year, d.month, 1)
+
+def next_month(d):
+    if d.month==12:
+        return datetime.datetime(d.year+1, 1, 1)
+    return datetime.datetime(d.year, d.month+1, 1)
+
+def iter_months(start, end):
+    '''
+    start 到 end(含)之间各月的第一天
+    '''
+    m = month_start(start)
+    while m <= end:
+        yield m
+        m = next_month(m)
+
+def is_month_range(start, end):
+    '''
+    日期区间是否由整月组成, 为空的一端不限制
+    '''
+    if start and start!=month_start(start):
+        return False
+    if end and (end+datetime.timedelta(days=1)).day!=1:
+        return False
+    return True
+
+def _execute(cur, sqlid, **params):
+    '''
+    执行 attRollup.xml 中的语句, 语句中用命名参数(:name)
+    '''
+    from mosys.sql_utils import get_statement
+    m_stmt = get_statement("attRollup", sqlid, "att")
+    m_args = m_stmt.bind(params)
+    if m_args:
+        cur.execute(m_stmt.sql, m_args)
+    else:
+        cur.execute(m_stmt.sql)
+
+class MonthRollup(object):
+    '''
+    月度汇总表的维护
+    '''
+    def __init__(self, name=STATE_NAME, refresh_interval=REFRESH_INTERVAL, recent_months=RECENT_MONTHS,
+                 max_lag=MAX_LAG):
+        self.name = name
+        self.refresh_interval = refresh_interval
+        self.recent_months = recent_months
+        self.max_lag = max_lag
+        self.ready = False
+        self.last_refresh = 0
+        self.refreshed = 0              # 最近一次成功刷新的时间, 此时的 attshifts 已全部汇总(水位)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def _connect(self):
+        from mosys.sql_utils import getConn
+        return getConn()
+
+    def _ensure_tables(self, conn):
+        cur = conn.cursor()
+        try:
+            try:
+                _execute(cur, "GetState", name=self.name)
+                cur.fetchall()
+            except:
+                conn.rollback()
+                _execute(cur, "CreateRollup")
+                _execute(cur, "CreateRollupIndex")
+                _execute(cur, "CreateRollupState")
+                conn.commit()
+        finally:
+            cur.close()
+
+    def _rebuild_month(self, conn, month):
+        '''
+        在一个事务内重建一个月的汇总, 读报表的请求不会看到缺少数据的月份
+        '''
+        cur = conn.cursor()
+        try:
+            m_next = next_month(month)
+            _execute(cur, "DeleteMonth", month=month, end=m_next)
+            _execute(cur, "InsertMonth", month=month, end=m_next)
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def start(self):
+        '''
+        启动后台刷新线程(只启动一次)
+        '''
+        if self.thread is not None:
+            return
+        self.start_lock.acquire()
+        try:
+            if self.thread is None:
+                t = threading.Thread(target=self._run, name='att-rollup-refresh')
+                t.setDaemon(True)
+                t.start()
+                self.thread = t
+        finally:
+            self.start_lock.release()
+
+    def _run(self):
+        while True:
+            self.refresh(True)
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, force=False):
+        '''
+        增量刷新, REFRESH_INTERVAL 内最多刷新一次; 其他线程正在刷新时直接返回
+        @return    汇总表是否可用
+        '''
+        if not force and time.time()-self.last_refresh < self.refresh_interval:
+            return self.ready
+        if not self.lock.acquire(False):
+            return self.ready
+        try:
+            self.last_refresh = m_start = time.time()
+            conn = self._connect()
+            try:
+                self._refresh(conn)
+                self.ready = True
+                self.refreshed = m_start
+            finally:
+                conn.close()
+        except:
+            ''' 刷新失败时汇总表可能已过期, 报表回退到查询 attshifts '''
+            self.ready = False
+            traceback.print_exc()
+        finally:
+            self.lock.release()
+        return self.ready
+
+    def _refresh(self, conn):
+        self._ensure_tables(conn)
+        cur = conn.cursor()
+        try:
+            _execute(cur, "GetState", name=self.name)
+            m_state = cur.fetchone()
+            _execute(cur, "MaxShiftID")
+            m_top = cur.fetchone()[0] or 0
+            m_watermark = m_state and m_state[0] or 0
+            _execute(cur, "ChangedRange", low=m_watermark, high=m_top)
+            m_start, m_end = cur.fetchone()
+        finally:
+            cur.close()
+        months = set()
+        if m_start:
+            months.update(iter_months(m_start, m_end))
+        m_now = month_start(datetime.datetime.now())
+        for i in range(self.recent_months):
+            months.add(m_now)
+            m_now = month_start(m_now-datetime.timedelta(days=1))
+        for m in sorted(months):
+            self._rebuild_month(conn, m)
+        ''' 所有月份重建完成后再推进水位, 中途失败时下次刷新会重做 '''
+        cur = conn.cursor()
+        try:
+            _execute(cur, m_state and "UpdateState" or "InsertState",
+                     watermark=m_top, refreshed=datetime.datetime.now(), name=self.name)
+            conn.commit()
+        finally:
+            cur.close()
+
+    def invalidate(self, start, end):
+        '''
+        重建 start 到 end 之间各月的汇总(重算历史考勤后调用)
+        '''
+        self.lock.acquire()
+        try:
+            conn = self._connect()
+            try:
+                self._ensure_tables(conn)
+                for m in iter_months(start, end):
+                    self._rebuild_month(conn, m)
+            finally:
+                conn.close()
+        finally:
+            self.lock.release()
+
+    def covers(self, start, end):
+        '''
+        日期区间可以改查汇总表时返回 True(整月区间, 汇总表可用且 max_lag 内刷新过)
+        只检查状态, 刷新由后台线程执行; 第一次调用时启动后台线程
+        '''
+        self.start()
+        return is_month_range(start, end) and self.ready and time.time()-self.refreshed < self.max_lag
+
+month_rollup = MonthRollup()
@@ -80,15 +80,115 @@ function do_export(com,grid)
 	}
 	var url = m_util.bg_params+"format=."+m_format+"&hide="+m_util.hide_index.join(',')+"&"+m_util.cur_param;
 	//window.open(url);
-	$("#export_ifm").attr("src",url);
+	//提交后台导出任务, 轮询进度, 完成后下载
+	$.getJSON(url+"&bg=1", function(ret){
+		if (ret.statusCode!="200"){
+			alertMsg.error(ret.message);
+			return;
+		}
+		if (ret.url){
+			//已有相同的导出结果
+			$("#export_ifm",m_util.p).attr("src",ret.url);
+			return;
+		}
+		show_export_progress(m_util, "导出排队中...");
+		poll_export(m_util, ret.jobId);
+	});
+}
+
+/*
+ * 轮询后台导出任务
+ */
+function poll_export(m_util, job_id)
+{
+	$.getJSON("/export/job/"+job_id+"/", function(ret){
+		if (ret.statusCode!="200"){
+			show_export_progress(m_util, "");
+			alertMsg.error(ret.message);
+		}else if (ret.status=="done"){
+			show_export_progress(m_util, "");
+			$("#export_ifm",m_util.p).attr("src",ret.url);
+		}else if (ret.status=="failed"){
+			show_export_progress(m_util, "");
+			alertMsg.error("导出失败: "+ret.message);
+		}else{
+			if (ret.status=="running"){
+				var msg = "正在导出 "+ret.progress+"% ("+ret.done+"/"+ret.total+")";
+				if (ret.eta!=null){msg += ", 预计剩余 "+ret.eta+" 秒";}
+				show_export_progress(m_util, msg);
+			}
+			setTimeout(function(){poll_export(m_util, job_id);}, 2000);
+		}
+	});
+}
+
+function show_export_progress(m_util, msg)
+{
+	$("#export_progress",m_util.p).text(msg);
 }
 
 
+/*
+ * grid数据的预处理(flexigrid preProcess)
+ * 查询出错(如超时)时提示, 紧凑格式的数据还原为按字段名的行
+ */
+function grid_preprocess(data)
+{
+	var p = this;
+	get_cur_util().qid = null;
+	if (data && data.statusCode=="300"){
+		alertMsg.error(data.message);
+		return {total:0, page:1, rows:[]};
+	}
+	//估算的记录数显示为"约 N", 不计数时显示"至少 N"
+	if (p && p.pagestat){
+		if (p.pagestat_exact===undefined){p.pagestat_exact = p.pagestat;}
+		if (data.count=="estimate"){
+			p.pagestat = p.pagestat_exact.replace("{total}", "约 {total}");
+		}else if (data.count=="none"){
+			p.pagestat = p.pagestat_exact.replace("{total}", "至少 {total}");
+		}else{
+			p.pagestat = p.pagestat_exact;
+		}
+	}
+	return expand_compact(data);
+}
+
+/*
+ * 还原紧凑格式的grid数据
+ * {cols:[字段名], rows:[[值]], dicts:{字段名:[取值]}} => rows:[{字段名:值}]
+ */
+function expand_compact(data)
+{
+	if (!data || !data.cols){return data;}
+	var cols = data.cols;
+	var dicts = [];
+	for (var j=0;j<cols.length;j++){
+		dicts.push(data.dicts ? data.dicts[cols[j]] : null);
+	}
+	var rows = [];
+	for (var i=0;i<data.rows.length;i++){
+		var r = data.rows[i];
+		var row = {};
+		for (var j=0;j<cols.length;j++){
+			row[cols[j]] = dicts[j] ? dicts[j][r[j]] : r[j];
+		}
+		if (row.id===undefined){row.id = row[cols[0]];}
+		rows.push(row);
+	}
+	data.rows = rows;
+	return data;
+}
+
 /*
  * grid数据加载前调用
  */
 function do_Submit(){
 	var p =this;
+	//查询编号, 离开页面时用于取消仍在执行的查询
+	var m_util = get_cur_util();
+	m_util.qid = new Date().getTime().toString(36)+Math.random().toString(36).substr(2,8);
+	set_param(p.params, "qid", m_util.qid);
 	var m_param = ''
 	for (var i=0;i<p.params.length;i++)
 	{
@@ -124,4 +224,79 @@ function getQueryString(name)
 {
     var reg = new RegExp("(^|\\?|&)"+ name +"=([^&]*)(\\s|&|$)", "i");  
     if (reg.test(location.href)) return unescape(RegExp.$2.replace(/\+/g, " ")); return "";
-};
\ No newline at end of file
+};
+
+/*
+ * 设置参数列表中的参数, 已有同名参数时替换
+ */
+function set_param(params, name, value)
+{
+	for (var i=0;i<params.length;i++){
+		if (params[i].name==name){
+			params[i].value = value;
+			return;
+		}
+	}
+	params.push({name: name, value: value});
+}
+
+/*
+ * 取消执行中的grid查询
+ * async: 离开页面时须同步发送, 关闭页签或对话框时异步发送
+ */
+function cancel_query(m_util, async)
+{
+	if (m_util && m_util.qid){
+		$.ajax({url: "/query/cancel/"+m_util.qid+"/", type: "POST", async: !!async});
+		m_util.qid = null;
+	}
+}
+
+/*
+ * 关闭 navTab 页签或对话框时取消其中仍在执行的grid查询
+ * DWZ 的 navTab 没有关闭回调, 包装 navTab 和 $.pdialog 的关闭方法; 本文件随每个grid页面加载, 只包装一次
+ */
+function bind_close_cancel()
+{
+	if (typeof(navTab)!="undefined" && !navTab._cancel_bound){
+		navTab._cancel_bound = true;
+		var cancel_panels = function($panels){
+			if ($panels.find(".flexigrid").length && typeof(m_util)!="undefined"){cancel_query(m_util, true);}
+		};
+		var m_close = navTab._closeTab;
+		navTab._closeTab = function(index){
+			cancel_panels(this._getPanels().eq(index));
+			return m_close.apply(this, arguments);
+		};
+		var m_close_all = navTab.closeAllTab;
+		navTab.closeAllTab = function(){
+			cancel_panels(this._getPanels().filter(":gt(0)"));
+			return m_close_all.apply(this, arguments);
+		};
+		var m_close_other = navTab._closeOtherTab;
+		navTab._closeOtherTab = function(index){
+			index = index || this._currentIndex;
+			cancel_panels(this._getPanels().not(":eq("+index+")").filter(":gt(0)"));
+			return m_close_other.apply(this, arguments);
+		};
+	}
+	if ($.pdialog && !$.pdialog._cancel_bound){
+		$.pdialog._cancel_bound = true;
+		var m_dialog_close = $.pdialog.close;
+		$.pdialog.close = function(dialog){
+			var $dialog = typeof dialog == 'string' ? $("body").data(dialog) : $(dialog);
+			var ret = m_dialog_close.apply(this, arguments);
+			//对话框的 close 回调可能阻止关闭, 确实关闭后才取消
+			if ($dialog && !$dialog.parents("body").length && typeof(dialog_util)!="undefined"){
+				cancel_query(dialog_util, true);
+			}
+			return ret;
+		};
+	}
+}
+bind_close_cancel();
+
+$(window).bind("beforeunload", function(){
+	if (typeof(m_util)!="undefined"){cancel_query(m_util);}
+	if (typeof(dialog_util)!="undefined"){cancel_query(dialog_util);}
+});
@@ -51,5 +51,5 @@ class AreaSelect(GridModel):
         self.ParseLike(request)
         areaids = GetAuthoIDs(request.user,2)    
         if areaids:
-            self.grid.sql += " and id in (%s)"%areaids
+            self.grid.AddIn("id", areaids)
         pass
\ No newline at end of file
@@ -50,6 +50,6 @@ class DeptSelect(GridModel):
         self.ParseLike(request)
         deptids = GetAuthoIDs(request.user,1)    
         if deptids:
-            self.grid.sql += " and DeptID in (%s)"%deptids
+            self.grid.AddIn("DeptID", deptids)
        #添加数据
         pass
\ No newline at end of file
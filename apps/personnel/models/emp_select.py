@@ -57,5 +57,5 @@ class EmpSelect(GridModel):
         self.ParseLike(request)
         deptids = GetAuthoIDs(request.user,1)    
         if deptids:
-            self.grid.sql += " and DeptID in (%s)"%deptids
+            self.grid.AddIn("DeptID", deptids)
         pass
\ No newline at end of file
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+'''
+GridBase 行转换性能对比
+用法: python bench/grid_rows.py [行数] [重复次数]
+'''
+import sys
+import os
+import datetime
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib', 'mosys'))
+from grid_utils import GridBase
+from sql_dialect import get_dialect
+
+HEAD = [('userid',u'userid'),('DeptID',u'DeptID'),('name',u'姓名'),('badgenumber',u'工号'),
+        ('DeptName',u'组织名称'),('attTimes_sum',u'应到'),('attDays_sum',u'实到'),
+        ('overtimes_sum',u'加班时间'),('leaveimes_sum',u'出勤时长'),('stopWorkTimes_sum',u'应到时长'),
+        ('completionRate',u'出勤率'),('attdate',u'考勤日期')]
+
+def make_rows(count):
+    now = datetime.datetime(2013, 5, 1, 8, 30)
+    return [(i, i%20, u'name%s'%i, '%08d'%i, u'dept%s'%(i%20), 22, i%23, 0, 1.5, None, 1, now)
+            for i in xrange(count)]
+
+def fooRate(r,val):
+    if int(r[5])==0:
+        return "100%"
+    return u"<font color=red>%10.2f</font>"%(float(r[6])/float(r[5]))
+
+def make_grid(rows):
+    grid = GridBase(HEAD, 0)
+    grid.dialect = get_dialect('mysql')
+    grid.sql = 'select 1'
+    grid.colum_trans["completionRate"] = fooRate
+    grid._ExecSql = lambda sql: rows
+    return grid
+
+def legacy_result(grid, rows, hide_index=None):
+    '''
+    改造前的 _GetData + ResultDic 实现
+    '''
+    names = grid.GetFieldNames()
+    paged = []
+    for r in rows:
+        _item = grid.NewItem().copy()
+        i = 0
+        for e in names:
+            if hide_index and (i in hide_index):
+                del _item[e]
+            else:
+                if r[i]:
+                    if grid.colum_trans.has_key(e):
+                        _item[e] = grid.colum_trans[e](r,r[i])
+                    else:
+                        if type(r[i])==datetime.datetime:
+                            _item[e] = r[i].strftime('%Y-%m-%d %H:%M:%S')
+                        else:
+                            _item[e] = r[i]
+                else:
+                    _item[e] = ''
+            i +=1
+        paged.append(_item.copy())
+    m_rows = []
+    for e in paged:
+        m_row = {"id":e[names[0]]}
+        m_row.update(e)
+        m_rows.append(m_row)
+    return m_rows
+
+def compiled_result(grid):
+    grid.PagedItems = None
+    grid.sql_data = None
+    return grid.ResultDic()['rows']
+
+def main():
+    count = len(sys.argv)>1 and int(sys.argv[1]) or 1000
+    repeat = len(sys.argv)>2 and int(sys.argv[2]) or 20
+    rows = make_rows(count)
+    grid = make_grid(rows)
+    assert legacy_result(grid, rows) == compiled_result(grid)
+    t_old = min(timeit.repeat(lambda: legacy_result(grid, rows), number=1, repeat=repeat))
+    t_new = min(timeit.repeat(lambda: compiled_result(grid), number=1, repeat=repeat))
+    print '%s rows: legacy %.2f ms, compiled %.2f ms, %.1fx'%(count, t_old*1000, t_new*1000, t_old/t_new)
+
+if __name__ == '__main__':
+    main()
@@ -114,6 +114,49 @@ connection object stays alive as long as you are using it, like that:
     cur.close() # or del cur
     db.close() # or del db
 
+Connections are checked with ping() whenever they are fetched from
+the pool (by default). To save this round trip for connections that
+have been used recently, set the number of seconds:
+
+    pool.ping_idle = 30
+
+Idle connections can be established in advance, so that the first
+requests do not have to wait for new database connections:
+
+    pool.warmup(5) # open up to five idle connections
+
+The number of idle connections can also follow the recent demand,
+keeping as many idle connections as were in use concurrently during
+the last window seconds plus a few spare ones, and closing the rest
+when they are returned to the pool:
+
+    pool.adapt_idle(window=300, spare=1)
+
+The pool collects usage statistics, available as a dictionary:
+
+    pool.stats()
+
+They include the number of checkouts, opened, reused and closed
+connections, histograms of the time spent waiting for a connection
+and of the time connections were held, and the connections that are
+currently held longer than pool.hold_warning seconds. Connections that
+are only returned by the garbage collector are counted as leaked.
+Leaked and long-held connections are also reported as warnings
+to the logger "DBUtils.PooledDB".
+
+With many threads, the lock of the pool that is taken whenever a
+connection is requested or returned can become a point of contention.
+With thread affinity, a dedicated connection returned by a thread is
+kept in a slot of that thread and handed out again to the same thread
+without taking the lock:
+
+    pool.use_thread_affinity()
+
+Parked connections still count as connections of the pool. When the
+maximum number of connections is reached, other threads take over the
+parked connections instead of waiting; connections parked by threads
+that have ended are reused instead of opening new connections.
+
 Note that you need to explicitly start transactions by calling the
 begin() method. This ensures that the connection will not be shared
 with other threads, that the transparent reopening will be suspended
@@ -125,7 +168,6 @@ Ideas for improvement:
 
 * Add a thread for monitoring, restarting (or closing) bad or expired
   connections (similar to DBConnectionPool/ResourcePool by Warren Smith).
-* Optionally log usage, bad connections and exceeding of limits.
 
 
 Copyright, credits and license:
@@ -144,10 +186,16 @@ __revision__ = "$Rev: 8218 $"
 __date__ = "$Date: 2011-08-14 13:57:11 +0200 (So, 14. Aug 2011) $"
 
 
-from threading import Condition
+from logging import getLogger
+from thread import get_ident
+from threading import Condition, currentThread
+from threading import enumerate as enumerate_threads
+from time import time
 
 from DBUtils.SteadyDB import connect
 
+logger = getLogger('DBUtils.PooledDB')
+
 
 class PooledDBError(Exception):
     """General PooledDB error."""
@@ -162,6 +210,104 @@ class TooManyConnections(PooledDBError):
     """Too many database connections were opened."""
 
 
+class PoolStats:
+    """Usage statistics of a connection pool.
+
+    The statistics are updated by the pool while holding its lock,
+    except for the thread-affine fast path (see use_thread_affinity()),
+    where the counters may be slightly off under heavy contention.
+
+    """
+
+    # upper bounds of the histogram buckets in seconds
+    wait_buckets = (0.001, 0.01, 0.1, 1, 10)
+    hold_buckets = (0.1, 1, 10, 60, 600)
+
+    def __init__(self):
+        self.checkouts = 0 # number of connections handed out
+        self.opened = 0 # new connections opened for checkouts
+        self.reused = 0 # idle connections reused for checkouts
+        self.warmed = 0 # idle connections opened in advance
+        self.trimmed = 0 # idle connections closed by adapt_idle()
+        self.affine = 0 # checkouts of parked connections without the lock
+        self.reclaimed = 0 # parked connections taken by other threads
+        self.leaked = 0 # connections returned by the garbage collector
+        self.long_held = 0 # connections held longer than hold_warning
+        self.peak = 0 # maximum number of connections in use
+        self.wait_total = self.wait_max = 0.0
+        self.hold_total = self.hold_max = 0.0
+        self.wait_histogram = [0] * (len(self.wait_buckets) + 1)
+        self.hold_histogram = [0] * (len(self.hold_buckets) + 1)
+        self.held = {} # id of the pooled connection -> (checkout, thread)
+
+    def checkout(self, proxy, started, now):
+        """Count a connection that has been handed out."""
+        self.checkouts += 1
+        waited = now - started
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+        self.wait_histogram[_bucket(self.wait_buckets, waited)] += 1
+        self.held[id(proxy)] = (now, currentThread().getName())
+        if len(self.held) > self.peak:
+            self.peak = len(self.held)
+
+    def checkin(self, proxy, now, hold_warning):
+        """Count a connection that has been returned."""
+        try:
+            started, thread = self.held.pop(id(proxy))
+        except KeyError:
+            return
+        held = now - started
+        self.hold_total += held
+        if held > self.hold_max:
+            self.hold_max = held
+        self.hold_histogram[_bucket(self.hold_buckets, held)] += 1
+        if proxy._leaked:
+            self.leaked += 1
+            logger.warning("Connection checked out by thread %s was not"
+                " closed and has been returned after %.1f seconds",
+                thread, held)
+        elif hold_warning and held > hold_warning:
+            self.long_held += 1
+            logger.warning("Connection was held by thread %s"
+                " for %.1f seconds", thread, held)
+
+    def as_dict(self, now, hold_warning):
+        """Get the statistics as a dictionary."""
+        checkouts = self.checkouts or 1
+        returned = sum(self.hold_histogram) or 1
+        held = [(now - started, thread)
+            for started, thread in self.held.values()
+            if not hold_warning or now - started > hold_warning]
+        held.sort()
+        held.reverse()
+        return dict(checkouts=self.checkouts, opened=self.opened,
+            reused=self.reused, warmed=self.warmed, trimmed=self.trimmed,
+            affine=self.affine, reclaimed=self.reclaimed,
+            leaked=self.leaked, long_held=self.long_held, peak=self.peak,
+            in_use=len(self.held), held=held,
+            wait=dict(total=self.wait_total, max=self.wait_max,
+                average=self.wait_total / checkouts,
+                histogram=_histogram(self.wait_buckets, self.wait_histogram)),
+            hold=dict(total=self.hold_total, max=self.hold_max,
+                average=self.hold_total / returned,
+                histogram=_histogram(self.hold_buckets, self.hold_histogram)))
+
+
+def _bucket(buckets, value):
+    """Get the index of the histogram bucket for the given value."""
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+
+def _histogram(buckets, counts):
+    """Pair the histogram counts with the upper bounds of their buckets."""
+    return zip(buckets + (None,), counts)
+
+
 class PooledDB:
     """Pool for DB-API 2 connections.
 
@@ -172,6 +318,13 @@ class PooledDB:
 
     version = __version__
 
+    # held connections are reported after this number of seconds
+    hold_warning = 60
+
+    # skip ping checks of connections used within this number of seconds
+    # (see SteadyDBConnection.ping_idle)
+    ping_idle = 0
+
     def __init__(self, creator,
             mincached=0, maxcached=0,
             maxshared=0, maxconnections=0, blocking=False,
@@ -246,6 +399,7 @@ class PooledDB:
             self._maxcached = maxcached
         else:
             self._maxcached = 0
+        self._mincached = mincached
         if threadsafety > 1 and maxshared:
             self._maxshared = maxshared
             self._shared_cache = [] # the cache for shared connections
@@ -266,17 +420,29 @@ class PooledDB:
                 raise TooManyConnections
             self._condition.wait = wait
         self._connections = 0
+        self._stats = PoolStats()
+        self._idle_window = 0 # adaptive idle sizing is disabled
+        self._idle_spare = 0
+        self._peaks = [] # peak usage per tenth of the window
+        self._affinity = False # thread-affine fast path is disabled
+        self._parked = {} # thread id -> connection parked by this thread
+        self._waiting = 0 # number of threads waiting for a connection
         # Establish an initial number of idle database connections:
         idle = [self.dedicated_connection() for i in range(mincached)]
         while idle:
             idle.pop().close()
+        self._stats = PoolStats()
+        self._stats.warmed = len(self._idle_cache)
 
     def steady_connection(self):
         """Get a steady, unpooled DB-API 2 connection."""
-        return connect(self._creator,
+        con = connect(self._creator,
             self._maxusage, self._setsession,
             self._failures, self._ping, True,
             *self._args, **self._kwargs)
+        if self.ping_idle:
+            con.ping_idle = self.ping_idle
+        return con
 
     def connection(self, shareable=True):
         """Get a steady, cached DB-API 2 connection from the pool.
@@ -285,6 +451,16 @@ class PooledDB:
         then the connection may be shared with other threads.
 
         """
+        started = time()
+        if self._affinity and not (shareable and self._maxshared):
+            # fast path: reuse the connection parked by this thread
+            con = self._parked.pop(get_ident(), None)
+            if con is not None:
+                con._ping_check() # check connection
+                con = PooledDedicatedDBConnection(self, con)
+                self._stats.affine += 1
+                self._stats.checkout(con, started, time())
+                return con
         if shareable and self._maxshared:
             self._condition.acquire()
             try:
@@ -293,12 +469,7 @@ class PooledDB:
                     self._condition.wait()
                 if len(self._shared_cache) < self._maxshared:
                     # shared cache is not full, get a dedicated connection
-                    try: # first try to get it from the idle cache
-                        con = self._idle_cache.pop(0)
-                    except IndexError: # else get a fresh connection
-                        con = self.steady_connection()
-                    else:
-                        con._ping_check() # check this connection
+                    con = self._idle_connection()
                     con = SharedDBConnection(con)
                     self._connections += 1
                 else: # shared cache full or no more connections allowed
@@ -315,36 +486,249 @@ class PooledDB:
                 # put the connection (back) into the shared cache
                 self._shared_cache.append(con)
                 self._condition.notify()
+                con = PooledSharedDBConnection(self, con)
+                self._checkout(con, started)
             finally:
                 self._condition.release()
-            con = PooledSharedDBConnection(self, con)
         else: # try to get a dedicated connection
             self._condition.acquire()
             try:
+                con = None
                 while (self._maxconnections
                         and self._connections >= self._maxconnections):
-                    self._condition.wait()
-                # connection limit not reached, get a dedicated connection
-                try: # first try to get it from the idle cache
-                    con = self._idle_cache.pop(0)
-                except IndexError: # else get a fresh connection
-                    con = self.steady_connection()
-                else:
+                    # count as waiting before looking for parked connections,
+                    # so that _park() cannot park unnoticed in between
+                    self._waiting += 1
+                    try:
+                        con = self._reclaim()
+                        if con is not None:
+                            break
+                        self._condition.wait()
+                    finally:
+                        self._waiting -= 1
+                if con is None and not self._idle_cache and self._parked:
+                    # reuse connections of threads that have ended
+                    con = self._reclaim(True)
+                if con is None:
+                    # connection limit not reached, get a dedicated connection
+                    con = self._idle_connection()
+                    self._connections += 1
+                else: # parked connections still count as connections
                     con._ping_check() # check connection
                 con = PooledDedicatedDBConnection(self, con)
-                self._connections += 1
+                self._checkout(con, started)
             finally:
                 self._condition.release()
         return con
 
+    def use_thread_affinity(self, enabled=True):
+        """Keep returned dedicated connections in a slot of their thread.
+
+        A thread then gets back the connection it returned last without
+        taking the lock of the pool. Parked connections still count as
+        connections of the pool; they are taken over by other threads
+        when maxconnections is reached or when their thread has ended.
+        This does not apply to shareable connections if maxshared is set.
+
+        """
+        self._condition.acquire()
+        try:
+            self._affinity = enabled
+            if not enabled:
+                self._unpark_all()
+        finally:
+            self._condition.release()
+
+    def _park(self, con, proxy):
+        """Keep a returned connection in the slot of the current thread.
+
+        This is done without taking the lock. Returns False if the
+        connection shall be returned to the pool the usual way, because
+        the slot is occupied or other threads are waiting.
+
+        """
+        ident = get_ident()
+        if self._waiting or ident in self._parked:
+            return False
+        con._reset(force=self._reset) # rollback possible transaction
+        self._stats.checkin(proxy, time(), self.hold_warning)
+        self._parked[ident] = con
+        if self._waiting and self._parked.pop(ident, None) is con:
+            # a thread started waiting meanwhile, so wake it up
+            self._condition.acquire()
+            try:
+                self._connections -= 1
+                self._idle_cache.append(con)
+                self._condition.notify()
+            finally:
+                self._condition.release()
+        return True
+
+    def _reclaim(self, ended=False):
+        """Take over a connection parked by another thread.
+
+        If ended is set, only connections of threads that have ended
+        are taken over.
+
+        """
+        idents = self._parked.keys()
+        if ended:
+            alive = set([thread.ident for thread in enumerate_threads()])
+            idents = [ident for ident in idents if ident not in alive]
+        for ident in idents:
+            con = self._parked.pop(ident, None)
+            if con is not None:
+                self._stats.reclaimed += 1
+                return con
+
+    def _unpark_all(self):
+        """Move all parked connections to the idle cache."""
+        while self._parked:
+            con = self._reclaim()
+            if con is not None:
+                self._connections -= 1
+                self._idle_cache.append(con)
+
+    def _idle_connection(self):
+        """Get a connection from the idle cache or a new one."""
+        try: # first try to get it from the idle cache
+            con = self._idle_cache.pop(0)
+        except IndexError: # else get a fresh connection
+            con = self.steady_connection()
+            self._stats.opened += 1
+        else:
+            con._ping_check() # check connection
+            self._stats.reused += 1
+        return con
+
+    def _checkout(self, con, started):
+        """Record a connection that has been handed out."""
+        now = time()
+        self._stats.checkout(con, started, now)
+        if self._idle_window:
+            self._note_usage(now, len(self._stats.held))
+
+    def _note_usage(self, now, in_use):
+        """Record the number of connections in use for adapt_idle()."""
+        peaks = self._peaks
+        if peaks and now - peaks[-1][0] < self._idle_window / 10.0:
+            if in_use > peaks[-1][1]:
+                peaks[-1][1] = in_use
+        else:
+            peaks.append([now, in_use])
+            while peaks and now - peaks[0][0] > self._idle_window:
+                del peaks[0]
+
+    def idle_target(self):
+        """Get the number of idle connections the pool should keep.
+
+        This is mincached unless adapt_idle() has been called, in which
+        case it is the highest number of connections in use during the
+        window plus the spare connections, but at most maxcached
+        (if maxcached is 0 or None, the idle cache is unlimited and
+        only adapt_idle() closes surplus idle connections).
+
+        """
+        target = self._mincached
+        if self._idle_window:
+            now = time()
+            recent = [peak for start, peak in self._peaks
+                if now - start <= self._idle_window]
+            if recent:
+                target = max(target, max(recent) + self._idle_spare)
+            else:
+                target = max(target, self._idle_spare)
+        if self._maxcached:
+            target = min(target, self._maxcached)
+        return target
+
+    def adapt_idle(self, window=300, spare=1):
+        """Adapt the number of idle connections to the recent demand.
+
+        window: the period in seconds during which the usage is observed
+            (0 or None disables adaptive sizing)
+        spare: number of idle connections to keep in addition to the
+            highest number of connections used during the window
+
+        Connections exceeding idle_target() are closed when they
+        are returned to the pool instead of being kept idle.
+
+        """
+        self._condition.acquire()
+        try:
+            self._idle_window = window or 0
+            self._idle_spare = spare or 0
+            self._peaks = []
+        finally:
+            self._condition.release()
+
+    def warmup(self, count=None):
+        """Establish idle connections in advance.
+
+        count: the number of idle connections the pool should have
+            (the default is the idle_target())
+
+        Returns the number of newly opened connections. Since this is
+        usually called at startup, connection errors are not raised;
+        the pool then simply opens the connections when needed.
+
+        """
+        if count is None:
+            count = self.idle_target()
+        if self._maxcached:
+            count = min(count, self._maxcached)
+        opened = 0
+        while len(self._idle_cache) < count:
+            try: # connect without holding the lock
+                con = self.steady_connection()
+            except Exception:
+                logger.exception("Cannot open an idle connection")
+                break
+            self._condition.acquire()
+            try:
+                if len(self._idle_cache) < count:
+                    self._idle_cache.append(con)
+                    self._stats.warmed += 1
+                    opened += 1
+                    con = None
+                self._condition.notify()
+            finally:
+                self._condition.release()
+            if con is not None:
+                con.close()
+                break
+        return opened
+
+    def stats(self):
+        """Get the usage statistics of the pool as a dictionary.
+
+        Besides the counters of PoolStats, this includes the number
+        of idle connections, the idle_target() and the connections
+        currently held longer than hold_warning seconds as a list of
+        (seconds, thread name) tuples, the longest first.
+
+        """
+        self._condition.acquire()
+        try:
+            stats = self._stats.as_dict(time(), self.hold_warning)
+            stats['idle'] = len(self._idle_cache)
+            stats['idle_target'] = self.idle_target()
+            stats['connections'] = self._connections
+            stats['parked'] = len(self._parked)
+            return stats
+        finally:
+            self._condition.release()
+
     def dedicated_connection(self):
         """Alias for connection(shareable=False)."""
         return self.connection(False)
 
-    def unshare(self, con):
+    def unshare(self, con, proxy=None):
         """Decrease the share of a connection in the shared cache."""
         self._condition.acquire()
         try:
+            if proxy is not None:
+                self._stats.checkin(proxy, time(), self.hold_warning)
             con.unshare()
             shared = con.shared
             if not shared: # connection is idle,
@@ -357,11 +741,21 @@ class PooledDB:
         if not shared: # connection has become idle,
             self.cache(con.con) # so add it to the idle cache
 
-    def cache(self, con):
+    def cache(self, con, proxy=None):
         """Put a dedicated connection back into the idle cache."""
+        if self._affinity and proxy is not None and self._park(con, proxy):
+            return
         self._condition.acquire()
         try:
-            if not self._maxcached or len(self._idle_cache) < self._maxcached:
+            if proxy is not None:
+                self._stats.checkin(proxy, time(), self.hold_warning)
+            if self._idle_window and len(
+                    self._idle_cache) >= self.idle_target():
+                # more idle connections than recently needed
+                con.close()
+                self._stats.trimmed += 1
+            elif (not self._maxcached
+                    or len(self._idle_cache) < self._maxcached):
                 con._reset(force=self._reset) # rollback possible transaction
                 # the idle cache is not full, so put it there
                 self._idle_cache.append(con) # append it to the idle cache
@@ -376,6 +770,7 @@ class PooledDB:
         """Close all connections in the pool."""
         self._condition.acquire()
         try:
+            self._unpark_all()
             while self._idle_cache: # close all idle connections
                 con = self._idle_cache.pop(0)
                 try:
@@ -407,6 +802,8 @@ class PooledDB:
 class PooledDedicatedDBConnection:
     """Auxiliary proxy class for pooled dedicated connections."""
 
+    _leaked = False # set when returned by the garbage collector
+
     def __init__(self, pool, con):
         """Create a pooled dedicated connection.
 
@@ -427,7 +824,7 @@ class PooledDedicatedDBConnection:
         # Instead of actually closing the connection,
         # return it to the pool for future reuse.
         if self._con:
-            self._pool.cache(self._con)
+            self._pool.cache(self._con, self)
             self._con = None
 
     def __getattr__(self, name):
@@ -440,6 +837,8 @@ class PooledDedicatedDBConnection:
     def __del__(self):
         """Delete the pooled connection."""
         try:
+            if self._con: # the connection has not been closed
+                self._leaked = True
             self.close()
         except Exception:
             pass
@@ -494,6 +893,8 @@ class SharedDBConnection:
 class PooledSharedDBConnection:
     """Auxiliary proxy class for pooled shared connections."""
 
+    _leaked = False # set when returned by the garbage collector
+
     def __init__(self, pool, shared_con):
         """Create a pooled shared connection.
 
@@ -516,7 +917,7 @@ class PooledSharedDBConnection:
         # Instead of actually closing the connection,
         # unshare it and/or return it to the pool.
         if self._con:
-            self._pool.unshare(self._shared_con)
+            self._pool.unshare(self._shared_con, self)
             self._shared_con = self._con = None
 
     def __getattr__(self, name):
@@ -529,6 +930,8 @@ class PooledSharedDBConnection:
     def __del__(self):
         """Delete the pooled connection."""
         try:
+            if self._con: # the connection has not been closed
+                self._leaked = True
             self.close()
         except Exception:
             pass
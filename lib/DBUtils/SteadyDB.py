@@ -71,6 +71,19 @@ without further notice.
     ...
     db.close()
 
+Depending on the ping parameter, the connection is checked with ping()
+whenever it is fetched from a pool or a cursor or query is executed.
+Each check is a round trip to the database. You can instead check only
+connections that have been idle for some time:
+
+    db.ping_idle = 30 # skip the check if used within 30 seconds
+
+A connection lost in the meantime is then detected when a query is
+executed. Since it is not known whether a failed statement has been
+performed by the database, only SELECT statements are transparently
+executed again on a new connection in this case; for other statements,
+the connection is reopened and the error is raised.
+
 
 Ideas for improvement:
 
@@ -96,6 +109,7 @@ __date__ = "$Date: 2011-08-14 13:57:11 +0200 (So, 14. Aug 2011) $"
 
 
 import sys
+from time import time
 
 
 class SteadyDBError(Exception):
@@ -139,6 +153,10 @@ class SteadyDBConnection:
 
     version = __version__
 
+    # skip ping checks if the connection was used within this number
+    # of seconds (0 means check according to the ping parameter only)
+    ping_idle = 0
+
     def __init__(self, creator, maxusage=None, setsession=None,
             failures=None, ping=1, closeable=True, *args, **kwargs):
         """Create a "tough" DB-API 2 connection."""
@@ -288,6 +306,7 @@ class SteadyDBConnection:
         self._transaction = False
         self._closed = False
         self._usage = 0
+        self._last_use = time()
 
     def _close(self):
         """Close the tough connection.
@@ -323,8 +342,13 @@ class SteadyDBConnection:
         parameter is set accordingly, the connection will be recreated
         unless the connection is currently inside a transaction.
 
+        If ping_idle is set and the connection has been used within
+        that number of seconds, it is assumed to be alive without ping.
+
         """
         if ping & self._ping:
+            if self.ping_idle and time() - self._last_use < self.ping_idle:
+                return True
             try: # if possible, ping the connection
                 alive = self._con.ping()
             except (AttributeError, IndexError, TypeError, ValueError):
@@ -347,6 +371,8 @@ class SteadyDBConnection:
                     self._close()
                     self._store(con)
                     alive = True
+            if alive:
+                self._last_use = time()
             return alive
 
     def dbapi(self):
@@ -477,6 +503,16 @@ class SteadyDBConnection:
             pass
 
 
+def _is_query(name, args):
+    """Check whether a cursor method call executes a SELECT statement."""
+    if name != 'execute' or not args:
+        return False
+    try:
+        return args[0].lstrip().lstrip('(')[:6].lower() == 'select'
+    except AttributeError:
+        return False
+
+
 class SteadyDBCursor:
     """A "tough" version of DB-API 2 cursors."""
 
@@ -541,6 +577,11 @@ class SteadyDBCursor:
             transaction = con._transaction
             if not transaction:
                 con._ping_check(4)
+            # without a preceding ping, only queries are executed again,
+            # unless the statement is not executed due to the usage limit
+            retry = not transaction and (not con.ping_idle
+                or _is_query(name, args)
+                or (con._maxusage and con._usage >= con._maxusage))
             try:
                 if con._maxusage:
                     if con._usage >= con._maxusage:
@@ -553,7 +594,7 @@ class SteadyDBCursor:
                 if execute:
                     self._clearsizes()
             except con._failures, error: # execution error
-                if not transaction:
+                if retry:
                     try:
                         cursor2 = con._cursor(
                             *self._args, **self._kwargs) # open new cursor
@@ -573,6 +614,7 @@ class SteadyDBCursor:
                             self.close()
                             self._cursor = cursor2
                             con._usage += 1
+                            con._last_use = time()
                             return result
                         try:
                             cursor2.close()
@@ -589,7 +631,7 @@ class SteadyDBCursor:
                     except Exception:
                         pass
                     else:
-                        if transaction:
+                        if not retry:
                             self.close()
                             con._close()
                             con._store(con2)
@@ -631,6 +673,7 @@ class SteadyDBCursor:
                 raise error # reraise the original error again
             else:
                 con._usage += 1
+                con._last_use = time()
                 return result
         return tough_method
 
@@ -0,0 +1,77 @@
+"""Contention benchmark for PooledDB.
+
+Many threads repeatedly get a connection from the pool, run a query
+and return the connection, once with the shared pool only and once
+with thread affinity (see PooledDB.use_thread_affinity()).
+The mock DB-API 2 module of TestSteadyDB is used, so that the time
+is spent in the pool rather than in the database.
+
+Usage: python BenchPooledDB.py [threads [checkouts [maxconnections]]]
+
+"""
+
+import sys
+from threading import Thread
+from time import time
+
+sys.path.insert(1, '../..')
+from DBUtils.Tests import TestSteadyDB as dbapi
+from DBUtils.PooledDB import PooledDB
+
+
+def count_acquires(pool):
+    """Count how often the lock of the pool is acquired."""
+    counter = [0]
+    acquire = pool._condition.acquire
+    def counting_acquire(*args):
+        counter[0] += 1
+        return acquire(*args)
+    pool._condition.acquire = counting_acquire
+    return counter
+
+
+def run(affinity, threads, checkouts, maxconnections):
+    pool = PooledDB(dbapi, 0, 0, 0, maxconnections, True)
+    if affinity:
+        pool.use_thread_affinity()
+    acquires = count_acquires(pool)
+    def work():
+        for i in xrange(checkouts):
+            db = pool.connection()
+            cursor = db.cursor()
+            cursor.execute('select test')
+            cursor.fetchone()
+            cursor.close()
+            db.close()
+    workers = [Thread(target=work) for i in range(threads)]
+    start = time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time() - start
+    stats = pool.stats()
+    pool.close()
+    return duration, acquires[0], stats
+
+
+def main():
+    threads = len(sys.argv) > 1 and int(sys.argv[1]) or 32
+    checkouts = len(sys.argv) > 2 and int(sys.argv[2]) or 2000
+    maxconnections = len(sys.argv) > 3 and int(sys.argv[3]) or 0
+    total = threads * checkouts
+    print "%d threads, %d checkouts each, maxconnections %d" % (
+        threads, checkouts, maxconnections)
+    print "%-16s %8s %12s %13s %8s %8s %10s" % ('mode', 'seconds',
+        'checkouts/s', 'lock/checkout', 'opened', 'affine', 'wait max')
+    for affinity in (False, True):
+        duration, acquires, stats = run(
+            affinity, threads, checkouts, maxconnections)
+        print "%-16s %8.2f %12.0f %13.2f %8d %8d %8.1fms" % (
+            affinity and 'thread affinity' or 'shared lock', duration,
+            total / duration, float(acquires) / total, stats['opened'],
+            stats['affine'], stats['wait']['max'] * 1000)
+
+
+if __name__ == '__main__':
+    main()
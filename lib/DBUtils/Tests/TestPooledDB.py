@@ -1170,6 +1170,253 @@ class TestPooledDB(unittest.TestCase):
         self.assert_(not con._transaction)
         self.assertEqual(con._con.session, ['rollback'])
 
+    def test22_Stats(self):
+        for threadsafety in (1, 2):
+            dbapi.threadsafety = threadsafety
+            pool = PooledDB(dbapi, 1, 0, 2)
+            stats = pool.stats()
+            self.assertEqual(stats['warmed'], 1)
+            self.assertEqual(stats['checkouts'], 0)
+            self.assertEqual(stats['idle'], 1)
+            db1 = pool.connection()
+            db2 = pool.connection()
+            stats = pool.stats()
+            self.assertEqual(stats['checkouts'], 2)
+            self.assertEqual(stats['reused'], 1)
+            self.assertEqual(stats['opened'], 1)
+            self.assertEqual(stats['in_use'], 2)
+            self.assertEqual(stats['peak'], 2)
+            self.assertEqual(sum([n for b, n in stats['wait']['histogram']]), 2)
+            self.assertEqual(stats['held'], [])
+            db1.close()
+            db2.close()
+            stats = pool.stats()
+            self.assertEqual(stats['in_use'], 0)
+            self.assertEqual(stats['peak'], 2)
+            self.assertEqual(sum([n for b, n in stats['hold']['histogram']]), 2)
+            self.assertEqual(stats['leaked'], 0)
+
+    def test23_HeldAndLeaked(self):
+        pool = PooledDB(dbapi, 0, 0, 0)
+        pool.hold_warning = 0.01
+        db1 = pool.connection()
+        db2 = pool.connection()
+        from time import sleep
+        sleep(0.02)
+        stats = pool.stats()
+        self.assertEqual(len(stats['held']), 2)
+        self.assert_(stats['held'][0][0] >= 0.01)
+        db1.close()
+        stats = pool.stats()
+        self.assertEqual(stats['long_held'], 1)
+        self.assertEqual(len(stats['held']), 1)
+        del db2
+        stats = pool.stats()
+        self.assertEqual(stats['leaked'], 1)
+        self.assertEqual(stats['long_held'], 1)
+        self.assertEqual(stats['held'], [])
+        self.assertEqual(stats['idle'], 2)
+
+    def test24_Warmup(self):
+        pool = PooledDB(dbapi, 0, 3, 0)
+        self.assertEqual(len(pool._idle_cache), 0)
+        self.assertEqual(pool.warmup(2), 2)
+        self.assertEqual(len(pool._idle_cache), 2)
+        self.assertEqual(pool.warmup(5), 1)
+        self.assertEqual(len(pool._idle_cache), 3)
+        self.assertEqual(pool.warmup(), 0)
+        self.assertEqual(pool.stats()['warmed'], 3)
+        db = pool.connection()
+        self.assertEqual(pool.stats()['opened'], 0)
+        db.close()
+        pool = PooledDB(dbapi, 0, 0, 0, 0, False, None, None, True, None, 1,
+            'error')
+        self.assertEqual(pool.warmup(2), 0)
+        self.assertEqual(len(pool._idle_cache), 0)
+
+    def test25_AdaptIdle(self):
+        pool = PooledDB(dbapi, 1, 0, 0)
+        self.assertEqual(pool.idle_target(), 1)
+        pool.adapt_idle(60, 1)
+        self.assertEqual(pool.idle_target(), 1)
+        dbs = [pool.connection() for i in range(4)]
+        self.assertEqual(pool.idle_target(), 5)
+        for db in dbs:
+            db.close()
+        self.assertEqual(len(pool._idle_cache), 4)
+        self.assertEqual(pool.stats()['trimmed'], 0)
+        # the peak has moved out of the window
+        for peak in pool._peaks:
+            peak[0] -= 120
+        self.assertEqual(pool.idle_target(), 1)
+        dbs = [pool.connection() for i in range(2)]
+        self.assertEqual(pool.idle_target(), 3)
+        for db in dbs:
+            db.close()
+        self.assertEqual(len(pool._idle_cache), 3)
+        self.assertEqual(pool.stats()['trimmed'], 1)
+        pool = PooledDB(dbapi, 0, 2, 0)
+        pool.adapt_idle(60, 5)
+        self.assertEqual(pool.idle_target(), 2)
+        pool.adapt_idle(0)
+        self.assertEqual(pool.idle_target(), 0)
+
+    def test26_ThreadAffinity(self):
+        from threading import Thread
+        pool = PooledDB(dbapi, 0, 0, 0)
+        pool.use_thread_affinity()
+        db = pool.connection()
+        con = db._con
+        db.close()
+        self.assertEqual(len(pool._idle_cache), 0)
+        self.assertEqual(len(pool._parked), 1)
+        self.assertEqual(pool._connections, 1)
+        db = pool.connection()
+        self.assert_(db._con is con)
+        self.assertEqual(pool.stats()['affine'], 1)
+        self.assertEqual(con._con.session, ['rollback'])
+        db.begin()
+        db.close()
+        self.assertEqual(con._con.session, ['rollback'] * 2)
+        self.assert_(not con._transaction)
+        cons = []
+        def get_connection():
+            db = pool.connection()
+            cons.append(db._con)
+            db.close()
+        thread = Thread(target=get_connection)
+        thread.start()
+        thread.join()
+        # the connection of the main thread is not taken over
+        self.assert_(cons[0] is not con)
+        self.assertEqual(pool._connections, 2)
+        self.assertEqual(pool.stats()['parked'], 2)
+        # the connection parked by the thread that has ended is reused
+        db1 = pool.connection()
+        db2 = pool.connection()
+        self.assert_(db1._con is con)
+        self.assert_(db2._con is cons[0])
+        self.assertEqual(pool.stats()['opened'], 2)
+        self.assertEqual(pool.stats()['reclaimed'], 1)
+        db2.close()
+        db1.close()
+        self.assertEqual(len(pool._parked), 1)
+        self.assertEqual(len(pool._idle_cache), 1)
+        pool.use_thread_affinity(False)
+        self.assertEqual(len(pool._parked), 0)
+        self.assertEqual(len(pool._idle_cache), 2)
+        self.assertEqual(pool._connections, 0)
+        db = pool.connection()
+        db.close()
+        self.assertEqual(len(pool._parked), 0)
+
+    def test27_ThreadAffinityMaxConnections(self):
+        from threading import Thread, Event
+        pool = PooledDB(dbapi, 0, 0, 0, 1)
+        pool.use_thread_affinity()
+        db = pool.connection()
+        con = db._con
+        db.close()
+        self.assertEqual(pool._connections, 1)
+        cons = []
+        def get_connection():
+            db = pool.connection()
+            cons.append(db._con)
+            db.close()
+        thread = Thread(target=get_connection)
+        thread.start()
+        thread.join()
+        # the parked connection is taken over instead of raising an error
+        self.assertEqual(cons, [con])
+        self.assertEqual(pool._connections, 1)
+        pool = PooledDB(dbapi, 0, 0, 0, 1, True)
+        pool.use_thread_affinity()
+        db = pool.connection()
+        waiting = Event()
+        got = Event()
+        def wait_for_connection():
+            waiting.set()
+            db = pool.connection()
+            got.set()
+            db.close()
+        thread = Thread(target=wait_for_connection)
+        thread.start()
+        waiting.wait(1)
+        for i in range(100):
+            if pool._waiting:
+                break
+            got.wait(0.01)
+        self.assertEqual(pool._waiting, 1)
+        # the connection is not parked while a thread is waiting
+        db.close()
+        got.wait(1)
+        self.assert_(got.isSet())
+        thread.join()
+        self.assertEqual(pool._connections, 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test29_ParkWhileWaiting(self):
+        from threading import Thread, Event
+        pool = PooledDB(dbapi, 0, 0, 0, 1, True)
+        pool.use_thread_affinity()
+        close = Event()
+        closed = Event()
+        def hold_connection():
+            db = pool.connection()
+            close.wait(2)
+            db.close()
+            closed.set()
+        holder = Thread(target=hold_connection)
+        holder.setDaemon(True)
+        holder.start()
+        for i in range(100):
+            if pool._connections:
+                break
+            closed.wait(0.01)
+        reclaim = pool._reclaim
+        def reclaim_then_close(ended=False):
+            # the holder returns its connection right after the waiter
+            # found no parked connection, but before it starts waiting
+            con = reclaim(ended)
+            if not close.isSet():
+                close.set()
+                closed.wait(0.2)
+            return con
+        pool._reclaim = reclaim_then_close
+        got = []
+        def wait_for_connection():
+            db = pool.connection()
+            got.append(db._con)
+            db.close()
+        waiter = Thread(target=wait_for_connection)
+        waiter.setDaemon(True) # do not hang the tests if it never wakes up
+        waiter.start()
+        waiter.join(2)
+        holder.join(2)
+        self.assert_(not waiter.isAlive())
+        self.assertEqual(len(got), 1)
+        self.assertEqual(pool._waiting, 0)
+        self.assertEqual(pool._connections, 1)
+
+    def test28_PingIdle(self):
+        Connection = dbapi.Connection
+        Connection.has_ping = True
+        Connection.num_pings = 0
+        pool = PooledDB(dbapi, 0, 0, 0)
+        pool.ping_idle = 30
+        db = pool.connection()
+        self.assertEqual(db._con.ping_idle, 30)
+        db.close()
+        db = pool.connection()
+        self.assertEqual(Connection.num_pings, 0)
+        db._con._last_use -= 60
+        db.close()
+        db = pool.connection()
+        self.assertEqual(Connection.num_pings, 1)
+        db.close()
+        Connection.has_ping = False
+        Connection.num_pings = 0
+
 
 class TestSharedDBConnection(unittest.TestCase):
 
@@ -703,6 +703,53 @@ class TestSteadyDB(unittest.TestCase):
         db.close()
         self.assertEqual(db._con.session, ['rollback'])
 
+    def test17_PingIdle(self):
+        Connection.has_ping = True
+        Connection.num_pings = 0
+        db = SteadyDBconnect(dbapi, ping=7)
+        self.assertEqual(db.ping_idle, 0)
+        db.ping_idle = 60
+        cursor = db.cursor()
+        cursor.execute('select test')
+        self.assertEqual(Connection.num_pings, 0)
+        self.assert_(db._ping_check())
+        self.assertEqual(Connection.num_pings, 0)
+        db._last_use -= 120
+        cursor.execute('select test')
+        self.assertEqual(Connection.num_pings, 1)
+        cursor.execute('select test')
+        self.assertEqual(Connection.num_pings, 1)
+        # a lost connection is detected when executing a query
+        con = db._con
+        con.valid = False
+        cursor.execute('select test')
+        self.assertEqual(cursor.fetchone(), 'test')
+        self.assert_(db._con is not con)
+        self.assertEqual(Connection.num_pings, 1)
+        # other statements are not executed again
+        con = db._con
+        con.valid = False
+        self.assertRaises(InternalError, cursor.execute, 'set doit')
+        self.assert_(db._con is not con)
+        self.assertEqual(db._con.session, [])
+        cursor.execute('set doit')
+        self.assertEqual(db._con.session, ['doit'])
+        # statements exceeding the usage limit are executed again
+        db2 = SteadyDBconnect(dbapi, 2)
+        db2.ping_idle = 60
+        cursor2 = db2.cursor()
+        for i in range(3):
+            cursor2.execute('set doit')
+        self.assertEqual(db2._con.session, ['doit'])
+        self.assertEqual(db2._usage, 1)
+        # without ping_idle, all statements are executed again
+        db.ping_idle = 0
+        db._con.valid = False
+        cursor.execute('set doit')
+        self.assertEqual(db._con.session, ['doit'])
+        Connection.has_ping = False
+        Connection.num_pings = 0
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -362,6 +362,8 @@ class ModelAdmin(object):
         if request.method == 'POST':
             raw_fields = request.forms.getall('fields')
             export = Export(query, related, raw_fields)
+            if request.params.get('bg'):
+                return self.export_job(export)
             return export.json_response('export-%s.json' % self.get_admin_name())
 
         return render_template(self.templates['export'],
@@ -376,6 +378,21 @@ class ModelAdmin(object):
             **self.get_extra_context()
         )
 
+    def export_job(self, export):
+        # run the export on the background worker pool, the page polls
+        # /export/job/<id>/ and downloads the file from /tmpfile/
+        from mosys.export_jobs import job_manager, current_user, save_chunks, ExportJobError
+        filename = 'export-%s.json' % self.get_admin_name()
+
+        def run(job):
+            return save_chunks(filename, export.generate(job))
+
+        try:
+            job = job_manager.submit(current_user(), filename, run)
+        except ExportJobError, e:
+            return json.dumps({'statusCode': '300', 'message': e.args[0]})
+        return json.dumps({'statusCode': '200', 'jobId': job.id})
+
     def ajax_list(self):
         field = request.params.get('field')
         prev_page = 0
@@ -696,7 +713,8 @@ class Export(object):
         clone._select = select
         return clone
 
-    def json_response(self, filename='export.json'):
+    def generate(self, progress=None):
+        # progress, if given, gets ``total`` and a running ``done`` count
         serializer = Serializer()
         prepared_query = self.prepare_query()
         field_dict = {}
@@ -704,18 +722,23 @@ class Export(object):
             field_dict.setdefault(field.model_class, [])
             field_dict[field.model_class].append(field.name)
 
-        def generate():
-            i = prepared_query.count()
-            yield '[\n'
-            for obj in prepared_query:
-                i -= 1
-                yield json.dumps(serializer.serialize_object(obj, field_dict))
-                if i > 0:
-                    yield ',\n'
-            yield '\n]'
+        i = prepared_query.count()
+        if progress is not None:
+            progress.total = i
+        yield '[\n'
+        for obj in prepared_query:
+            i -= 1
+            yield json.dumps(serializer.serialize_object(obj, field_dict))
+            if i > 0:
+                yield ',\n'
+            if progress is not None:
+                progress.done += 1
+        yield '\n]'
+
+    def json_response(self, filename='export.json'):
 #        headers = Headers()
         Response.headers['Content-Type'] = 'application/javascript'
         Response.headers['Content-Disposition'] = 'attachment; filename=%s' % filename
         Response.headers['mimetype'] = 'text/javascript'
-        return generate()
+        return self.generate()
 #        return Response(generate(), mimetype='text/javascript', headers=headers, direct_passthrough=True)
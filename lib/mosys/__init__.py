@@ -38,6 +38,9 @@ def media(file):
 
 
 ####################### 全局初始化 #######################
+#sql 执行统计(按请求累计, 慢查询和重复查询日志)
+from sql_trace import install
+install()
 #加载全局模型对象
 from load import ModelScan
 ModelScan()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+内存Grid(CalculateItems)的列式存储
+按列保存数据, 支持排序(缓存 argsort 结果)、子串和相等过滤、按页取数;
+重复的字符串只保留一份, 安装了 numpy 时数值列使用 numpy 数组
+'''
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _text(v):
+    '''
+    查询比较用的小写 unicode 文本
+    '''
+    if v is None:
+        return u''
+    if isinstance(v, str):
+        v = v.decode('utf-8', 'replace')
+    elif not isinstance(v, unicode):
+        v = unicode(v)
+    return v.lower()
+
+def _is_number(v):
+    return type(v) in (int, long, float)
+
+def _tolist(col):
+    if numpy is not None and isinstance(col, numpy.ndarray):
+        return col.tolist()
+    return col
+
+def _pack(col):
+    '''
+    全部为数值的列转为 numpy 数组, 其它列共用相同的字符串对象
+    '''
+    if numpy is not None and col and all([_is_number(v) for v in col]):
+        return numpy.array(col)
+    pool = {}
+    ret = []
+    for v in col:
+        if isinstance(v, basestring):
+            v = pool.setdefault(v, v)
+        ret.append(v)
+    return ret
+
+class ColumnStore(object):
+    '''
+    列式存储, 创建后不再修改, 可在多个请求间共享
+    查询方法返回行号列表, 行号列表可作为下一次查询的 index 参数继续过滤
+    '''
+    def __init__(self, fields, columns, size):
+        self.fields = list(fields)
+        self.columns = columns
+        self.size = size
+        self._sorts = {}
+        self._texts = {}
+
+    @classmethod
+    def from_items(cls, fields, items):
+        '''
+        由字典列表创建, 缺少的字段取 ''
+        '''
+        columns = {}
+        for f in fields:
+            columns[f] = _pack([e.get(f, '') for e in items])
+        return cls(fields, columns, len(items))
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.take())
+
+    def __add__(self, other):
+        '''
+        追加数据(字典列表或 ColumnStore), 返回新的 ColumnStore
+        '''
+        if not isinstance(other, ColumnStore):
+            other = ColumnStore.from_items(self.fields, other)
+        columns = {}
+        for f in self.fields:
+            a, b = self.columns[f], other.columns[f]
+            if numpy is not None and isinstance(a, numpy.ndarray) and isinstance(b, numpy.ndarray):
+                columns[f] = numpy.concatenate((a, b))
+            else:
+                columns[f] = _pack(_tolist(a) + _tolist(b))
+        return ColumnStore(self.fields, columns, self.size + other.size)
+
+    def _all(self, index):
+        if index is None:
+            return xrange(self.size)
+        return index
+
+    def _slice(self, index, begin, end):
+        if index is None:
+            if end is None or end > self.size:
+                end = self.size
+            return range(begin, max(begin, end))
+        return list(index[begin:end])
+
+    def _text_column(self, field):
+        col = self._texts.get(field)
+        if col is None:
+            col = [_text(v) for v in _tolist(self.columns[field])]
+            self._texts[field] = col
+        return col
+
+    def argsort(self, field, desc=False, index=None):
+        '''
+        按 field 排序后的行号, 整列的排序结果会被缓存
+        @param    index    只返回这些行的顺序(过滤后的结果)
+        '''
+        order = self._sorts.get((field, desc))
+        if order is None:
+            col = self.columns[field]
+            if numpy is not None and isinstance(col, numpy.ndarray):
+                order = numpy.argsort(col, kind='mergesort').tolist()
+            else:
+                order = sorted(xrange(self.size), key=col.__getitem__)
+            if desc:
+                order.reverse()
+            self._sorts[(field, desc)] = order
+        if index is None:
+            return order
+        m_set = set(index)
+        return [i for i in order if i in m_set]
+
+    def match(self, field, text, index=None):
+        '''
+        field 中包含 text(不区分大小写) 的行号
+        '''
+        col = self._text_column(field)
+        text = _text(text)
+        return [i for i in self._all(index) if text in col[i]]
+
+    def equal(self, field, value, index=None):
+        '''
+        field 等于 value 的行号, 字符串不区分大小写
+        '''
+        if isinstance(value, basestring):
+            col = self._text_column(field)
+            value = _text(value)
+        else:
+            col = self.columns[field]
+        return [i for i in self._all(index) if col[i]==value]
+
+    def take(self, index=None, begin=0, end=None, fields=None):
+        '''
+        取 index 中 [begin, end) 范围的行, 返回字典列表
+        '''
+        fields = fields or self.fields
+        rows = self._slice(index, begin, end)
+        m_cols = [self._take_column(f, rows) for f in fields]
+        return [dict(zip(fields, r)) for r in zip(*m_cols)] if rows else []
+
+    def rows(self, index=None, fields=None, chunk=500):
+        '''
+        逐行返回值列表(导出使用), 每次转换 chunk 行
+        '''
+        fields = fields or self.fields
+        for begin in xrange(0, len(self._all(index)), chunk):
+            rows = self._slice(index, begin, begin+chunk)
+            for r in zip(*[self._take_column(f, rows) for f in fields]):
+                yield list(r)
+
+    def _take_column(self, field, rows):
+        col = self.columns[field]
+        if numpy is not None and isinstance(col, numpy.ndarray):
+            return col[rows].tolist()
+        return [col[i] for i in rows]
@@ -1,4 +1,5 @@
 # coding=utf-8
+import logging
 
 class AppPage(object):
     verbose_name=None
@@ -13,6 +14,20 @@ class AppPage(object):
     def __init__(self, request=None):
         pass
     
+    @classmethod
+    def Compile(cls):
+        '''
+        ModelScan 时调用, 预先生成每个类不变的元数据
+        '''
+        pass
+    
+    @classmethod
+    def Create(cls, request=None):
+        '''
+        视图中创建页面实例
+        '''
+        return cls(request)
+    
 from forms.encoding import smart_str #^^^^^^^^^^^^^^^^^^^
 from mole_api  import json_dumps#^^^^^^^^^^^^^^     
 
@@ -31,9 +46,69 @@ class GridModel(AppPage):
 #    buttons = []#[{},{}]
     grid = None
     _paged = False
+    export_cache_ttl = 0    # 导出结果的缓存时间(秒), 0 表示不缓存; 缓存还需要 data_source 或 data_tables 提供数据版本
+    data_tables = ()        # 数据来自的表, 经 p_execute 等写入这些表时导出缓存失效(见 sql_cache.QueryCache.data_version)
+    data_source = None  # 内存Grid的数据源缓存(data_source.DataSource), 由各实例共享
+    compact_json = False    # 使用紧凑的列式json传输数据(见 GridBase.CompactResultDic), 页面需加载 m.gridutils.js 还原
+    query_timeout = 60      # 查询超时秒数, 超时后取消查询并提示, None 表示不限制
+    count_mode = 'exact'    # 记录数: exact 精确计数, estimate 按执行计划估算, none 不计数(只判断有无下一页)
+    compile_meta = False    # True 时 ModelScan 执行一次 __init__(request 为 None) 作为原型, 请求时复制原型;
+                            # 只用于 __init__ 不访问 request 和数据库的Grid
+    
+    @classmethod
+    def DataVersion(cls, request):
+        '''
+        导出缓存使用的数据版本, 返回 None 表示不缓存
+        有 data_source 时使用数据源的版本, 否则使用 data_tables 的写入次数;
+        其它途径的写入不改变版本, 缓存文件最多使用 export_cache_ttl 秒
+        '''
+        if not cls.export_cache_ttl:
+            return None
+        if cls.data_source is not None:
+            return cls.data_source.version()
+        if cls.data_tables:
+            from sql_cache import query_cache
+            return query_cache.data_version(cls.data_tables)
+        return None
+    
+    @classmethod
+    def Compile(cls):
+        '''
+        执行一次 __init__ 得到原型(字段定义、列宽、sql模板等), 并预先生成 grid_option json
+        '''
+        if not cls.compile_meta:
+            return
+        try:
+            proto = cls(None)
+            proto._grid_option = proto._GridOption()
+            cls._proto = proto
+        except Exception:
+            ''' 编译失败时每次请求执行 __init__, 不影响其他模型和启动 '''
+            logging.getLogger('mosys').exception(u'编译 %s.%s 失败', cls.__module__, cls.__name__)
+    
+    @classmethod
+    def Create(cls, request=None):
+        '''
+        复制编译好的原型, 只读的元数据共享, Grid的查询状态每个实例一份
+        '''
+        proto = cls.__dict__.get('_proto')
+        if proto is None:
+            return cls(request)
+        obj = cls.__new__(cls)
+        obj.__dict__.update(proto.__dict__)
+        obj.grid = proto.grid.Clone()
+        obj.hide_list = list(proto.hide_list)
+        return obj
+    
+    _grid_option = None
+    
     def __init__(self, request=None):
         from grid_utils import GridBase
         self.grid = GridBase(self.head,self._GetPageSize())
+        self.grid.query_timeout = self.query_timeout
+        self.grid.count_mode = self.count_mode
+        if self.option.has_key("sortname"):
+            self.grid.default_sort = (self.option["sortname"], self.option.get("sortorder", "asc"))
         self.request = None
         
     def GetHeads(self):
@@ -58,9 +133,12 @@ class GridModel(AppPage):
         for m in  search_fields:
             data = request.params.get(m, '')
             if data:
-                self.grid.sql += " and %s like '%%%%%s%%%%'"%(m,data)
+                if self.grid.CalculateItems!=None:
+                    self.grid.SearchItems(m, data)
+                else:
+                    self.grid.AddFilter("%s like ?"%m, '%%%s%%'%data)
     
-    def context(self):
+    def _GridOption(self):
         m_HeadDic = self.grid.HeadDic()
         m_init_option = {
             "url":"/grid/%s/%s/"%(self.app_menu,self.__class__.__name__),
@@ -78,9 +156,16 @@ class GridModel(AppPage):
             'outof': '页 / 共',
             'findtext': '查找'
               }
+        if self.compact_json:
+            m_init_option["url"] += "?compact=1"
+        ''' 未加载 m.gridutils.js 的页面 window.grid_preprocess 为 undefined, flexigrid 不做预处理 '''
+        m_init_option["preProcess"] = '$window.grid_preprocess$'
         m_init_option.update(self.option)
         m_HeadDic.update(m_init_option)
-        addition = {"grid_option":smart_str(json_dumps(m_HeadDic)).replace('"$','').replace('$"','')}
+        return smart_str(json_dumps(m_HeadDic)).replace('"$','').replace('$"','')
+    
+    def context(self):
+        addition = {"grid_option":self._grid_option or self._GridOption()}
         addition["hide_list"] = self.hide_list
         if self.search_form:
             ''' 查询表单的处理 '''
@@ -105,4 +190,5 @@ class GridModel(AppPage):
 
     def SetHide(self,filed):
         self.grid.fields[filed]["hide"] = True
-        self.hide_list.append(self.grid.GetFieldNames().index(filed))
+        ''' 不修改类属性 hide_list '''
+        self.hide_list = self.hide_list + [self.grid.GetFieldNames().index(filed)]
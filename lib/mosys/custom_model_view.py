@@ -3,94 +3,280 @@ from mole_api import JTemplate, HTTPError
 
    
 def GridModelView(request, app_label, model_name):
-    from load import APP_PAGES
+    from load import get_app_page
     from custom_model import GridModel
     request.user = None
     key = '%s.%s'%(app_label, model_name)
     m_post = request.params
-    for e in APP_PAGES:
-        if e[0]==key:
-            if issubclass(e[1], GridModel):
-                try:
-                    offset = int(m_post.get('page', 1))
-                except:
-                    offset=1
-                try:
-                    psize = int(m_post.get('rp', 15))
-                except:
-                    psize=15
-                arg = {'offset':offset,'psize':psize}
-                sortname = m_post.get('sortname', 'undefined')
-                sortorder = m_post.get('sortorder', 'undefined')
-                if sortname!='undefined':
-                    arg['sortname'] = sortname
-                    arg['sortorder'] = (sortorder=='undefined') and 'asc' or sortorder
-                query = m_post.get('query', '')
-                qtype = m_post.get('qtype', '')
-                if query!='':
-                    arg['query'] = query
-                    arg['qtype'] = qtype
-                grid_model = e[1](request)
-    #            grid_model.grid.ParseArg(**arg)
-                if "export" in m_post:
-                    return GridExport(request,grid_model,**arg)
-                else:
-                    return GridView(request,grid_model,**arg)
+    model_class = get_app_page(key)
+    if model_class is not None and issubclass(model_class, GridModel):
+        arg = _GridArg(m_post)
+        if "export" in m_post and "bg" in m_post:
+            return GridExportJob(request,model_class,**arg)
+        grid_model = model_class.Create(request)
+#        grid_model.grid.ParseArg(**arg)
+        if "export" in m_post:
+            return GridExport(request,grid_model,**arg)
+        else:
+            return GridView(request,grid_model,**arg)
     return HTTPError(404, "File does not exist.")
     
+def _GridArg(m_post):
+    '''
+    分页、排序和查询参数
+    '''
+    try:
+        offset = int(m_post.get('page', 1))
+    except:
+        offset=1
+    try:
+        psize = int(m_post.get('rp', 15))
+    except:
+        psize=15
+    arg = {'offset':offset,'psize':psize}
+    sortname = m_post.get('sortname', 'undefined')
+    sortorder = m_post.get('sortorder', 'undefined')
+    if sortname!='undefined':
+        arg['sortname'] = sortname
+        arg['sortorder'] = (sortorder=='undefined') and 'asc' or sortorder
+    query = m_post.get('query', '')
+    qtype = m_post.get('qtype', '')
+    if query!='':
+        arg['query'] = query
+        arg['qtype'] = qtype
+    if m_post.get('compact')=='1':
+        arg['compact'] = True
+    return arg
 
 from forms.encoding import smart_str #^^^^^^^^^^^^^^^^^^^
 from mole_api  import json_dumps#^^^^^^^^^^^^^^     
          
 def GridView(request,grid_model,**arg):
-    m_grid = grid_model.grid
+    from sql_timeout import QueryTimeout
+    from http_response import ajax_fail
+    grid_model.grid.query_id = _QueryKey(request.params.get('qid',''))
+    try:
+        _PrepareGrid(request,grid_model,**arg)
+        if not grid_model._paged:
+            _RunPrefetch([(grid_model.grid,sql) for sql in grid_model.grid.PrefetchSql(arg['offset'])])
+        ret = _GridResult(grid_model,**arg)
+    except QueryTimeout, e:
+        return ajax_fail(e.args[0])
+    return smart_str(json_dumps(ret))
+
+def _PrepareGrid(request,grid_model,**arg):
+    '''
+    生成Grid的sql或内存数据, 处理查询和排序参数
+    '''
     grid_model.SetPageSize(arg['psize'])
     grid_model.MakeData(request,**arg)
     grid_model.grid.ParseArg(**arg)
+
+def _GridResult(grid_model,**arg):
+    '''
+    分页并返回当前页的数据
+    '''
+    m_grid = grid_model.grid
     if not grid_model._paged:
         grid_model.Paging(arg['offset'])
-    ret = m_grid.ResultDic()
-    return smart_str(json_dumps(ret))
+    if arg.get('compact'):
+        return m_grid.CompactResultDic()
+    return m_grid.ResultDic()
+
+MAX_BATCH_GRIDS = 10    # 批量请求中的Grid数上限
+
+def _RunPrefetch(tasks):
+    '''
+    并发执行各Grid互不依赖的查询(计数和当前页, 见 sql_parallel), 结果填入各Grid
+    tasks: [(grid, sql)], 少于两个查询时不预先执行
+    '''
+    if len(tasks) < 2:
+        return
+    from sql_parallel import run_all
+    from sql_utils import replicas
+    funcs = [lambda m_grid=m_grid,sql=sql: m_grid._ExecSql(sql) for m_grid,sql in tasks]
+    for (m_grid,sql),result in zip(tasks,run_all(funcs,replicas.use_primary())):
+        m_grid.SetPrefetched(sql,result)
+
+def GridBatchView(request):
+    '''
+    一次请求返回多个Grid的当前页
+    specs: json 列表 [{"app":"att","model":"SumAttReport","params":{"page":1,"rp":15,...}}, ...]
+    返回 {"statusCode":"200","grids":[...]}, 每项与单独请求 /grid/app/model/ 的结果相同,
+    出错的Grid为 {"statusCode":"300","message":...}, 不影响其它Grid
+    各Grid的计数和当前页查询互不依赖, 并发执行(见 sql_parallel), 每个查询从连接池取自己的连接
+    '''
+    import json
+    from load import get_app_page
+    from custom_model import GridModel
+    from export_jobs import RequestSnapshot
+    from http_response import ajax_fail
+    request.user = None
+    try:
+        specs = json.loads(request.params.get('specs') or '[]')
+        if not isinstance(specs, list):
+            raise ValueError
+    except ValueError:
+        return ajax_fail(u'specs 参数格式错误')
+    if len(specs) > MAX_BATCH_GRIDS:
+        return ajax_fail(u'一次最多请求%d个Grid'%MAX_BATCH_GRIDS)
+    m_qid = _QueryKey(request.params.get('qid',''))
+    m_grids = []
+    tasks = []
+    for spec in specs:
+        try:
+            key = '%s.%s'%(spec.get('app'), spec.get('model'))
+            model_class = get_app_page(key)
+            if model_class is None or not issubclass(model_class, GridModel):
+                raise LookupError(key)
+            m_request = RequestSnapshot.from_params(spec.get('params') or {})
+            arg = _GridArg(m_request.params)
+            grid_model = model_class.Create(m_request)
+            grid_model.grid.query_id = m_qid
+            _PrepareGrid(m_request,grid_model,**arg)
+            if not grid_model._paged:
+                m_grid = grid_model.grid
+                tasks.extend([(m_grid,sql) for sql in m_grid.PrefetchSql(arg['offset'])])
+            m_grids.append((grid_model,arg,None))
+        except Exception, e:
+            m_grids.append((None,None,e))
+    _RunPrefetch(tasks)
+    ret = []
+    for grid_model,arg,error in m_grids:
+        if error is None:
+            try:
+                ret.append(_GridResult(grid_model,**arg))
+                continue
+            except Exception, e:
+                error = e
+        ret.append(_BatchError(error))
+    return smart_str(json_dumps({"statusCode":"200","grids":ret}))
+
+def _BatchError(e):
+    from sql_timeout import QueryTimeout
+    if isinstance(e, QueryTimeout):
+        message = e.args[0]
+    elif isinstance(e, LookupError):
+        message = u'Grid不存在: %s'%e.args[0]
+    else:
+        import traceback
+        traceback.print_exc()
+        message = u'查询出错'
+    return {"statusCode":"300","message":message}
+
+def _QueryKey(qid):
+    '''
+    客户端查询编号加上用户名, 只能取消自己的查询
+    '''
+    if not qid:
+        return None
+    from export_jobs import current_user
+    return u"%s:%s"%(current_user(),qid)
+
+def GridCancelView(request, qid):
+    '''
+    取消执行中的grid查询(客户端离开页面时调用)
+    '''
+    from sql_timeout import cancel_query
+    count = cancel_query(_QueryKey(qid))
+    return smart_str(json_dumps({"statusCode":"200","cancelled":count}))
 
 def GridExport(request,grid_model,**arg):
     m_grid = grid_model.grid
 
-    hide_index = request.GET.get('hide',None)
-    if hide_index:
-        m_hide_index = [int(e) for e  in hide_index.split(',')]
-    else:
-        m_hide_index = []
+    m_hide_index = _GetHideIndex(request)
+    cache_name = _ExportCacheName(request,grid_model.__class__,m_hide_index)
+    if cache_name:
+        from export_cache import cached_file
+        from mole import redirect
+        if cached_file(cache_name,max_age=grid_model.export_cache_ttl):
+            redirect(("/tmpfile/"+cache_name).encode("utf-8"))
     grid_model.SetPageSize(0)
     grid_model.MakeData(request,**arg)
     grid_model.grid.ParseArg(**arg)
-    if not grid_model._paged:
-        grid_model.Paging(1)
-    ret = m_grid._GetData(m_hide_index)
-    head = {}
-    field = []
-    i = 0
-    for e in m_grid.dic:
-        if i in m_hide_index:
-            pass
-        else:
-            head[e[0]] = e[1]
-            field.append(e[0])
-        i +=1
-    ret.insert(0, head)
-    ret.insert(0, field)
+    fields,head = m_grid.GetExportHead(m_hide_index)
     from grid_export import ExportGrid
-    return ExportGrid(request,ret)
+    return ExportGrid(request,fields,head,m_grid.IterData(m_hide_index),cache_name)
+    
+def _GetHideIndex(request):
+    hide_index = request.GET.get('hide',None)
+    if hide_index:
+        return [int(e) for e  in hide_index.split(',') if e]
+    return []
+
+def _ExportCacheName(request,model_class,hide_index):
+    '''
+    导出缓存文件名, Grid不缓存时返回 None
+    '''
+    from grid_export import GetFormat, GetExt
+    from export_cache import export_key
+    from export_jobs import current_user
+    format = GetFormat(request)
+    version = model_class.DataVersion(request)
+    if not format or version is None:
+        return None
+    key = export_key(model_class,request.params,hide_index,format,version,current_user())
+    return u"%s_%s%s"%(request.GET.get("reportname",''),key,GetExt(format))
+
+def GridExportJob(request,model_class,**arg):
+    '''
+    提交后台导出任务, 返回任务号供前端轮询
+    '''
+    from grid_export import GetFormat, SaveGrid
+    from export_jobs import job_manager, current_user, RequestSnapshot, ExportJobError
+    from http_response import ajax_fail
+    format = GetFormat(request)
+    if not format:
+        return ajax_fail(u'不支持的输出格式')
+    title = request.GET.get("reportname",'')
+    m_hide_index = _GetHideIndex(request)
+    cache_name = _ExportCacheName(request,model_class,m_hide_index)
+    if cache_name:
+        from export_cache import cached_file
+        if cached_file(cache_name,max_age=model_class.export_cache_ttl):
+            return smart_str(json_dumps({"statusCode":"200","url":"/tmpfile/%s"%cache_name}))
+    m_request = RequestSnapshot(request)
+    
+    def run(job):
+        grid_model = model_class.Create(m_request)
+        m_grid = grid_model.grid
+        ''' 后台任务不受交互查询的超时限制 '''
+        m_grid.query_timeout = None
+        grid_model.SetPageSize(0)
+        grid_model.MakeData(m_request,**arg)
+        m_grid.ParseArg(**arg)
+        job.total = m_grid._GetCount()
+        fields,head = m_grid.GetExportHead(m_hide_index)
+        return SaveGrid(format,title,fields,head,job.track(m_grid.IterData(m_hide_index)),cache_name)
+    
+    try:
+        job = job_manager.submit(current_user(),title,run)
+    except ExportJobError, e:
+        return ajax_fail(e.args[0])
+    return smart_str(json_dumps({"statusCode":"200","jobId":job.id}))
+
+def ExportJobView(request, job_id):
+    '''
+    后台导出任务的进度
+    '''
+    from export_jobs import job_manager, current_user
+    from http_response import ajax_fail
+    job = job_manager.get(job_id)
+    if job is None or job.user!=current_user():
+        return ajax_fail(u'导出任务不存在或已过期')
+    ret = job.to_dict()
+    ret["statusCode"] = "200"
+    return smart_str(json_dumps(ret))
     
 def AppPageView(request, app_label, model_name):
-    from load import APP_PAGES
-    key = '%s.%s'%(app_label, model_name)
-    for e in APP_PAGES:
-        if e[0]==key:
-            return PageView(request, e[1])
+    from load import get_app_page
+    m_model = get_app_page('%s.%s'%(app_label, model_name))
+    if m_model is not None:
+        return PageView(request, m_model)
     return HTTPError(404, "File does not exist.")
 
 def PageView(request, model):
-    page = model(request)
+    page = model.Create(request)
     menu_group = page.app_menu
     PageName = page.__class__.__name__
 
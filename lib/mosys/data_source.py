@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+'''
+内存Grid(CalculateItems)的数据源缓存
+解析结果按数据版本缓存, 版本不变时每次请求只需计算一次版本(文件数据源为一次 stat)
+'''
+import os
+import threading
+
+class DataSource(object):
+    '''
+    按版本缓存 load() 的结果
+    @param    load    返回数据列表的函数
+    @param    version    返回当前数据版本的函数, 返回 None 表示不缓存
+    @param    columns    指定字段名时数据以列式存储(column_store.ColumnStore)缓存
+    缓存的数据由各请求共享, 使用方不能修改
+    '''
+    def __init__(self, load=None, version=None, columns=None):
+        self._load = load
+        self._version = version
+        self.columns = columns
+        self.items = None
+        self.key = None
+        self.lock = threading.Lock()
+
+    def version(self):
+        return self._version()
+
+    def get(self):
+        key = self.version()
+        if key is not None and key==self.key:
+            return self.items
+        self.lock.acquire()
+        try:
+            if key is None or key!=self.key:
+                self.items = self.refresh(key)
+                self.key = key
+            return self.items
+        finally:
+            self.lock.release()
+
+    def refresh(self, key):
+        return self.pack(self._load())
+
+    def pack(self, items):
+        if self.columns is None:
+            return items
+        from column_store import ColumnStore
+        return ColumnStore.from_items(self.columns, items)
+
+    def invalidate(self):
+        self.key = None
+
+class FileDataSource(DataSource):
+    '''
+    文件数据源, 版本为文件的 (路径, mtime, 大小)
+    @param    path    文件路径
+    @param    parse    parse(f) 从 f 的当前位置解析到文件尾,
+                      返回 (记录列表, 最后一条完整记录结束处的偏移)
+    @param    incremental    文件只在末尾追加时, 只解析追加的部分
+    @param    columns    同 DataSource
+    '''
+    tail_size = 256     # 用于判断已解析部分是否被改写
+
+    def __init__(self, path, parse, incremental=True, columns=None):
+        super(FileDataSource, self).__init__(columns=columns)
+        self.path = path
+        self.parse = parse
+        self.incremental = incremental
+        self.offset = 0
+        self.tail = None
+
+    def version(self):
+        st = os.stat(self.path)
+        return (self.path, st.st_mtime, st.st_size)
+
+    def _read_tail(self, f, end):
+        start = max(0, end-self.tail_size)
+        f.seek(start)
+        return f.read(end-start)
+
+    def refresh(self, key):
+        f = open(self.path, 'rb')
+        try:
+            if self.incremental and self.items is not None and key[2]>=self.offset \
+                    and self._read_tail(f, self.offset)==self.tail:
+                f.seek(self.offset)
+                items, end = self.parse(f)
+                ''' 生成新列表, 正在使用旧列表的请求不受影响 '''
+                m_items = items and (self.items + items) or self.items
+            else:
+                f.seek(0)
+                m_items, end = self.parse(f)
+                m_items = self.pack(m_items)
+            self.offset = end
+            self.tail = self._read_tail(f, end)
+            return m_items
+        finally:
+            f.close()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+导出结果缓存和 ./tmpfile 清理
+同一用户相同(Grid类, 查询参数, 隐藏列, 格式, 数据版本)的导出共用同一个文件,
+清理任务按时间和总大小限制回收 ./tmpfile 中的文件;
+文件的 mtime 为生成时间, atime 为最近使用时间
+'''
+import os
+import time
+import hashlib
+import threading
+
+TMPFILE_PATH = "./tmpfile"
+MAX_AGE = 24*3600               # 文件最长保留时间(秒)
+MAX_BYTES = 512*1024*1024       # ./tmpfile 总大小上限
+CLEAN_INTERVAL = 60             # 两次清理的最小间隔(秒)
+
+# 不影响导出内容的请求参数
+VOLATILE_PARAMS = ('page', 'rp', 'export', 'bg', 'hide', 'reportname', 'compact', 'qid', '_')
+
+def export_key(model_class, params, hide_index, format, version, user=''):
+    u"""
+        @desc: 计算导出结果的内容地址
+        @params:
+            model_class: Grid模型类
+            params: type<MultiDict> 请求参数, 忽略分页等无关参数和空值
+            hide_index: type<list> 隐藏列序号
+            format: type<str> 导出格式
+            version: 数据版本, 见 GridModel.DataVersion
+            user: 用户名, 数据按权限过滤时不同用户的结果不同
+        @return: type<str> 20位十六进制串
+    """
+    m_params = []
+    for k in sorted(params.keys()):
+        if k in VOLATILE_PARAMS:
+            continue
+        values = sorted([v for v in params.getall(k) if v not in ('', 'undefined')])
+        if values:
+            m_params.append((k, values))
+    m_key = repr(('%s.%s'%(model_class.__module__, model_class.__name__),
+                  m_params, sorted(hide_index or []), format, version, user))
+    return hashlib.sha1(m_key).hexdigest()[:20]
+
+def cached_file(filename, root=TMPFILE_PATH, max_age=None):
+    '''
+    已存在的缓存文件返回文件名, 并记录使用时间(清理时按最近使用保留)
+    生成超过 max_age 秒的文件删除后返回 None, 由调用者重新导出
+    '''
+    path = os.path.join(root, filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    now = time.time()
+    if max_age and now - st.st_mtime > max_age:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    try:
+        os.utime(path, (now, st.st_mtime))
+    except OSError:
+        pass
+    return filename
+
+def _last_used(st):
+    return max(st.st_atime, st.st_mtime)
+
+def publish(tmp_path, path):
+    '''
+    写完的临时文件改为正式文件名, 并发写同一个缓存文件时保留先完成的那个
+    '''
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        ''' windows 下目标已存在时 rename 会失败 '''
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            raise
+
+def clean_tmpfile(root=TMPFILE_PATH, max_age=MAX_AGE, max_bytes=MAX_BYTES):
+    '''
+    删除超过 max_age 的文件, 总大小仍超过 max_bytes 时从最久未使用的开始删除
+    @return    删除的文件数
+    '''
+    if not os.path.isdir(root):
+        return 0
+    now = time.time()
+    files = []
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if not os.path.isfile(path):
+            continue
+        if now - _last_used(st) > max_age:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            continue
+        if name.endswith('.part'):
+            ''' 正在写入的临时文件 '''
+            continue
+        files.append((_last_used(st), st.st_size, path))
+    total = sum([e[1] for e in files])
+    files.sort()
+    for used, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            total -= size
+        except OSError:
+            pass
+    return removed
+
+_clean_lock = threading.Lock()
+_last_clean = [0]
+
+def clean_tmpfile_throttled(root=TMPFILE_PATH):
+    '''
+    每次生成文件后调用, CLEAN_INTERVAL 内最多清理一次
+    '''
+    now = time.time()
+    if now - _last_clean[0] < CLEAN_INTERVAL or not _clean_lock.acquire(False):
+        return
+    try:
+        _last_clean[0] = now
+        clean_tmpfile(root)
+    finally:
+        _clean_lock.release()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+'''
+后台导出任务
+导出请求只负责入队并返回任务号, 由固定数量的工作线程执行, 前端轮询进度,
+完成后从 ./tmpfile 下载结果文件
+'''
+import os
+import time
+import uuid
+import datetime
+import threading
+import traceback
+
+MAX_WORKERS = 2             # 工作线程数
+MAX_RUNNING_PER_USER = 1    # 每个用户同时执行的任务数
+MAX_ACTIVE_PER_USER = 3     # 每个用户排队和执行中的任务总数上限
+JOB_TTL = 3600              # 已结束任务的保留时间(秒)
+
+class ExportJobError(Exception):
+    pass
+
+def current_user():
+    '''
+    当前会话的用户名, 用于按用户限流
+    '''
+    from mole_api import get_current_session
+    session = get_current_session()
+    if session is None:
+        return ''
+    return session.get('username', '')
+
+def error_message(e):
+    '''
+    异常信息, 驱动和系统错误的信息可能是非 ASCII 的字节串, 按 utf-8 解码, 无法解码的字节替换
+    '''
+    try:
+        return unicode(e)
+    except UnicodeError:
+        try:
+            return str(e).decode('utf-8', 'replace')
+        except UnicodeError:
+            return unicode(repr(e))
+
+def _copy_multidict(data):
+    from mole.structs import MultiDict
+    ret = MultiDict()
+    for k,v in data.iterallitems():
+        ret[k] = v
+    return ret
+
+class RequestSnapshot(object):
+    '''
+    请求参数的快照
+    mole 的 request 是线程局部的, 工作线程里用它代替 request 传给 MakeData
+    '''
+    method = 'GET'
+
+    def __init__(self, request, user=None):
+        self.GET = _copy_multidict(request.GET)
+        self.POST = _copy_multidict(request.forms)
+        self.params = _copy_multidict(request.params)
+        self.query_string = request.query_string
+        self.user = user
+
+    @classmethod
+    def from_params(cls, params, user=None):
+        '''
+        由参数字典构造(批量Grid请求中的单个Grid), 值为列表时表示多值参数
+        参数同时放入 GET 和 POST, 从 request.POST 读取过滤条件的 MakeData 也能取到
+        '''
+        from mole.structs import MultiDict
+        ret = cls.__new__(cls)
+        ret.GET = MultiDict()
+        for k,v in params.iteritems():
+            for e in (isinstance(v, list) and v or [v]):
+                if e is not None:
+                    ret.GET[k] = unicode(e)
+        ret.POST = _copy_multidict(ret.GET)
+        ret.params = _copy_multidict(ret.GET)
+        ret.query_string = ''
+        ret.user = user
+        return ret
+
+class ExportJob(object):
+    '''
+    一个导出任务
+    func(job) 执行导出并返回 ./tmpfile 下的文件名, 执行中可更新 job.total 和 job.done
+    '''
+    def __init__(self, user, name, func):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.name = name
+        self.func = func
+        self.status = 'pending'     # pending, running, done, failed
+        self.total = 0
+        self.done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.filename = None
+        self.error = None
+
+    def track(self, rows):
+        '''
+        包装数据行迭代器, 逐行累计进度
+        '''
+        for r in rows:
+            self.done += 1
+            yield r
+
+    def eta(self):
+        '''
+        预计剩余秒数, 无法估计时返回 None
+        '''
+        if self.status!='running' or not self.total or not self.done:
+            return None
+        elapsed = time.time() - self.started
+        return max(0, int(elapsed*(self.total-self.done)/self.done))
+
+    def to_dict(self):
+        ret = {
+            'jobId': self.id,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'progress': self.total and min(100, int(self.done*100/self.total)) or 0,
+            'eta': self.eta(),
+        }
+        if self.status=='done':
+            ret['progress'] = 100
+            ret['url'] = '/tmpfile/%s'%self.filename
+        elif self.status=='failed':
+            ret['message'] = self.error
+        return ret
+
+class ExportJobManager(object):
+    '''
+    任务队列和工作线程池
+    取任务时跳过已达到 max_running_per_user 的用户, 避免个别用户占满全部工作线程
+    '''
+    def __init__(self, max_workers=MAX_WORKERS, max_running_per_user=MAX_RUNNING_PER_USER,
+                 max_active_per_user=MAX_ACTIVE_PER_USER, job_ttl=JOB_TTL):
+        self.max_workers = max_workers
+        self.max_running_per_user = max_running_per_user
+        self.max_active_per_user = max_active_per_user
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.pending = []
+        self.running = {}
+        self.workers = []
+        self.cond = threading.Condition()
+
+    def submit(self, user, name, func):
+        '''
+        提交任务, 超过用户任务数上限时抛出 ExportJobError
+        '''
+        self.cond.acquire()
+        try:
+            self._purge()
+            active = len([j for j in self.jobs.values()
+                          if j.user==user and j.status in ('pending','running')])
+            if active>=self.max_active_per_user:
+                raise ExportJobError(u'导出任务过多,请等待已提交的任务完成')
+            job = ExportJob(user, name, func)
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self._start_workers()
+            self.cond.notify_all()
+            return job
+        finally:
+            self.cond.release()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _purge(self):
+        deadline = time.time() - self.job_ttl
+        for k,j in self.jobs.items():
+            if j.finished and j.finished<deadline:
+                del self.jobs[k]
+
+    def _start_workers(self):
+        self.workers = [t for t in self.workers if t.isAlive()]
+        while len(self.workers)<self.max_workers:
+            t = threading.Thread(target=self._work, name='export-worker-%s'%len(self.workers))
+            t.setDaemon(True)
+            self.workers.append(t)
+            t.start()
+
+    def _next_job(self):
+        for job in self.pending:
+            if self.running.get(job.user, 0)<self.max_running_per_user:
+                self.pending.remove(job)
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            self.cond.acquire()
+            try:
+                job = self._next_job()
+                while job is None:
+                    self.cond.wait()
+                    job = self._next_job()
+                self.running[job.user] = self.running.get(job.user, 0) + 1
+                job.status = 'running'
+                job.started = time.time()
+            finally:
+                self.cond.release()
+            try:
+                job.filename = job.func(job)
+                job.status = 'done'
+            except Exception, e:
+                job.error = error_message(e)
+                job.status = 'failed'
+                traceback.print_exc()
+            finally:
+                if job.status=='running':
+                    job.status = 'failed'
+                job.finished = time.time()
+                self.cond.acquire()
+                try:
+                    self.running[job.user] -= 1
+                    self.cond.notify_all()
+                finally:
+                    self.cond.release()
+
+job_manager = ExportJobManager()
+
+def save_chunks(name, chunks):
+    '''
+    将字符串块写入 ./tmpfile, 返回文件名
+    '''
+    from export_cache import TMPFILE_PATH, publish, clean_tmpfile_throttled
+    if not os.path.exists(TMPFILE_PATH):
+        os.makedirs(TMPFILE_PATH)
+    root, ext = os.path.splitext(name)
+    filename = '%s_%s%s'%(root, datetime.datetime.now().strftime("%Y%m%d%H%M%S"), ext)
+    path = os.path.join(TMPFILE_PATH, filename)
+    tmp_path = '%s.%s.part'%(path, threading.current_thread().ident)
+    f = open(tmp_path, 'wb')
+    try:
+        for chunk in chunks:
+            f.write(chunk)
+    finally:
+        f.close()
+    publish(tmp_path, path)
+    clean_tmpfile_throttled(TMPFILE_PATH)
+    return filename
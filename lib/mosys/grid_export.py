@@ -2,74 +2,234 @@
 import datetime
 import sys
 import os
+import csv
+import threading
+import codecs
+from cStringIO import StringIO
 
-def ExportGrid(request, grid_data, data_key=None):
+from export_cache import TMPFILE_PATH, publish, clean_tmpfile_throttled
+
+def GetFormat(request):
     '''
-    Grid导出
+    请求的导出格式, 不支持时返回 None
     '''
     format = request.GET.get('format','.xls')
-    if not (request.method=="GET" and format and (format  in ('.xls','.pdf','.csv'))):
+    if not (request.method=="GET" and format and (format  in ('.xls','.xlsx','.pdf','.csv'))):
+        return None
+    return format
+
+def GetExt(format):
+    '''
+    导出格式对应的文件扩展名
+    '''
+    return EMITTERS.get(format, EXCELEmitter).ext
+
+def ExportGrid(request, fields, head, rows, filename=None):
+    '''
+    Grid导出
+    @param    fields    导出的字段名列表
+    @param    head    {字段名:标题}
+    @param    rows    可迭代的数据行, 每行为与 fields 顺序一致的值列表
+    @param    filename    指定的文件名(导出缓存), 默认按标题和时间生成
+    '''
+    format = GetFormat(request)
+    if not format:
         return u'不支持的输出格式'
     try:
-        emitter = EXCELEmitter()
-        return emitter.render_data(request,grid_data)
+        emitter = EMITTERS.get(format, EXCELEmitter)()
+        return emitter.render_data(request,fields,head,rows,filename)
     except UnicodeError:
         import traceback;traceback.print_exc();
         return u'编码出错，请另作选择'
-    
-class EXCELEmitter(object):
+
+def SaveGrid(format, title, fields, head, rows, filename=None):
+    '''
+    导出到 ./tmpfile 并返回文件名(后台导出任务使用)
+    '''
+    return EMITTERS.get(format, EXCELEmitter)().save(title, fields, head, rows, filename)
+
+def _utf8(val):
+    if val is None:
+        return ''
+    if isinstance(val, unicode):
+        return val.encode('utf-8')
+    return val
+
+class FileEmitter(object):
     """
-    Excel emitter
+    写入 ./tmpfile 再重定向下载的导出基类
     """
-    def render_data(self, request,grid_data):
+    file_path = TMPFILE_PATH
+    ext = None
+
+    def render_data(self, request, fields, head, rows, filename=None):
         from mole import redirect
-        import xlwt
         title=request.GET.get("reportname",'')
-        sheet_name=u"%s_%s"%('Sheet', datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
-        
-        file_path = "./tmpfile"
-        if not os.path.exists(file_path):
-            os.makedirs(file_path)
-            
-        fields=grid_data[0]
-        del grid_data[0]
+        filename = self.save(title, fields, head, rows, filename)
+        f="/tmpfile/"+filename
+        return redirect(f.encode("utf-8"))
 
-        wb = xlwt.Workbook(encoding='utf-8')
-        ws = wb.add_sheet(sheet_name)
-        
+    def save(self, title, fields, head, rows, filename=None):
+        if not os.path.exists(self.file_path):
+            os.makedirs(self.file_path)
+        now = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        if not filename:
+            filename="%(d1)s_%(d2)s%(ext)s"%{
+                "d1":u"%s"%title,
+                "d2":now,
+                "ext":self.ext
+            }
+        path = u"%s/%s"%(self.file_path, filename)
+        ''' 先写临时文件, 避免下载到写了一半的文件 '''
+        tmp_path = u"%s.%s.part"%(path, threading.current_thread().ident)
+        try:
+            self.write(tmp_path, u"%s_%s"%('Sheet', now), fields, head, rows)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        publish(tmp_path, path)
+        clean_tmpfile_throttled(self.file_path)
+        return filename
+
+    def write(self, path, sheet_name, fields, head, rows):
+        raise NotImplementedError
+
+class EXCELEmitter(FileEmitter):
+    """
+    Excel emitter
+    超过 65536 行时续写到新的sheet
+    xlwt 在 save 之前把整个工作簿保存在内存中, flush_row_data 只把单元格对象换成序列化后的数据,
+    内存仍随行数增长; 大数据量应导出 xlsx 或 csv(内存不随行数增长)
+    """
+    ext = '.xls'
+    max_rows = 65536
+    flush_rows = 1000
+
+    def get_style(self):
+        import xlwt
         fnt = xlwt.Font()
         fnt.name = 'Arial'
         #fnt.colour_index = 4
         #fnt.bold = True
-        
+
         borders = xlwt.Borders()
         borders.left = 1
         borders.right = 1
         borders.top = 1
         borders.bottom = 1
-        
+
         align = xlwt.Alignment()
         align.horz = xlwt.Alignment.HORZ_CENTER
         align.vert = xlwt.Alignment.VERT_CENTER
-        
+
         style = xlwt.XFStyle()
         style.font = fnt
         style.borders = borders
         style.alignment = align
-        
-        row_index=0
-        for row in grid_data:
-            col_index=0
-            for col in fields:
-                ws.write(row_index,col_index, row[col], style)
-                ws.col(col_index).width=0x0d00+2000
-                col_index+=1
-            row_index+=1
-        filename="%(d1)s_%(d2)s.xls"%{
-            "d1":u"%s"%title,
-            "d2":datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-        }
-        
-        wb.save(u"%s/%s"%(file_path, filename))
-        f="/tmpfile/"+filename
-        return redirect(f.encode("utf-8"))
+        return style
+
+    def add_sheet(self, wb, name, fields, head, style):
+        ws = wb.add_sheet(name)
+        for col_index,col in enumerate(fields):
+            ws.write(0, col_index, head[col], style)
+            ws.col(col_index).width=0x0d00+2000
+        return ws
+
+    def write(self, path, sheet_name, fields, head, rows):
+        import xlwt
+        wb = xlwt.Workbook(encoding='utf-8')
+        style = self.get_style()
+        ws = self.add_sheet(wb, sheet_name, fields, head, style)
+        sheet_index = 1
+        row_index = 1
+        for row in rows:
+            if row_index>=self.max_rows:
+                sheet_index += 1
+                ws = self.add_sheet(wb, u"%s_%s"%(sheet_name, sheet_index), fields, head, style)
+                row_index = 1
+            for col_index,val in enumerate(row):
+                ws.write(row_index, col_index, val, style)
+            row_index += 1
+            if row_index % self.flush_rows==0:
+                ''' 已写完的行序列化后释放单元格对象 '''
+                ws.flush_row_data()
+        wb.save(path)
+
+class XLSXEmitter(FileEmitter):
+    """
+    xlsx emitter, 需要 xlsxwriter
+    使用 constant_memory 模式逐行落盘, 超过 1048576 行时续写到新的sheet
+    """
+    ext = '.xlsx'
+    max_rows = 1048576
+
+    def add_sheet(self, wb, name, fields, head, style):
+        ws = wb.add_worksheet(name)
+        ws.set_column(0, len(fields)-1, 20)
+        ws.write_row(0, 0, [head[col] for col in fields], style)
+        return ws
+
+    def write(self, path, sheet_name, fields, head, rows):
+        import xlsxwriter
+        wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+        style = wb.add_format({'font_name': 'Arial', 'border': 1, 'align': 'center', 'valign': 'vcenter'})
+        ws = self.add_sheet(wb, sheet_name, fields, head, style)
+        sheet_index = 1
+        row_index = 1
+        for row in rows:
+            if row_index>=self.max_rows:
+                sheet_index += 1
+                ws = self.add_sheet(wb, u"%s_%s"%(sheet_name, sheet_index), fields, head, style)
+                row_index = 1
+            ws.write_row(row_index, 0, row, style)
+            row_index += 1
+        wb.close()
+
+class CSVEmitter(FileEmitter):
+    """
+    CSV emitter
+    请求内导出时不落盘, 边读边写直接输出到响应; 指定文件名(导出缓存)和后台任务导出时写入文件
+    """
+    ext = '.csv'
+    batch_rows = 500
+
+    def render_data(self, request, fields, head, rows, filename=None):
+        if filename:
+            return FileEmitter.render_data(self, request, fields, head, rows, filename)
+        from mole import response
+        title=request.GET.get("reportname",'')
+        filename=u"%s_%s.csv"%(title, datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+        response.content_type = 'text/csv; charset=utf-8'
+        response.headers['Content-Disposition'] = 'attachment; filename=%s'%filename.encode("utf-8")
+        return self.generate(fields, head, rows)
+
+    def write(self, path, sheet_name, fields, head, rows):
+        f = open(path, 'wb')
+        try:
+            for chunk in self.generate(fields, head, rows):
+                f.write(chunk)
+        finally:
+            f.close()
+
+    def generate(self, fields, head, rows):
+        buf = StringIO()
+        writer = csv.writer(buf)
+        ''' 带BOM, Excel 才能正确识别 utf-8 '''
+        buf.write(codecs.BOM_UTF8)
+        writer.writerow([_utf8(head[col]) for col in fields])
+        count = 0
+        for row in rows:
+            writer.writerow([_utf8(val) for val in row])
+            count += 1
+            if count % self.batch_rows==0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+EMITTERS = {
+    '.xls': EXCELEmitter,
+    '.xlsx': XLSXEmitter,
+    '.csv': CSVEmitter,
+}
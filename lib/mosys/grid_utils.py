@@ -1,5 +1,60 @@
 # coding=utf-8
+import copy
 import datetime
+from itertools import islice, chain
+
+def _ConvValue(r,v):
+    '''
+    通用列转换: 空值转为'', 时间格式化
+    '''
+    if v:
+        if type(v)==datetime.datetime:
+            return v.strftime('%Y-%m-%d %H:%M:%S')
+        return v
+    return ''
+
+def _ConvDatetime(r,v):
+    if v:
+        return v.strftime('%Y-%m-%d %H:%M:%S')
+    return ''
+
+def _ConvPlain(r,v):
+    if v:
+        return v
+    return ''
+
+def _ConvTrans(trans):
+    '''
+    colum_trans 自定义转换, 空值不调用
+    '''
+    def conv(r,v):
+        if v:
+            return trans(r,v)
+        return ''
+    return conv
+
+def _EncodeColumns(cols, rows):
+    '''
+    字典编码: 全为字符串且取值重复较多的列, 行中的值替换为取值序号(直接修改 rows)
+    @return    {字段名:[取值]}
+    '''
+    dicts = {}
+    for j,f in enumerate(cols):
+        values = {}
+        for r in rows:
+            if not isinstance(r[j], basestring):
+                break
+            values.setdefault(r[j], len(values))
+        else:
+            if values and len(values)*2 <= len(rows):
+                for r in rows:
+                    r[j] = values[r[j]]
+                m_dict = [None]*len(values)
+                for v,k in values.iteritems():
+                    m_dict[k] = v
+                dicts[f] = m_dict
+    return dicts
+
 class GridBase(object):
     '''
     Grid分页，排序和查询工具类
@@ -15,6 +70,17 @@ class GridBase(object):
         self.sql_data = None
         self.sql_order = None
         self.blank = False
+        self.dialect = None
+        self.default_sort = None
+        self._order = None
+        self.params = []
+        self._row_plans = {}
+        self._store = None
+        self._view = None
+        self.query_timeout = None
+        self.query_id = None
+        self.count_mode = 'exact'
+        self._prefetched = {}
         
         self.__fieldcaptions= [e[1] for e in self.dic]
         self.__fieldnames =  [e[0] for e in self.dic]
@@ -31,6 +97,20 @@ class GridBase(object):
         self.result = {}
         self.ReItemObj()
         
+    def Clone(self):
+        '''
+        复制编译好的Grid供单次请求使用
+        字段名、sql模板和行转换计划共享, 字段属性、colum_trans 和查询状态每份一个
+        '''
+        ret = copy.copy(self)
+        ret.fields = copy.deepcopy(self.fields)
+        ret.colum_trans = dict(self.colum_trans)
+        ret.CalculateItem = dict(self.CalculateItem)
+        ret.params = list(self.params)
+        ret.result = {}
+        ret._prefetched = {}
+        return ret
+    
     def InitItems(self):
         self.CalculateItems = []
         
@@ -60,8 +140,13 @@ class GridBase(object):
         '''
         执行sql语言
         '''
+        if sql in self._prefetched:
+            ret = self._prefetched[sql]
+            if isinstance(ret, Exception):
+                raise ret
+            return ret
         from sql_utils import p_query
-        return p_query(sql)
+        return p_query(sql,self.GetParams(),self.query_timeout,self.query_id)
 #        from django.db import  connection
 #        cursor = connection.cursor()
 #        print sql
@@ -69,60 +154,313 @@ class GridBase(object):
 #        return cursor.fetchall()
     
     
+    def _Bind(self, expr, values):
+        '''
+        将 expr 中的 ? 依次替换为驱动的占位符, 并按顺序记录参数值
+        '''
+        from sql_utils import placeholder
+        m_parts = expr.split('?')
+        if len(m_parts)-1 != len(values):
+            raise ValueError(u"条件 %s 的参数个数不匹配"%expr)
+        m_sql = m_parts[0]
+        for i,v in enumerate(values):
+            self.params.append(v)
+            m_sql += placeholder(len(self.params)) + m_parts[i+1]
+        return m_sql
+    
+    def AddFilter(self, expr, *values):
+        '''
+        追加带绑定参数的查询条件, 条件中用 ? 表示参数位置
+        如: grid.AddFilter("u.badgenumber like ?", '%%%s%%'%badgenumber)
+        '''
+        self.sql += ' and %s'%self._Bind(expr, values)
+    
+    def AddIn(self, expr, values):
+        '''
+        追加 in 条件, values 为列表或逗号分隔的字符串
+        参数个数补齐到2的幂, 不同长度的列表只对应少数几种sql文本
+        '''
+        if isinstance(values, basestring):
+            values = [e.strip() for e in values.split(',') if e.strip()]
+        values = list(values)
+        if not values:
+            return
+        m_size = 1
+        while m_size < len(values):
+            m_size *= 2
+        values += [values[-1]]*(m_size-len(values))
+        self.AddFilter('%s in (%s)'%(expr, ','.join(['?']*m_size)), *values)
+    
+    def AddDateRange(self, expr, start=None, end=None):
+        '''
+        追加日期区间条件, 为空的一端不限制
+        '''
+        if start:
+            self.AddFilter('%s >= ?'%expr, start)
+        if end:
+            self.AddFilter('%s <= ?'%expr, end)
+    
+    def GetParams(self):
+        '''
+        当前sql的绑定参数, 没有参数时返回 None
+        '''
+        if not self.params:
+            return None
+        from sql_utils import bind_params
+        return bind_params(self.params)
+    
     def _GetCount(self):
         ret = 0
         if self.CalculateItems==None:
             if self.sql:
+                if not self._IsExactCount():
+                    ret = self._GetEstimate()
+                    if ret is not None:
+                        return ret
                 if not self.sql_count:
-                    self.sql_count = 'select count(1) from (%s) as m'%self.sql
+                    self.sql_count = self.GetDialect().count(self.sql)
                 ''' 查询sql语句得到记录数 '''
                 rows = self._ExecSql(self.sql_count)
                 ret = rows[0][0]
                 pass
+        elif self._view is not None:
+            ret = len(self._view)
         else:
             ret = len(self.CalculateItems)
         return ret
     
-    def _GetData(self,hide_index=None):
+    def _IsExactCount(self):
+        '''
+        是否精确计数: count_mode 为 exact, 或内存数据, 或不分页(导出)
+        '''
+        return self.count_mode=='exact' or self.CalculateItems!=None or self.pagesize==0
+    
+    def _GetEstimate(self):
+        '''
+        count_mode 为 estimate 时按执行计划估算记录数, 不支持估算时改为精确计数并返回 None;
+        为 none 时不计数, 由取数时多取的一行判断是否有下一页
+        '''
+        if self.count_mode=='none':
+            return 0
+        from sql_utils import p_estimate
+        ret = p_estimate(self.sql,self.GetParams())
+        if ret is None:
+            self.count_mode = 'exact'
+        return ret
+    
+    def _ProbeRows(self, rows):
+        '''
+        非精确计数时当前页多取了一行, 据此判断是否有下一页并修正记录数
+        '''
+        if self._IsExactCount():
+            return rows
+        m_size = self._end-self._begin
+        if len(rows) > m_size:
+            self.result['total'] = max(self.result.get('total') or 0, self._end+1)
+            self.result['count'] = self.count_mode
+            return rows[:m_size]
+        if not rows and self._begin > 0:
+            return self._LastPageRows()
+        ''' 已到最后一页, 记录数是准确的 '''
+        self.result['total'] = self._begin+len(rows)
+        self.result['count'] = 'exact'
+        return rows
+    
+    def _LastPageRows(self):
+        '''
+        非精确计数时页号超出了范围(如条件改变后仍请求原来的页): 精确计数一次, 退回最后一页重新取数
+        '''
+        m_mode = self.count_mode
+        self.count_mode = 'exact'
+        try:
+            m_count = self._GetCount()
+            m_page = m_count and (m_count-1)/self.pagesize+1 or 1
+            self._begin = (m_page-1)*self.pagesize
+            self._end = m_page*self.pagesize
+            self.sql_data = None
+            rows = m_count and self._ExecSql(self._GetDataSql()) or []
+        finally:
+            self.count_mode = m_mode
+        self.result['total'] = m_count
+        self.result['page'] = m_page
+        self.result['count'] = 'exact'
+        return rows
+    
+    def GetStore(self):
+        '''
+        CalculateItems 的列式存储, 为字典列表时按字段转换一次
+        '''
+        from column_store import ColumnStore
+        if isinstance(self.CalculateItems, ColumnStore):
+            return self.CalculateItems
+        if self._store is None or self._store[0] is not self.CalculateItems:
+            self._store = (self.CalculateItems, ColumnStore.from_items(self.__fieldnames, self.CalculateItems))
+        return self._store[1]
+    
+    def FilterItems(self, field, value):
+        '''
+        内存数据的相等过滤, 可多次调用叠加
+        '''
+        self._view = self.GetStore().equal(field, value, self._view)
+    
+    def SearchItems(self, field, text):
+        '''
+        内存数据的子串过滤(相当于 like '%text%'), 可多次调用叠加
+        '''
+        self._view = self.GetStore().match(field, text, self._view)
+    
+    def SortItems(self, sortname, sortorder='asc'):
+        '''
+        内存数据排序
+        '''
+        self._view = self.GetStore().argsort(sortname, sortorder=='desc', self._view)
+    
+    def _PageItems(self, begin=0, end=None):
+        if self._view is None and isinstance(self.CalculateItems, list):
+            return self.CalculateItems[begin:end]
+        return self.GetStore().take(self._view, begin, end)
+    
+    def _GetOrder(self):
+        '''
+        排序子句, 未调用 ParseArg 时使用默认排序
+        '''
+        if self._order is None:
+            self._order = self.GetDialect().order_by(*self.GetSort())
+        return self._order
+    
+    def _GetOrderedSql(self):
+        '''
+        完整排序(不分页)的sql
+        '''
+        if not self.sql_order:
+            self.sql_order = self.GetDialect().ordered(self.sql,self._GetOrder())
+        return self.sql_order
+    
+    def _CompileRowPlan(self,rows,hide_index=None,with_id=False):
+        '''
+        编译行转换计划, 每个grid按隐藏列和 colum_trans 缓存一份
+        计划为 [(字段名, 列序号, 转换函数)], 隐藏列直接剔除;
+        未设置 colum_trans 的列按首个非空值的类型选定转换函数
+        '''
+        key = (tuple(hide_index or ()), with_id, tuple(sorted(self.colum_trans.items())))
+        plan = self._row_plans.get(key)
+        if plan is not None:
+            return plan
+        plan = []
+        for i,e in enumerate(self.__fieldnames):
+            if hide_index and (i in hide_index):
+                continue
+            if self.colum_trans.has_key(e):
+                conv = _ConvTrans(self.colum_trans[e])
+            else:
+                conv = _ConvValue
+                for r in islice(rows,50):
+                    if r[i]:
+                        conv = (type(r[i])==datetime.datetime) and _ConvDatetime or _ConvPlain
+                        break
+            plan.append((e,i,conv))
+        if with_id and 'id' not in self.__fieldnames:
+            if plan and plan[0][1]==0:
+                plan.append(('id',0,plan[0][2]))
+            else:
+                plan.append(('id',0,_ConvValue))
+        if rows:
+            if len(self._row_plans) >= 64:
+                ''' colum_trans 每次请求新建函数时避免缓存无限增长 '''
+                self._row_plans.clear()
+            self._row_plans[key] = plan
+        return plan
+    
+    def PrefetchSql(self,offset):
+        '''
+        不依赖记录数的查询: 精确计数的count和第 offset 页的数据
+        调用方可以并发执行后用 SetPrefetched 填入结果, 分页时不再查询; 页号超出范围时按实际页号重新查询
+        在 ParseArg 之后调用
+        '''
+        if self.blank or self.CalculateItems!=None or not self.sql or self.pagesize==0:
+            return []
+        ret = []
+        if self._IsExactCount():
+            if not self.sql_count:
+                self.sql_count = self.GetDialect().count(self.sql)
+            ret.append(self.sql_count)
+        m_range = self._begin,self._end
+        self._begin = (offset-1)*self.pagesize
+        self._end = offset*self.pagesize
+        ret.append(self._GetDataSql())
+        self.sql_data = None
+        self._begin,self._end = m_range
+        return ret
+    
+    def SetPrefetched(self,sql,result):
+        '''
+        填入预先执行的查询结果, result 为异常时在使用时抛出
+        '''
+        self._prefetched[sql] = result
+    
+    def _GetDataSql(self):
+        '''
+        当前页数据的sql
+        '''
+        if not self.sql_data:
+            if self.pagesize==0:
+                self.sql_data = self._GetOrderedSql()
+            else:
+                m_size = self._end-self._begin
+                if not self._IsExactCount():
+                    m_size += 1
+                self.sql_data = self.GetDialect().page(self.sql,self._GetOrder(),self._begin,m_size)
+        return self.sql_data
+    
+    def _GetData(self,hide_index=None,with_id=False):
         if self.blank:
             return []
         if self.PagedItems==None:
             if self.CalculateItems==None:
-                if not self.sql_data:
-                    if self.pagesize==0:
-                        self.sql_data = self.sql_order
-                    else:
-                        self.sql_data = 'select * from (%s) t where t.r>%s and t.r<=%s'%(self.sql_order,self._begin,self._end)
-    #                    self.sql_data = 'select  a.*,row_number() as r from (%s) as a where r>=%s and r<=%s '%(self.sql,self._begin,self._end)#
-    #                    self.sql_data = 'select top %s t.* from (%s) t where t.row not in (select top %s a.row from (%s) a order by a.row) order by t.row'%(self.pagesize,self.sql,self._begin,self.sql)
-    #                    self.sql_data = '%s LIMIT %s,%s  '%(self.sql,self._begin,self.pagesize)
                 ''' 查询sql语句得到记录数 '''
-                rows = self._ExecSql(self.sql_data)
-                self.PagedItems = []
-                for r in rows:
-                    _item = self.NewItem().copy()
-                    i = 0
-                    for e in self.__fieldnames:
-                        
-                        if hide_index and (i in hide_index):
-                            del _item[e]
-                        else:
-                            if r[i]:
-                                if self.colum_trans.has_key(e):
-                                    _item[e] = self.colum_trans[e](r,r[i])
-                                else:
-                                    if type(r[i])==datetime.datetime:
-                                        _item[e] = r[i].strftime('%Y-%m-%d %H:%M:%S')
-                                    else:
-                                        _item[e] = r[i]
-                            else:
-                                _item[e] = ''
-                        i +=1
-                    self.PagedItems.append(_item.copy())
+                rows = self._ProbeRows(self._ExecSql(self._GetDataSql()) or [])
+                plan = self._CompileRowPlan(rows,hide_index,with_id)
+                self.PagedItems = [{e:conv(r,r[i]) for e,i,conv in plan} for r in rows]
             else:
-                self.PagedItems = self.CalculateItems
+                self.PagedItems = self._PageItems()
         return self.PagedItems
     
+    def GetExportHead(self,hide_index=None):
+        '''
+        导出的字段名列表和 {字段名:标题} 字典
+        '''
+        fields = []
+        head = {}
+        for i,e in enumerate(self.dic):
+            if hide_index and (i in hide_index):
+                continue
+            head[e[0]] = e[1]
+            fields.append(e[0])
+        return fields,head
+    
+    def IterData(self,hide_index=None,chunk=500):
+        '''
+        逐行返回导出数据, 每行为按可见字段顺序排列的值列表
+        sql数据用 fetchmany 分批读取, 内存占用与总行数无关
+        '''
+        if self.blank:
+            return
+        if self.CalculateItems!=None:
+            fields = self.GetExportHead(hide_index)[0]
+            if self._view is None and isinstance(self.CalculateItems, list):
+                for e in self.CalculateItems:
+                    yield [e[f] for f in fields]
+            else:
+                for r in self.GetStore().rows(self._view, fields, chunk):
+                    yield r
+            return
+        from sql_utils import p_iter
+        rows = p_iter(self._GetOrderedSql(),self.GetParams(),chunk)
+        first = list(islice(rows,chunk))
+        plan = self._CompileRowPlan(first,hide_index)
+        for r in chain(first,rows):
+            yield [conv(r,r[i]) for e,i,conv in plan]
+    
     def paging(self,item_count=None,offset=None,pagesize=None):
         '''
         实现标准的分页功能
@@ -148,7 +486,7 @@ class GridBase(object):
                 page_count =item_count/limit
             else:
                 page_count =int(item_count/limit)+1                        
-            if offset>page_count and page_count:offset=page_count
+            if offset>page_count and page_count and self._IsExactCount():offset=page_count
     #        Result['item_count']=item_count
     
     #        Result['limit']=limit
@@ -160,7 +498,7 @@ class GridBase(object):
         Result['total']=item_count
         Result['page']=offset
         if self.CalculateItems!=None:
-            self.PagedItems = self.CalculateItems[self._begin:self._end]
+            self.PagedItems = self._PageItems(self._begin, self._end)
         self.result.update(Result)
         
     def ItemData(self):
@@ -171,27 +509,76 @@ class GridBase(object):
     def GetDatas(self):
         dd = []
         
+    def GetDialect(self):
+        '''
+        当前数据库的分页方言
+        '''
+        if self.dialect is None:
+            from sql_utils import curr_dialect
+            self.dialect = curr_dialect
+        return self.dialect
+    
+    def GetSortable(self):
+        '''
+        可排序字段白名单: 标记了 sortable 的列, 以及默认排序列
+        '''
+        m_list = [e for e in self.__fieldnames if self.fields[e].get('sortable')]
+        if self.default_sort and self.default_sort[0] in self.__fieldnames:
+            m_list.append(self.default_sort[0])
+        return m_list
+    
+    def GetSort(self, sortname=None, sortorder=None):
+        '''
+        校验排序参数, 不在白名单内的字段回退到默认排序
+        @return    (排序字段, asc/desc)
+        '''
+        if sortname not in self.GetSortable():
+            if self.default_sort:
+                sortname, sortorder = self.default_sort
+            else:
+                sortname, sortorder = self.__fieldnames[0], 'desc'
+        sortorder = (sortorder or '').lower()
+        if sortorder not in ('asc','desc'):
+            sortorder = 'asc'
+        return sortname, sortorder
+    
     def ParseArg(self, **arg):
         '''
         内置的处理查询和排序的操作
+        内存数据(CalculateItems)使用列式存储完成相同的查询和排序
         '''
+        if self.CalculateItems!=None:
+            self._ParseItemArg(**arg)
+            return
+        if not self.sql:
+            return
         try:
-            if arg.has_key("query"):
-                if not self.sql_count:
-                    self.sql_count = 'select count(1) from (%s) a'%self.sql
-                self.sql ="select * target_from (%s) a where %s like '%s' "%(self.sql,arg["qtype"],'%%'+arg["query"]+'%%')
-            else:
-                if not self.sql_count:
-                    self.sql_count = 'select count(1) from (%s) a'%self.sql
-                self.sql ="select * target_from (%s) a "%self.sql
-                
-            if arg.has_key("sortname"):
-                self.sql_order = self.sql.replace('target_from', ',row_number() over (order by %s %s) as r from'%(arg["sortname"],arg["sortorder"]))
+            m_dialect = self.GetDialect()
+            if arg.has_key("query") and arg.get("qtype") in self.__fieldnames:
+                m_where = self._Bind("%s like ?"%arg["qtype"], ['%'+arg["query"]+'%'])
             else:
-                self.sql_order = self.sql.replace('target_from', ',row_number() over (order by %s desc) as r from'%self.__fieldnames[0])
+                m_where = None
+            self.sql = m_dialect.wrap(self.sql, m_where)
+            if not self.sql_count:
+                self.sql_count = m_dialect.count(self.sql)
+            self._order = m_dialect.order_by(*self.GetSort(arg.get("sortname"), arg.get("sortorder")))
+            self.sql_order = m_dialect.ordered(self.sql, self._order)
         except:
             pass
         
+    def _ParseItemArg(self, **arg):
+        m_query = arg.get("query")
+        m_sortname = arg.get("sortname")
+        if not (m_query or m_sortname or self.default_sort):
+            return
+        if m_query and arg.get("qtype") in self.__fieldnames:
+            self.SearchItems(arg["qtype"], m_query)
+        if m_sortname in self.GetSortable() or self.default_sort:
+            self.SortItems(*self.GetSort(m_sortname, arg.get("sortorder")))
+        if self._begin is not None:
+            ''' MakeData 中已分页, 按新的结果重新分页 '''
+            self.paging(offset=self.result.get('page'))
+    
     def HeadDic(self,**kargs):
         ret = {}
         ret['colModel'] = [self.fields[e] for e in self.__fieldnames]
@@ -204,19 +591,44 @@ class GridBase(object):
 #        self.result['fieldnames'] =  [e[0] for e in self.dic]
 #        self.result['disableCols'] = []
 #        self.result['tmp_name'] = self.SaveTmp()
-        m_data = self._GetData()
-        m_rows = []
-        for e in m_data:
-            m_row = {"id":e[self.__fieldnames[0]]}
-            m_row.update(e)
-#            _data = []
-#            for f in self.__fieldnames:
-#                _data.append(e[f])
-#            m_row["cell"] = _data
-            m_rows.append(m_row)
-#        m_rows = [{"id":e.values()[0],"cell":e.values()} for e in m_data]
+        m_data = self._GetData(with_id=True)
+        if self.CalculateItems==None:
+            ''' sql数据在转换时已带 id '''
+            m_rows = m_data
+        else:
+            m_key = self.__fieldnames[0]
+            m_rows = []
+            for e in m_data:
+                m_row = {"id":e[m_key]}
+                m_row.update(e)
+                m_rows.append(m_row)
         self.result['rows'] = m_rows
         return self.result
 
+    def _GetRows(self):
+        '''
+        当前页数据, 每行为按字段顺序排列的值列表
+        '''
+        if self.blank:
+            return []
+        if self.CalculateItems==None:
+            rows = self._ProbeRows(self._ExecSql(self._GetDataSql()) or [])
+            plan = self._CompileRowPlan(rows)
+            return [[conv(r,r[i]) for e,i,conv in plan] for r in rows]
+        fields = self.__fieldnames
+        return [[e.get(f,'') for f in fields] for e in self._GetData()]
+    
+    def CompactResultDic(self):
+        '''
+        紧凑的列式结果(请求参数 compact=1), 由 m.gridutils.js 的 expand_compact 还原
+        {"total":, "page":, "cols":[字段名], "rows":[[值]], "dicts":{字段名:[取值]}}
+        dicts 中的列在 rows 里存放取值的序号; 行 id 取第一列
+        '''
+        m_rows = self._GetRows()
+        self.result['cols'] = self.__fieldnames
+        self.result['dicts'] = _EncodeColumns(self.__fieldnames, m_rows)
+        self.result['rows'] = m_rows
+        return self.result
+    
     def GetFieldNames(self):
         return self.__fieldnames
@@ -4,9 +4,16 @@ def getAppPages():
     pass
 
 APP_PAGES = []
+APP_PAGE_INDEX = {}     # 'app.类名' -> 页面类
 SYS_MENUS = {}
 SYS_MODELS = []
 
+def get_app_page(key):
+    '''
+    按 'app.类名' 查找页面类, 不存在时返回 None
+    '''
+    return APP_PAGE_INDEX.get(key)
+
 def ModelScan():
     import apps
     from importlib import import_module
@@ -32,6 +39,8 @@ def ModelScan():
             try:
                 if issubclass(m, AppPage) and m.__name__ not in ['AppPage','GridModel']:
                     APP_PAGES.append( ('%s.%s'%(app,m.__name__), m) )
+                    APP_PAGE_INDEX['%s.%s'%(app,m.__name__)] = m
+                    m.Compile()
                     if SYS_MENUS[app].has_key(m.menu_grup):
                         if m.visible:
                             SYS_MENUS[app][m.menu_grup].append( (m.verbose_name, '/page/%s/%s/'%(app,m.__name__), m.icon_class, '') )
@@ -19,6 +19,33 @@ def GridModelFunc(app_label, model_name):
     return GridModelView(request, app_label, model_name)
 add_route(GridModelFunc, '/grid/:app_label/:model_name/',method=['GET','POST'])
 
+@valid_user()
+def GridBatchFunc():
+    '''
+    一次请求多个Grid的数据
+    '''
+    from custom_model_view import GridBatchView
+    return GridBatchView(request)
+add_route(GridBatchFunc, '/grid/batch/',method=['POST'])
+
+@valid_user()
+def ExportJobFunc(job_id):
+    '''
+    后台导出任务进度
+    '''
+    from custom_model_view import ExportJobView
+    return ExportJobView(request, job_id)
+add_route(ExportJobFunc, '/export/job/:job_id/',method=['GET','POST'])
+
+@valid_user()
+def GridCancelFunc(qid):
+    '''
+    取消Grid查询
+    '''
+    from custom_model_view import GridCancelView
+    return GridCancelView(request, qid)
+add_route(GridCancelFunc, '/query/cancel/:qid/',method=['GET','POST'])
+
 @valid_user()
 def AppMenuFunc(app_label):
     '''
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+'''
+p_query 的结果缓存
+按 (sql, 参数) 缓存查询结果, 每条结果按sql中出现的表打标签;
+经 p_execute/p_mutiexec 等写入这些表时清除对应标签的缓存, 其它途径的写入(peewee、直接使用游标)只能等 TTL 过期.
+只缓存涉及的表全部登记为可缓存(cache_tables)的查询, 或调用时指定 cache 的查询
+'''
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL = 300           # 缓存时间(秒)
+MAX_ENTRIES = 1000          # 最多缓存的查询数, 超过时淘汰最久未使用的
+MAX_PARSED = 2000           # tables_of 缓存的sql数
+
+_WORD = re.compile(r'[\w\.\[\]"`$#]+|[(),;]')
+_TABLE_KEYWORDS = ('from', 'join', 'into', 'update', 'table')
+_CLAUSE_KEYWORDS = set(['where', 'group', 'order', 'having', 'join', 'inner', 'left', 'right', 'full',
+                        'cross', 'outer', 'natural', 'on', 'using', 'union', 'limit', 'set', 'values',
+                        'select', 'with', 'offset', 'fetch', 'for', 'default', 'output'])
+_parsed = {}
+
+def _table_name(word):
+    return word.split('.')[-1].strip('[]"`')
+
+def _parse_tables(sql):
+    words = _WORD.findall(sql.lower())
+    ret = set()
+    i = 0
+    while i < len(words):
+        w = words[i]
+        i += 1
+        if w not in _TABLE_KEYWORDS:
+            continue
+        while i < len(words) and words[i] not in ('(', ')', ',', ';') and words[i] not in _CLAUSE_KEYWORDS:
+            ret.add(_table_name(words[i]))
+            i += 1
+            ''' 跳过别名, from 后的逗号分隔的多个表 '''
+            if i < len(words) and words[i]=='as':
+                i += 1
+            if i < len(words) and words[i] not in ('(', ')', ',', ';') and words[i] not in _CLAUSE_KEYWORDS:
+                i += 1
+            if w=='from' and i < len(words) and words[i]==',':
+                i += 1
+                continue
+            break
+    ret.discard('')
+    return frozenset(ret)
+
+def tables_of(sql):
+    '''
+    sql 中出现的表名(小写, 不含 schema), 子查询中的表也包括在内
+    解析不精确时只会多出表名, 多出的表名只导致多余的失效
+    '''
+    ret = _parsed.get(sql)
+    if ret is None:
+        ret = _parse_tables(sql)
+        if len(_parsed) >= MAX_PARSED:
+            _parsed.clear()
+        _parsed[sql] = ret
+    return ret
+
+def _key(sql, params):
+    if isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    return (sql, repr(params))
+
+class QueryCache(object):
+    '''
+    LRU + TTL 的查询结果缓存, 各线程共享
+    '''
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tables = set()
+        self.entries = OrderedDict()    # key -> (过期时间, 表名, 结果)
+        self.tags = {}                  # 表名 -> set(key)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0             # 每次失效加一, 查询期间发生过失效的结果不再放入缓存
+        self.epoch = uuid.uuid4().hex   # 进程重启后 data_version 不与之前的重复
+        self.versions = {}              # 表名 -> 写入次数
+
+    def cache_tables(self, *names):
+        '''
+        登记可缓存的表, 只涉及这些表的查询默认缓存
+        '''
+        self.tables.update([e.lower() for e in names])
+
+    def cacheable(self, sql):
+        if not self.tables:
+            return False
+        m_tables = tables_of(sql)
+        return bool(m_tables) and m_tables <= self.tables
+
+    def get(self, sql, params):
+        '''
+        @return    (是否命中, 结果)
+        '''
+        key = _key(sql, params)
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                self.entries[key] = entry
+                self.hits += 1
+                return True, list(entry[2])
+            if entry is not None:
+                self._untag(key, entry[1])
+            self.misses += 1
+            return False, None
+        finally:
+            self.lock.release()
+
+    def put(self, sql, params, result, ttl=None, generation=None):
+        '''
+        @param    generation    查询开始前的 self.generation
+        '''
+        key = _key(sql, params)
+        m_tables = tables_of(sql)
+        self.lock.acquire()
+        try:
+            if generation is not None and generation!=self.generation:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self._untag(key, old[1])
+            self.entries[key] = (time.time() + (ttl or self.ttl), m_tables, list(result))
+            for t in m_tables:
+                self.tags.setdefault(t, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                k, e = self.entries.popitem(last=False)
+                self._untag(k, e[1])
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def _untag(self, key, tables):
+        for t in tables:
+            keys = self.tags.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[t]
+
+    def invalidate(self, tables):
+        '''
+        清除涉及这些表的缓存
+        @return    清除的条数
+        '''
+        count = 0
+        self.lock.acquire()
+        try:
+            for t in tables:
+                self.versions[t] = self.versions.get(t, 0) + 1
+                for key in list(self.tags.get(t, ())):
+                    entry = self.entries.pop(key, None)
+                    if entry is not None:
+                        self._untag(key, entry[1])
+                        count += 1
+            self.invalidations += count
+            self.generation += 1
+        finally:
+            self.lock.release()
+        return count
+
+    def invalidate_sql(self, sql):
+        '''
+        写入语句执行后调用
+        没有缓存的结果时也要增加 generation 和表的写入次数, 写入前开始的查询结果不能再放入缓存
+        '''
+        return self.invalidate(tables_of(sql))
+
+    def data_version(self, tables):
+        '''
+        这些表的数据版本(导出缓存使用), 只反映经 invalidate 登记的写入
+        '''
+        self.lock.acquire()
+        try:
+            return (self.epoch, tuple([self.versions.get(t.lower(), 0) for t in tables]))
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.tags.clear()
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        m_total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': m_total and float(self.hits)/m_total or 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+query_cache = QueryCache()
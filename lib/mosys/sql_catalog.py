@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+sql语句目录: apps/sqlconfig.xml 配置的目录下存放sql语句的 xml 文件
+xml 文件只解析一次, 语句按 (文件名, id, app, 数据库类型) 建立索引; 文件修改后按 mtime 自动重新加载.
+部署时可保存为 pickle(python lib/mosys/sql_catalog.py [workspace]), 启动时直接加载, 不需要导入 lxml;
+文件的 mtime 变化但内容未变(如复制部署)时不重新解析
+
+语句中可以使用命名参数(:userid), 加载时切分为文本和参数, 执行时由 sql_utils.get_statement 转为驱动的占位符
+'''
+import os
+import re
+import sys
+import time
+import zlib
+import cPickle
+import logging
+import threading
+import traceback
+
+CONFIG_FILE = 'apps/sqlconfig.xml'
+PICKLE_FILE = 'apps/sqlcatalog.pickle'
+CHECK_INTERVAL = 2          # 检查文件修改的最小间隔(秒)
+DEFAULT_ENGINE = 'default'
+CATALOG_VERSION = 3         # pickle 格式版本, 与代码不一致时忽略 pickle
+
+logger = logging.getLogger('mosys.sql')
+
+# 引号内的文本, 命名参数(不含 :: 类型转换), part 位置 %(key)s
+_TOKEN = re.compile(r"""('(?:[^']|'')*'|"[^"]*")|(?<![:\w]):([A-Za-z_]\w*)|%\((\w+)\)s""")
+
+def tokenize(text):
+    '''
+    把sql文本切分为文本、命名参数 (':', name) 和 part 位置 ('%', key), 引号内的内容不切分
+    '''
+    ret = []
+    pos = 0
+    for m in _TOKEN.finditer(text):
+        if m.group(1):
+            continue
+        if m.start() > pos:
+            ret.append(text[pos:m.start()])
+        if m.group(2):
+            ret.append((':', m.group(2)))
+        else:
+            ret.append(('%', m.group(3)))
+        pos = m.end()
+    if pos < len(text):
+        ret.append(text[pos:])
+    return ret
+
+def compile_content(ele):
+    '''
+    <content> 节点转为字典
+    {"sql_text": content, "part": {"id1": part_content1, "id2": part_content2},
+     "tokens": tokenize(content), "part_tokens": {"id1": tokenize(part_content1), ...}}
+    '''
+    part = {}
+    sql_text = (ele.text or '').strip().replace("\n\t","  ").replace("\n","  ")
+    for p in ele.xpath("part"):
+        part[p.attrib["id"].strip()] = (p.text or '').strip()
+    part_tokens = dict([(k, tokenize(v)) for k,v in part.items()])
+    return {"sql_text":sql_text,"part":part,"tokens":tokenize(sql_text),"part_tokens":part_tokens}
+
+def parse_sql_file(path):
+    '''
+    解析存放sql语句的 xml 文件
+    @return    {sqlid: {engine: 语句字典}}, 同一 id 和 engine 有多个时取第一个;
+               不指定 id 时使用的各 engine 的第一条语句记在 None 下
+    '''
+    from lxml import etree
+    ret = {}
+    for sql in etree.parse(path).xpath("/sqlgroup/sql"):
+        sqlid = sql.get("id")
+        for content in sql.xpath("content"):
+            engine = content.get("engine")
+            m_dict = compile_content(content)
+            if sqlid is not None:
+                ret.setdefault(sqlid.strip(), {}).setdefault(engine, m_dict)
+            ret.setdefault(None, {}).setdefault(engine, m_dict)
+    return ret
+
+def parse_config(path):
+    '''
+    sqlconfig.xml 中的目录配置
+    @return    [(app, 目录)], 按配置顺序
+    '''
+    from lxml import etree
+    return [(e.get("app"), e.get("path")) for e in etree.parse(path).xpath("dirs/dir")]
+
+def _version(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def _crc(path):
+    f = open(path, 'rb')
+    try:
+        return zlib.crc32(f.read())
+    finally:
+        f.close()
+
+class CatalogFile(object):
+    '''
+    目录中的一个文件(sqlconfig.xml 或 sql 的 xml 文件), 文件不存在时 data 为 None
+    '''
+    def __init__(self, name, parse):
+        self.name = name        # 相对 workspace 的路径
+        self.parse = parse
+        self.version = None
+        self.crc = None
+        self.data = None
+
+    def to_dict(self):
+        '''
+        保存到 pickle 的内容, 只含基本类型, 加载时与模块的导入名称(sql_catalog 或 mosys.sql_catalog)无关
+        '''
+        return {'name':self.name, 'parse':self.parse.__name__, 'version':self.version,
+                'crc':self.crc, 'data':self.data}
+
+    @classmethod
+    def from_dict(cls, state):
+        ret = cls(state['name'], globals()[state['parse']])
+        ret.version, ret.crc, ret.data = state['version'], state['crc'], state['data']
+        return ret
+
+    def refresh(self, workspace):
+        '''
+        按 mtime 和大小检查文件, 内容变化时重新解析
+        @return    是否重新加载
+        '''
+        path = os.path.join(workspace, self.name)
+        version = _version(path)
+        if version==self.version:
+            return False
+        if version is None:
+            self.version, self.crc, self.data = None, None, None
+            return True
+        crc = _crc(path)
+        if crc==self.crc and self.data is not None:
+            self.version = version
+            return False
+        self.data = self.parse(path)
+        self.version, self.crc = version, crc
+        return True
+
+class SqlCatalog(object):
+    '''
+    sql语句目录, 各线程共享
+    '''
+    def __init__(self, workspace='.', config_file=CONFIG_FILE, check_interval=CHECK_INTERVAL):
+        self.workspace = workspace
+        self.check_interval = check_interval
+        self.config = CatalogFile(config_file, parse_config)
+        self.files = {}
+        self.index = {}
+        self.checked = 0
+        self.lock = threading.RLock()
+
+    def get(self, sqlfilename, sqlid, app, engine_name):
+        '''
+        查找sql语句
+        规则与原来逐次解析 xml 时相同:
+            1. 按 sqlconfig 中 dir 的配置顺序, 返回第一个含有该语句的文件中的语句
+            2. 同一文件中没有当前数据库类型的语句时, 取 engine="default" 的语句
+        @return    语句字典, 找不到时返回 None
+        '''
+        if time.time()-self.checked >= self.check_interval:
+            self.refresh()
+        key = (sqlfilename, sqlid, app, engine_name)
+        ret = self.index.get(key)
+        if ret is None:
+            self.lock.acquire()
+            try:
+                ret = self._find(sqlfilename, sqlid, app, engine_name)
+                if ret is not None:
+                    self.index[key] = ret
+            finally:
+                self.lock.release()
+        return ret
+
+    def _find(self, sqlfilename, sqlid, app, engine_name):
+        for name in self._sql_files(sqlfilename, app):
+            data = self._file(name).data
+            if not data:
+                continue
+            m_sql = data.get(sqlid) or {}
+            ret = m_sql.get(engine_name) or m_sql.get(DEFAULT_ENGINE)
+            if ret:
+                return ret
+        return None
+
+    def _sql_files(self, sqlfilename, app):
+        if self.config.version is None:
+            self.config.refresh(self.workspace)
+        return [os.path.join(d, sqlfilename+".xml") for a,d in (self.config.data or [])
+                if d and (not app or a==app)]
+
+    def _file(self, name):
+        ret = self.files.get(name)
+        if ret is None:
+            ret = CatalogFile(name, parse_sql_file)
+            ret.refresh(self.workspace)
+            self.files[name] = ret
+        return ret
+
+    def refresh(self):
+        '''
+        检查各文件是否修改, 有修改时清空索引
+        '''
+        self.lock.acquire()
+        try:
+            changed = self.config.refresh(self.workspace)
+            for f in self.files.values():
+                try:
+                    changed = f.refresh(self.workspace) or changed
+                except Exception:
+                    ''' 修改中的文件可能暂时无法解析, 保留原来的内容, 下次检查时重试 '''
+                    traceback.print_exc()
+            if changed:
+                self.index = {}
+            self.checked = time.time()
+        finally:
+            self.lock.release()
+
+    def load_all(self):
+        '''
+        加载配置目录下的全部 xml 文件(保存 pickle 前调用)
+        '''
+        self.refresh()
+        for a,d in self.config.data or []:
+            m_dir = os.path.join(self.workspace, d or '')
+            if d and os.path.isdir(m_dir):
+                for e in sorted(os.listdir(m_dir)):
+                    if e.endswith(".xml"):
+                        self._file(os.path.join(d, e))
+
+    def save(self, path):
+        self.lock.acquire()
+        try:
+            data = {"version":CATALOG_VERSION, "config":self.config.to_dict(),
+                    "files":[f.to_dict() for f in self.files.values()]}
+            f = open(path, 'wb')
+            try:
+                cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+        finally:
+            self.lock.release()
+
+    def load(self, path):
+        '''
+        加载 save 保存的目录, 第一次查找时仍会检查各文件是否修改
+        '''
+        f = open(path, 'rb')
+        try:
+            data = cPickle.load(f)
+        finally:
+            f.close()
+        if data.get("version")!=CATALOG_VERSION:
+            logger.warning(u"sql catalog %s has version %s, expected %s; rebuild it with sql_catalog.py",
+                           path, data.get("version"), CATALOG_VERSION)
+            return
+        config = CatalogFile.from_dict(data["config"])
+        files = dict([(e['name'], CatalogFile.from_dict(e)) for e in data["files"]])
+        self.lock.acquire()
+        try:
+            self.config = config
+            self.files = files
+            self.index = {}
+            self.checked = 0
+        finally:
+            self.lock.release()
+
+def load_catalog(workspace='.'):
+    '''
+    创建目录, 存在部署时保存的 pickle 时从 pickle 加载
+    '''
+    ret = SqlCatalog(workspace)
+    m_pickle = os.path.join(workspace, PICKLE_FILE)
+    if os.path.exists(m_pickle):
+        try:
+            ret.load(m_pickle)
+        except Exception:
+            logger.exception(u"cannot load sql catalog %s, parsing the xml files instead", m_pickle)
+    return ret
+
+def build(workspace='.'):
+    '''
+    部署时生成 pickle
+    '''
+    ret = SqlCatalog(workspace)
+    ret.load_all()
+    ret.save(os.path.join(workspace, PICKLE_FILE))
+    return ret
+
+if __name__=='__main__':
+    m_catalog = build(len(sys.argv)>1 and sys.argv[1] or '.')
+    print u"%d sql files saved to %s"%(len(m_catalog.files), PICKLE_FILE)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''
+分页和排序sql方言
+按数据库类型生成 Grid 的查询、计数、排序以及分页语句
+'''
+import re
+
+_WORD = re.compile(r"""'(?:[^']|'')*'|"[^"]*"|`[^`]*`|--[^\n]*|/\*.*?\*/|[()]|\w+""", re.S)
+_TAIL_KEYWORDS = set(['union', 'intersect', 'except', 'minus', 'order', 'limit', 'offset', 'fetch', 'for'])
+
+def is_plain_select(sql):
+    '''
+    sql 的最外层没有 union、order by、limit 等子句, 可以直接在后面追加排序和分页
+    引号、注释和括号(子查询)内的内容不检查; 误判只会多包一层派生表
+    '''
+    depth = 0
+    for m in _WORD.finditer(sql):
+        w = m.group(0)
+        if w=='(':
+            depth += 1
+        elif w==')':
+            depth -= 1
+        elif depth==0 and w.lower() in _TAIL_KEYWORDS:
+            return False
+    return True
+
+class SqlDialect(object):
+    '''
+    方言基类, 默认实现与数据库无关的部分
+    '''
+    name = None
+    multi_values = 0        # 一条 insert 最多插入的行数, 0 表示不支持多行 values
+    max_params = 2000       # 一条语句最多的绑定参数个数
+
+    def wrap(self, sql, where=None):
+        '''
+        在原始sql外包一层以便追加查询条件
+        @param    sql    原始sql语句
+        @param    where    追加的条件(不含where关键字)
+        '''
+        if where:
+            return 'select * from (%s) a where %s'%(sql, where)
+        return 'select * from (%s) a'%sql
+
+    def count(self, sql):
+        return 'select count(1) from (%s) m'%sql
+
+    def order_by(self, sortname, sortorder):
+        return 'order by %s %s'%(sortname, sortorder)
+
+    def ordered(self, sql, order):
+        '''
+        整体排序(不分页, 用于导出)
+        '''
+        return '%s %s'%(sql, order)
+
+    def page(self, sql, order, begin, pagesize):
+        '''
+        取 begin 之后的 pagesize 条记录
+        @param    sql    已包装好的查询语句
+        @param    order    order_by() 返回的排序子句
+        @param    begin    起始偏移(从0开始)
+        @param    pagesize    每页记录数
+        '''
+        raise NotImplementedError
+
+    def insert(self, table, columns, marks):
+        '''
+        insert 语句, marks 为每行的占位符列表, 多行时生成多行 values
+        '''
+        values = ','.join(['(%s)'%','.join(e) for e in marks])
+        return 'insert into %s (%s) values %s'%(table, ','.join(columns), values)
+
+    def insert_rows(self, column_count):
+        '''
+        一条 insert 插入的行数, 受行数和绑定参数个数限制; 不支持多行 values 时为 1
+        '''
+        if not self.multi_values:
+            return 1
+        return max(1, min(self.multi_values, self.max_params // max(1, column_count)))
+
+
+class RowNumberDialect(SqlDialect):
+    '''
+    row_number() over 分页, 用于 SQL Server(2005 起都支持, 包括 SQLEXPRESS)与 Oracle
+    '''
+    name = 'rownumber'
+
+    def page(self, sql, order, begin, pagesize):
+        return 'select * from (select a.*,row_number() over (%s) as r from (%s) a) t where t.r>%s and t.r<=%s'%(
+            order, sql, begin, begin + pagesize)
+
+
+class LimitOffsetDialect(SqlDialect):
+    '''
+    LIMIT/OFFSET 分页, 用于 MySQL、SQLite 和 PostgreSQL
+    无查询条件且最外层没有 union、order by、limit 等子句时不再包派生表, 数据库可以在取满一页后停止扫描
+    '''
+    name = 'limit'
+    multi_values = 1000
+    max_params = 999        # SQLite 默认的绑定参数上限
+
+    def wrap(self, sql, where=None):
+        if where or not is_plain_select(sql):
+            return super(LimitOffsetDialect, self).wrap(sql, where)
+        return sql
+
+    def page(self, sql, order, begin, pagesize):
+        return '%s %s limit %s offset %s'%(sql, order, pagesize, begin)
+
+
+class OffsetFetchDialect(SqlDialect):
+    '''
+    OFFSET/FETCH 分页, 用于 SQL Server 2012 及以上, 需设置 apps.db_dialect = 'sqlserver2012'
+    '''
+    name = 'offsetfetch'
+    multi_values = 1000     # table value constructor 最多 1000 行, 参数最多 2100 个
+
+    def page(self, sql, order, begin, pagesize):
+        return '%s %s offset %s rows fetch next %s rows only'%(sql, order, begin, pagesize)
+
+
+DIALECTS = {
+    'mysql': LimitOffsetDialect,
+    'sqlite': LimitOffsetDialect,
+    'postgresql': LimitOffsetDialect,
+    'sqlserver': RowNumberDialect,
+    'sqlserver2005': RowNumberDialect,
+    'sqlserver2012': OffsetFetchDialect,
+    'oracle': RowNumberDialect,
+}
+
+def get_dialect(engine_name):
+    u"""
+        @desc: 根据数据库类型获取分页方言
+        @params:
+            engine_name: type<str> 数据库类型, 见 sql_utils.get_curr_db_engine_name, 另外支持 'sqlserver2012'(OFFSET/FETCH)
+        @return: type<SqlDialect>
+    """
+    return DIALECTS.get(engine_name, RowNumberDialect)()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+按数据库的执行计划估算查询的记录数(GridModel.count_mode='estimate')
+不支持估算的数据库返回 None, 由调用方回退到精确计数
+plan 返回执行计划文本, 用于慢查询日志(sql_trace)
+'''
+import re
+
+def _execute(cur, sql, params=None):
+    if params:
+        cur.execute(sql, params)
+    else:
+        cur.execute(sql)
+
+class RowEstimator(object):
+    '''
+    不支持估算
+    '''
+    def estimate(self, cur, sql, params=None):
+        return None
+
+    def plan(self, cur, sql, params=None):
+        return None
+
+    def _explain(self, cur, sql, params=None, prefix='EXPLAIN'):
+        _execute(cur, '%s %s'%(prefix, sql), params)
+        return '\n'.join(['\t'.join([unicode(v) for v in r]) for r in cur.fetchall()])
+
+class MySQLEstimator(RowEstimator):
+    '''
+    EXPLAIN 第一行(驱动表或派生表)的 rows, 有 filtered 列时按过滤比例折算
+    '''
+    def estimate(self, cur, sql, params=None):
+        _execute(cur, 'EXPLAIN %s'%sql, params)
+        names = [d[0].lower() for d in cur.description]
+        row = cur.fetchone()
+        if not row or row[names.index('rows')] is None:
+            return None
+        ret = float(row[names.index('rows')])
+        if 'filtered' in names and row[names.index('filtered')] is not None:
+            ret = ret*float(row[names.index('filtered')])/100
+        return int(ret)
+
+    def plan(self, cur, sql, params=None):
+        return self._explain(cur, sql, params)
+
+class PostgresEstimator(RowEstimator):
+    '''
+    EXPLAIN 顶层节点的 rows=N
+    '''
+    def estimate(self, cur, sql, params=None):
+        _execute(cur, 'EXPLAIN %s'%sql, params)
+        row = cur.fetchone()
+        m = row and re.search(r'rows=(\d+)', row[0])
+        return m and int(m.group(1)) or None
+
+    def plan(self, cur, sql, params=None):
+        return self._explain(cur, sql, params)
+
+class MSSQLEstimator(RowEstimator):
+    '''
+    SHOWPLAN_XML 中语句的 StatementEstRows, 打开 SHOWPLAN 时语句只编译不执行
+    '''
+    def estimate(self, cur, sql, params=None):
+        cur.execute('SET SHOWPLAN_XML ON')
+        try:
+            _execute(cur, sql, params)
+            row = cur.fetchone()
+        finally:
+            cur.execute('SET SHOWPLAN_XML OFF')
+        m = row and re.search(r'StatementEstRows="([^"]+)"', row[0])
+        return m and int(float(m.group(1))) or None
+
+    def plan(self, cur, sql, params=None):
+        cur.execute('SET SHOWPLAN_TEXT ON')
+        try:
+            _execute(cur, sql, params)
+            return '\n'.join([r[0] for r in cur.fetchall()])
+        finally:
+            cur.execute('SET SHOWPLAN_TEXT OFF')
+
+class SqliteEstimator(RowEstimator):
+    '''
+    只提供执行计划
+    '''
+    def plan(self, cur, sql, params=None):
+        return self._explain(cur, sql, params, 'EXPLAIN QUERY PLAN')
+
+ESTIMATORS = {
+    'mysql': MySQLEstimator,
+    'postgresql': PostgresEstimator,
+    'sqlserver': MSSQLEstimator,
+    'sqlite': SqliteEstimator,
+}
+
+def get_estimator(engine_name):
+    return ESTIMATORS.get(engine_name, RowEstimator)()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+并发执行互不依赖的查询
+一个请求中的多个查询(Grid 的计数和当前页, 仪表盘的多个统计): 第一个在请求线程中执行, 其余交给共享的线程池,
+每个查询从连接池取自己的连接, 请求耗时接近最慢的一个查询而不是各查询之和.
+线程池只是额外的并发: 没有空闲线程时其余查询也在请求线程中顺序执行, 不排队等待线程池,
+其他用户的慢报表占满线程池时不会阻塞本请求.
+线程数 apps.parallel_workers(默认 PARALLEL_WORKERS) 应小于连接池的 maxconnections;
+在工作线程中再次调用时顺序执行, 避免线程池中的任务互相等待
+'''
+import threading
+
+PARALLEL_WORKERS = 8    # 执行查询的线程数
+
+_pool = None
+_pool_lock = threading.Lock()
+_size = 0           # 线程池的线程数
+_busy = 0           # 已提交未完成的任务数
+_local = threading.local()
+
+def _workers():
+    try:
+        import apps
+        return getattr(apps, 'parallel_workers', PARALLEL_WORKERS)
+    except ImportError:
+        return PARALLEL_WORKERS
+
+def _get_pool():
+    global _pool, _size
+    if _pool is None:
+        _pool_lock.acquire()
+        try:
+            if _pool is None:
+                from multiprocessing.pool import ThreadPool
+                _size = _workers()
+                _pool = ThreadPool(_size)
+        finally:
+            _pool_lock.release()
+    return _pool
+
+def _reserve():
+    '''
+    占用一个空闲线程, 没有空闲线程时返回 False
+    '''
+    global _busy
+    _pool_lock.acquire()
+    try:
+        if _busy >= _size:
+            return False
+        _busy += 1
+        return True
+    finally:
+        _pool_lock.release()
+
+def _release():
+    global _busy
+    _pool_lock.acquire()
+    try:
+        _busy -= 1
+    finally:
+        _pool_lock.release()
+
+def _submitted(task):
+    try:
+        return _call(task)
+    finally:
+        _release()
+
+def _call(task):
+    '''
+    在工作线程中执行一个任务, 语句计入发起请求的统计(见 sql_trace), 出错时返回异常对象
+    '''
+    from sql_trace import use_stats, current_stats
+    from sql_replica import primary_only
+    func,stats,primary = task
+    m_worker, m_stats = getattr(_local, 'worker', False), current_stats()
+    _local.worker = True
+    use_stats(stats)
+    try:
+        if primary:
+            with primary_only():
+                return func()
+        return func()
+    except Exception, e:
+        return e
+    finally:
+        use_stats(m_stats)
+        _local.worker = m_worker
+
+def run_all(funcs, primary=False):
+    '''
+    并发调用 funcs 中的函数(无参数)
+    @param    primary    True 时函数中的查询都使用主库(发起请求的用户刚写入过, 见 sql_replica)
+    @return    与 funcs 顺序一致的结果列表, 出错的函数对应其异常对象
+    '''
+    from sql_trace import current_stats
+    tasks = [(f, current_stats(), primary) for f in funcs]
+    if len(tasks) < 2 or getattr(_local, 'worker', False):
+        return [_call(t) for t in tasks]
+    pool = _get_pool()
+    ret = [None]*len(tasks)
+    pending = []
+    serial = [0]
+    for i in range(1, len(tasks)):
+        if _reserve():
+            pending.append((i, pool.apply_async(_submitted, (tasks[i],))))
+        else:
+            serial.append(i)
+    for i in serial:
+        ret[i] = _call(tasks[i])
+    for i, result in pending:
+        ret[i] = result.get()
+    return ret
+
+def date_ranges(start, end, parts):
+    '''
+    把 [start, end) 分为 parts 段, 用于按日期拆分统计查询
+    @return    [(low, high)], 每段为 low <= 日期 < high
+    '''
+    parts = max(int(parts), 1)
+    m_step = (end - start) / parts
+    if not m_step:
+        return [(start, end)]
+    ret = []
+    low = start
+    for i in range(parts):
+        if i==parts-1:
+            high = end
+        else:
+            high = low + m_step
+        ret.append((low, high))
+        low = high
+    return ret
+
+def value_ranges(values, parts):
+    '''
+    把一组值(如部门编号)排序后分为 parts 段, 用于按部门拆分统计查询
+    @return    [(low, high)], 每段为 low <= 值 <= high(between)
+    '''
+    m_values = sorted(set(values))
+    if not m_values:
+        return []
+    parts = max(min(int(parts), len(m_values)), 1)
+    ret = []
+    for i in range(parts):
+        chunk = m_values[i*len(m_values)//parts:(i+1)*len(m_values)//parts]
+        ret.append((chunk[0], chunk[-1]))
+    return ret
+
+def _sum(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+def _min(a, b):
+    if a is None or (b is not None and b < a):
+        return b
+    return a
+
+def _max(a, b):
+    if a is None or (b is not None and b > a):
+        return b
+    return a
+
+MERGE_OPS = {
+    'sum': _sum,        # sum 和 count 都用 sum 合并
+    'min': _min,
+    'max': _max,
+    'first': lambda a, b: a,
+}
+
+def merge_rows(results, keys=0, agg=None):
+    '''
+    合并各段的查询结果
+    @param    results    各段的结果(二维list)
+    @param    keys    前 keys 列为分组列, 分组列相同的行合并为一行
+    @param    agg    其余各列的合并方式(MERGE_OPS 中的名称), 如 ['sum', 'max'];
+                     为 None 时直接连接各段结果(各段的分组互不重叠, 如按部门拆分且按部门分组)
+                     avg 不能合并, 应分别查询 sum 和 count
+    @return    合并后的结果, 按分组第一次出现的顺序
+    '''
+    if agg is None:
+        ret = []
+        for rows in results:
+            ret.extend(rows)
+        return ret
+    ops = [MERGE_OPS[e] for e in agg]
+    merged = {}
+    order = []
+    for rows in results:
+        for row in rows:
+            key = tuple(row[:keys])
+            m_row = merged.get(key)
+            if m_row is None:
+                merged[key] = list(row)
+                order.append(key)
+                continue
+            for i, op in enumerate(ops):
+                m_row[keys+i] = op(m_row[keys+i], row[keys+i])
+    return [tuple(merged[k]) for k in order]
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+'''
+只读副本
+报表查询(p_query, p_iter, Grid 的查询)按轮询使用只读副本的连接池, 减少与事务写入争用主库;
+以下情况仍使用主库: 写入语句, primary_only() 范围内的查询(显式事务),
+以及用户自己写入后 sticky_seconds 秒内的查询(副本可能尚未同步)
+取连接失败, 或查询出错(驱动的 OperationalError, InterfaceError)且随后的探测语句也失败的副本暂停使用 retry_seconds 秒, 之后再次尝试;
+数据库支持时后台线程每 lag_interval 秒查询各副本的复制延迟, 延迟超过 max_lag 秒的副本暂不使用
+'''
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+
+STICKY_SECONDS = 5      # 用户写入后读主库的秒数
+RETRY_SECONDS = 30      # 不可用的副本暂停使用的秒数
+MAX_LAG = 30            # 副本允许的复制延迟(秒), 0 表示不检查
+LAG_INTERVAL = 10       # 检查复制延迟的间隔(秒)
+PROBE_SQL = "select 1"  # 查询出错后探测副本是否可用的语句
+
+# 查询副本复制延迟(秒)的语句, 按数据库类型; 结果为 NULL 表示复制已停止
+LAG_SQL = {
+    'mysql': "show slave status",
+    'postgresql': "select case when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0 "
+                  "else extract(epoch from now() - pg_last_xact_replay_timestamp()) end",
+    'sqlserver': "select secondary_lag_seconds from sys.dm_hadr_database_replica_states "
+                 "where is_local = 1 and database_id = db_id()",
+}
+
+_local = threading.local()
+
+def _current_user():
+    try:
+        from export_jobs import current_user
+        return current_user()
+    except Exception:
+        ''' 不在请求中(后台线程) '''
+        return ''
+
+@contextmanager
+def primary_only():
+    '''
+    范围内的查询都使用主库, 用于需要读到本事务写入结果的代码
+        with primary_only():
+            ...
+    '''
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+def _is_connection_error(pool, error):
+    '''
+    是否可能是连接级的错误(连接断开、数据库不可用)
+    部分驱动(pymssql, sqlite3)的 sql 错误也是 OperationalError, 需再用 PROBE_SQL 确认
+    '''
+    module = getattr(pool, '_creator', None)
+    types = tuple([getattr(module, e) for e in ('OperationalError', 'InterfaceError') if hasattr(module, e)])
+    return bool(types) and isinstance(error, types)
+
+def _probe(pool, sql):
+    '''
+    从连接池取一个连接执行 sql, 成功时返回 True
+    '''
+    conn = None
+    cur = None
+    try:
+        conn = pool.connection()
+        cur = conn.cursor()
+        cur.execute(sql)
+        cur.fetchall()
+        return True
+    except Exception:
+        return False
+    finally:
+        try:
+            if cur:
+                cur.close()
+        finally:
+            if conn:
+                conn.close()
+
+def _read_lag(cur, sql):
+    '''
+    执行 LAG_SQL, 返回延迟秒数, 复制已停止时返回 None
+    '''
+    cur.execute(sql)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    if sql=="show slave status":
+        names = [e[0].lower() for e in cur.description]
+        return row[names.index('seconds_behind_master')]
+    return row[0]
+
+class Replica(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.down_until = 0
+        self.failures = 0
+        self.lag = 0            # 最近一次检查的复制延迟(秒), None 表示复制已停止
+
+    def available(self, now, max_lag=0):
+        if max_lag and (self.lag is None or self.lag > max_lag):
+            return False
+        return self.down_until <= now
+
+class ReplicaSet(object):
+    '''
+    一组只读副本的连接池
+    '''
+    def __init__(self, pools=(), sticky_seconds=STICKY_SECONDS, retry_seconds=RETRY_SECONDS,
+                 max_lag=MAX_LAG, lag_sql=None, lag_interval=LAG_INTERVAL, probe_sql=PROBE_SQL):
+        '''
+        @param    lag_sql    查询复制延迟的语句(见 LAG_SQL), None 时不检查延迟
+        '''
+        self.replicas = [Replica(e) for e in pools]
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.max_lag = lag_sql and max_lag or 0
+        self.lag_sql = lag_sql
+        self.lag_interval = lag_interval
+        self.probe_sql = probe_sql
+        self.writes = {}        # 用户 -> 最近一次写入的时间
+        self.next = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def note_write(self):
+        '''
+        当前用户执行了写入
+        '''
+        if self.replicas:
+            self.writes[_current_user()] = time.time()
+
+    def use_primary(self):
+        if not self.replicas or getattr(_local, 'depth', 0):
+            return True
+        m_write = self.writes.get(_current_user())
+        if m_write is None:
+            return False
+        if time.time()-m_write < self.sticky_seconds:
+            return True
+        self.writes.pop(_current_user(), None)
+        return False
+
+    def choose(self):
+        '''
+        按轮询选择一个可用的副本, 应使用主库或没有可用副本时返回 None
+        '''
+        if self.use_primary():
+            return None
+        if self.max_lag and self.thread is None:
+            self.start()
+        now = time.time()
+        self.lock.acquire()
+        try:
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(self.next + i) % len(self.replicas)]
+                if replica.available(now, self.max_lag):
+                    self.next = (self.next + i + 1) % len(self.replicas)
+                    return replica
+        finally:
+            self.lock.release()
+        return None
+
+    def connection(self):
+        '''
+        副本的连接, 取连接失败时暂停该副本并尝试下一个
+        @return    (连接, 连接池), 没有可用副本时返回 (None, None)
+        '''
+        for i in range(len(self.replicas)):
+            replica = self.choose()
+            if replica is None:
+                break
+            try:
+                conn = replica.pool.connection()
+            except Exception:
+                self.mark_down(replica)
+                continue
+            replica.failures = 0
+            return conn, replica.pool
+        return None, None
+
+    def mark_down(self, replica):
+        replica.failures += 1
+        replica.down_until = time.time() + self.retry_seconds
+
+    def query_failed(self, pool, error):
+        '''
+        副本上的查询出错时调用, 连接级的错误暂停该副本; 探测语句能执行时是 sql 本身的错误, 不暂停
+        @return    是否暂停了副本, 是时调用方可改用主库重新查询
+        '''
+        for replica in self.replicas:
+            if replica.pool is pool:
+                if not self._broken(pool, error):
+                    return False
+                self.mark_down(replica)
+                return True
+        return False
+
+    def _broken(self, pool, error):
+        return _is_connection_error(pool, error) and not _probe(pool, self.probe_sql)
+
+    def start(self):
+        '''
+        启动检查复制延迟的后台线程(只启动一次)
+        '''
+        self.lock.acquire()
+        try:
+            if self.thread is None:
+                t = threading.Thread(target=self._run, name='replica-lag-check')
+                t.setDaemon(True)
+                t.start()
+                self.thread = t
+        finally:
+            self.lock.release()
+
+    def _run(self):
+        while True:
+            self.check_lag()
+            time.sleep(self.lag_interval)
+
+    def check_lag(self):
+        '''
+        查询各副本的复制延迟, 暂停中的副本也检查(恢复后的延迟)
+        '''
+        for replica in self.replicas:
+            conn = None
+            cur = None
+            try:
+                conn = replica.pool.connection()
+                cur = conn.cursor()
+                replica.lag = _read_lag(cur, self.lag_sql)
+            except Exception, e:
+                if conn is None or self._broken(replica.pool, e):
+                    self.mark_down(replica)
+                else:
+                    ''' 不支持的语句或没有权限: 不再按延迟排除该副本 '''
+                    replica.lag = 0
+                    traceback.print_exc()
+            finally:
+                try:
+                    if cur:
+                        cur.close()
+                finally:
+                    if conn:
+                        conn.close()
+
+    def status(self):
+        now = time.time()
+        return [{'available':e.available(now, self.max_lag), 'failures':e.failures, 'lag':e.lag}
+                for e in self.replicas]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+'''
+p_iter 使用的游标: 驱动支持时使用服务器端或不缓冲的游标, 结果集不需要全部读入内存,
+取到第一批记录就可以开始处理
+'''
+import uuid
+
+def raw_cursor(cur):
+    '''
+    连接池包装(SteadyDBCursor)下的驱动游标
+    '''
+    return getattr(cur, '_cursor', cur)
+
+class StreamCursor(object):
+    '''
+    驱动默认的游标
+    pymssql 和 sqlite3 的游标本身按需从服务器或数据库文件读取记录, fetchmany 不会读入全部结果
+    '''
+    def cursor(self, conn, chunk):
+        return conn.cursor()
+
+    def close(self, conn, cur):
+        cur.close()
+
+class MySQLStream(StreamCursor):
+    '''
+    MySQLdb 默认的游标在 execute 时读入全部结果, 改用 SSCursor(结果留在服务器端);
+    提前关闭时驱动会读完剩余的结果, 连接才能再次使用
+    '''
+    def cursor(self, conn, chunk):
+        from MySQLdb.cursors import SSCursor
+        return conn.cursor(SSCursor)
+
+class PostgresStream(StreamCursor):
+    '''
+    psycopg2 的命名游标即服务器端游标, fetchmany 每次 FETCH 一批;
+    命名游标只在事务内有效, 结束后回滚只读事务
+    '''
+    def cursor(self, conn, chunk):
+        return conn.cursor('p_iter_%s'%uuid.uuid4().hex)
+
+    def close(self, conn, cur):
+        try:
+            cur.close()
+        finally:
+            conn.rollback()
+
+class OracleStream(StreamCursor):
+    '''
+    cx_Oracle 按 arraysize 批量预取
+    '''
+    def cursor(self, conn, chunk):
+        cur = conn.cursor()
+        raw_cursor(cur).arraysize = chunk
+        return cur
+
+STREAMS = {
+    'mysql': MySQLStream,
+    'postgresql': PostgresStream,
+    'oracle': OracleStream,
+}
+
+def get_stream_support(engine_name):
+    return STREAMS.get(engine_name, StreamCursor)()
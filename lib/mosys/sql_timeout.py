@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+'''
+sql 查询的超时和取消
+优先使用驱动/数据库原生的语句超时; 看门狗线程在超时(或客户端取消)时调用驱动的取消接口,
+避免失控的查询长时间占用连接池的连接和工作线程
+'''
+import time
+import heapq
+import threading
+import traceback
+
+WATCHDOG_GRACE = 1      # 有原生超时时, 看门狗在超时后再等待的秒数
+
+class QueryTimeout(Exception):
+    '''
+    查询超时或被取消
+    '''
+    pass
+
+def raw_connection(conn):
+    '''
+    连接池包装(PooledDB -> SteadyDB)下的驱动连接
+    '''
+    while isinstance(getattr(conn, '__dict__', None), dict) and conn.__dict__.get('_con') is not None:
+        conn = conn.__dict__['_con']
+    return conn
+
+class StatementTimeout(object):
+    '''
+    没有原生语句超时的驱动: 只由看门狗调用 cancel
+    begin 的返回值作为 cancel 的 token
+    '''
+    native = False
+
+    def begin(self, con, cur, seconds):
+        return None
+
+    def end(self, con, cur):
+        pass
+
+    def cancel(self, con, token, pool=None):
+        if hasattr(con, 'cancel'):
+            con.cancel()
+            return True
+        return False
+
+class MySQLTimeout(StatementTimeout):
+    '''
+    MySQL 5.7.8+ 的 max_execution_time(只对 select 生效), 取消时另开连接执行 KILL QUERY
+    取消用的连接不经过连接池, 连接池耗尽时也能取消; 连接到查询所在的服务器(主库或只读副本)
+    '''
+    native = True
+
+    def begin(self, con, cur, seconds):
+        try:
+            cur.execute('SET SESSION max_execution_time = %d'%int(seconds*1000))
+        except Exception:
+            ''' 旧版本不支持, 只依靠看门狗 '''
+            pass
+        return con.thread_id()
+
+    def end(self, con, cur):
+        try:
+            cur.execute('SET SESSION max_execution_time = 0')
+        except Exception:
+            pass
+
+    def cancel(self, con, token, pool=None):
+        if pool is None:
+            from apps import dbpool as pool
+        m_connect = getattr(pool._creator, 'connect', pool._creator)
+        conn = m_connect(*pool._args, **pool._kwargs)
+        try:
+            conn.cursor().execute('KILL QUERY %d'%token)
+        finally:
+            conn.close()
+        return True
+
+class MSSQLTimeout(StatementTimeout):
+    '''
+    pymssql 的 query_timeout 是进程全局设置, 不能按语句修改; 超时由看门狗调用 _mssql 的 cancel
+    '''
+    def cancel(self, con, token, pool=None):
+        m_con = getattr(con, '_conn', con)
+        m_con.cancel()
+        return True
+
+class PostgresTimeout(StatementTimeout):
+    '''
+    PostgreSQL 的 statement_timeout
+    '''
+    native = True
+
+    def begin(self, con, cur, seconds):
+        cur.execute('SET statement_timeout = %d'%int(seconds*1000))
+
+    def end(self, con, cur):
+        try:
+            cur.execute('SET statement_timeout = 0')
+        except Exception:
+            ''' 超时后事务已中止, 回滚时 SET 也一并撤销 '''
+            con.rollback()
+
+class SqliteTimeout(StatementTimeout):
+    '''
+    sqlite3 用 interrupt() 中断查询
+    '''
+    def cancel(self, con, token, pool=None):
+        con.interrupt()
+        return True
+
+class OracleTimeout(StatementTimeout):
+    '''
+    cx_Oracle 7.2+ 的 callTimeout(毫秒)
+    '''
+    native = True
+
+    def begin(self, con, cur, seconds):
+        if hasattr(con, 'callTimeout'):
+            con.callTimeout = int(seconds*1000)
+
+    def end(self, con, cur):
+        if hasattr(con, 'callTimeout'):
+            con.callTimeout = 0
+
+TIMEOUTS = {
+    'mysql': MySQLTimeout,
+    'sqlserver': MSSQLTimeout,
+    'postgresql': PostgresTimeout,
+    'sqlite': SqliteTimeout,
+    'oracle': OracleTimeout,
+}
+
+def get_timeout_support(engine_name):
+    return TIMEOUTS.get(engine_name, StatementTimeout)()
+
+class RunningQuery(object):
+    '''
+    一个带超时的查询, 在 execute 前后调用 start/finish
+    '''
+    def __init__(self, support, conn, cur, timeout=None, key=None, pool=None):
+        self.support = support
+        self.pool = pool
+        self.con = raw_connection(conn)
+        self.cur = cur
+        self.timeout = timeout
+        self.key = key
+        self.token = None
+        self.deadline = None
+        self.cancelled = None       # 'timeout' 或 'cancel'
+        self.lock = threading.Lock()
+        self.done = False
+
+    def start(self):
+        if self.timeout:
+            self.token = self.support.begin(self.con, self.cur, self.timeout)
+            m_wait = self.timeout + (self.support.native and WATCHDOG_GRACE or 0)
+            self.deadline = time.time() + self.timeout
+            watchdog.watch(self, time.time() + m_wait)
+        if self.key:
+            registry.add(self)
+
+    def finish(self):
+        self.lock.acquire()
+        try:
+            self.done = True
+        finally:
+            self.lock.release()
+        if self.key:
+            registry.remove(self)
+        if self.timeout:
+            self.support.end(self.con, self.cur)
+
+    def cancel(self, reason='cancel'):
+        '''
+        从其他线程取消查询
+        '''
+        self.lock.acquire()
+        try:
+            if self.done or self.cancelled:
+                return False
+            self.cancelled = reason
+            try:
+                return self.support.cancel(self.con, self.token, self.pool)
+            except Exception:
+                traceback.print_exc()
+                return False
+        finally:
+            self.lock.release()
+
+    def expired(self):
+        '''
+        查询出错时判断是否因超时或取消导致
+        '''
+        return bool(self.cancelled) or (self.deadline is not None and time.time() >= self.deadline)
+
+    def error(self):
+        if self.cancelled=='cancel':
+            return QueryTimeout(u'查询已取消')
+        return QueryTimeout(u'查询超时(超过%s秒),请缩小查询范围'%self.timeout)
+
+class Watchdog(object):
+    '''
+    单个守护线程, 按截止时间取消未完成的查询
+    '''
+    def __init__(self):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def watch(self, query, deadline):
+        self.cond.acquire()
+        try:
+            heapq.heappush(self.heap, (deadline, id(query), query))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='sql-watchdog')
+                self.thread.setDaemon(True)
+                self.thread.start()
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def _run(self):
+        while True:
+            self.cond.acquire()
+            try:
+                while True:
+                    ''' 已完成的查询直接出堆 '''
+                    while self.heap and self.heap[0][2].done:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    m_wait = self.heap[0][0] - time.time()
+                    if m_wait <= 0:
+                        break
+                    self.cond.wait(m_wait)
+                query = heapq.heappop(self.heap)[2]
+            finally:
+                self.cond.release()
+            query.cancel('timeout')
+
+watchdog = Watchdog()
+
+class QueryRegistry(object):
+    '''
+    按客户端提供的查询编号登记执行中的查询, 客户端离开页面时据此取消
+    '''
+    def __init__(self):
+        self.queries = {}
+        self.lock = threading.Lock()
+
+    def add(self, query):
+        self.lock.acquire()
+        try:
+            self.queries.setdefault(query.key, []).append(query)
+        finally:
+            self.lock.release()
+
+    def remove(self, query):
+        self.lock.acquire()
+        try:
+            m_list = self.queries.get(query.key, [])
+            if query in m_list:
+                m_list.remove(query)
+            if not m_list:
+                self.queries.pop(query.key, None)
+        finally:
+            self.lock.release()
+
+    def cancel(self, key):
+        '''
+        @return    取消的查询数
+        '''
+        self.lock.acquire()
+        try:
+            m_list = list(self.queries.get(key, []))
+        finally:
+            self.lock.release()
+        return len([q for q in m_list if q.cancel()])
+
+registry = QueryRegistry()
+
+def cancel_query(key):
+    return registry.cancel(key)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+'''
+sql 执行统计
+每条语句记录耗时和行数(日志 mosys.sql, DEBUG 级别); 按请求累计语句数和数据库耗时, 附在 request.sql_stats
+和响应头 X-Sql-Count / X-Sql-Time 上; 慢查询连同执行计划记为 WARNING;
+同一形状(去掉常量后)的语句在一个请求中执行超过 REPEAT_LIMIT 次时警告(循环中逐条查询, 即 N+1 查询)
+'''
+import re
+import time
+import logging
+import threading
+import traceback
+
+SLOW_SECONDS = 1.0      # 慢查询的耗时(秒)
+REPEAT_LIMIT = 10       # 一个请求中同一形状的语句执行次数上限
+MAX_SHAPES = 2000       # shape 缓存的sql数
+
+logger = logging.getLogger('mosys.sql')
+
+_local = threading.local()
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_shapes = {}
+
+def shape(sql):
+    '''
+    语句形状: 字符串和数字常量替换为 ?, 合并空白
+    '''
+    ret = _shapes.get(sql)
+    if ret is None:
+        ret = _SPACE.sub(' ', _LITERAL.sub('?', sql)).strip()
+        if len(_shapes) >= MAX_SHAPES:
+            _shapes.clear()
+        _shapes[sql] = ret
+    return ret
+
+class RequestStats(object):
+    '''
+    一个请求中执行的语句统计
+    '''
+    def __init__(self, path=''):
+        self.path = path
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def add(self, sql, seconds, rows):
+        '''
+        @return    该形状的语句在本请求中的执行次数
+        '''
+        m_shape = shape(sql)
+        self.lock.acquire()
+        try:
+            self.count += 1
+            self.seconds += seconds
+            self.rows += max(rows or 0, 0)
+            ret = self.shapes.get(m_shape, 0) + 1
+            self.shapes[m_shape] = ret
+            return ret
+        finally:
+            self.lock.release()
+
+    def to_dict(self):
+        return {'path':self.path, 'count':self.count, 'seconds':round(self.seconds, 4), 'rows':self.rows}
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+def use_stats(stats):
+    '''
+    工作线程中执行的语句计入发起请求的统计, 结束时传入 None
+    '''
+    _local.stats = stats
+
+def begin_request():
+    from mole import request
+    stats = RequestStats(request.path)
+    _local.stats = stats
+    request.sql_stats = stats
+
+def end_request():
+    from mole import response
+    stats = current_stats()
+    _local.stats = None
+    if stats is None or not stats.count:
+        return
+    response.headers['X-Sql-Count'] = str(stats.count)
+    response.headers['X-Sql-Time'] = '%.1f'%(stats.seconds*1000)
+    logger.debug(u"request %(path)s: %(count)s statements, %(seconds)ss, %(rows)s rows", stats.to_dict())
+
+def record(kind, sql, params, seconds, rows=None, explain=None):
+    '''
+    记录一条执行完成的语句
+    @param    kind    调用方(query, execute, peewee ...)
+    @param    rows    返回或影响的行数
+    @param    explain    返回执行计划文本的函数, 只在慢查询时调用
+    '''
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(u"%s %.1fms rows=%s: %s params: %s", kind, seconds*1000, rows, sql, params)
+    stats = current_stats()
+    if stats is not None:
+        repeat = stats.add(sql, seconds, rows)
+        if repeat==REPEAT_LIMIT+1:
+            logger.warning(u"request %s: same statement executed more than %s times (N+1 query?): %s",
+                           stats.path, REPEAT_LIMIT, shape(sql))
+    if seconds >= SLOW_SECONDS:
+        plan = None
+        if explain is not None and _is_select(sql):
+            try:
+                plan = explain()
+            except Exception:
+                plan = traceback.format_exc()
+        logger.warning(u"slow %s %.3fs rows=%s: %s params: %s\nplan: %s", kind, seconds, rows, sql, params, plan)
+
+def _is_select(sql):
+    m_sql = sql.lstrip().lower()
+    return m_sql.startswith('select') or m_sql.startswith('with')
+
+def enable_console(level=logging.DEBUG):
+    '''
+    输出到控制台(开发时使用, 见 sql_utils.develop_model)
+    '''
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+PEEWEE_ENGINES = {
+    'MySQLDatabase': 'mysql',
+    'PostgresqlDatabase': 'postgresql',
+    'SqliteDatabase': 'sqlite',
+}
+
+def trace_peewee():
+    '''
+    peewee 的 Database.execute_sql 计入统计
+    '''
+    import peewee
+    if getattr(peewee.Database.execute_sql, 'traced', False):
+        return
+    m_execute = peewee.Database.execute_sql
+    def execute_sql(self, sql, params=None, require_commit=True):
+        m_start = time.time()
+        cursor = m_execute(self, sql, params, require_commit)
+        def explain():
+            from sql_estimate import get_estimator
+            return get_estimator(PEEWEE_ENGINES.get(self.__class__.__name__)).plan(self.get_conn().cursor(), sql, params)
+        record('peewee', sql, params, time.time()-m_start, cursor.rowcount, explain)
+        return cursor
+    execute_sql.traced = True
+    peewee.Database.execute_sql = execute_sql
+
+def install():
+    '''
+    注册请求开始和结束的钩子
+    '''
+    from mole.mole import hook
+    hook('before_request')(begin_request)
+    hook('after_request')(end_request)
+    trace_peewee()
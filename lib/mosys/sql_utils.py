@@ -1,17 +1,44 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
+import time
 import traceback;
-from lxml import etree
 
 
+import apps
 from apps import dbpool,workspace
+from sql_dialect import get_dialect
+from sql_timeout import QueryTimeout, RunningQuery, get_timeout_support
+from sql_estimate import get_estimator
+from sql_stream import get_stream_support
+from sql_cache import query_cache
+from sql_trace import record, enable_console, logger
+from sql_replica import ReplicaSet, primary_only, STICKY_SECONDS, MAX_LAG, LAG_SQL, PROBE_SQL
+from sql_parallel import run_all, merge_rows, date_ranges, value_ranges
+from sql_catalog import load_catalog, compile_content
 
 def getConn():
     return dbpool.connection()
 
+def _read_conn():
+    u"""
+        @desc: 只读查询的连接, 有可用的只读副本时按轮询使用副本(见 sql_replica), 否则使用主库
+        @return: (连接, 连接所属的连接池)
+    """
+    conn,pool = replicas.connection()
+    if conn is None:
+        return getConn(),dbpool
+    return conn,pool
+
+def getReadConn():
+    return _read_conn()[0]
+
 #from django.core.cache import cache
 TIMEOUT = 7*24*3600 #7天
-develop_model = True
+# True 时在控制台输出每条sql的耗时和行数(日志 mosys.sql 的 DEBUG 级别, 见 sql_trace)
+develop_model = False
+if develop_model:
+    enable_console()
 
 def get_curr_db_engine_name():
     u"""
@@ -33,61 +60,272 @@ def get_curr_db_engine_name():
         db_name = "mysql"
     return db_name
 curr_db_engine_name = get_curr_db_engine_name()
+# 分页方言, apps.db_dialect 可覆盖按数据库类型的默认选择
+curr_dialect = get_dialect(getattr(apps, 'db_dialect', None) or curr_db_engine_name)
+
+# 驱动的绑定参数风格(DB-API paramstyle)
+curr_paramstyle = getattr(dbpool._creator, 'paramstyle', 'format')
+
+# 驱动的语句超时和取消
+curr_timeout_support = get_timeout_support(curr_db_engine_name)
+# 按执行计划估算记录数
+curr_estimator = get_estimator(curr_db_engine_name)
+# p_iter 的服务器端游标
+curr_stream = get_stream_support(curr_db_engine_name)
+# 查询结果缓存, apps.query_cache_tables 中的表(部门、区域等基础数据)的查询默认缓存
+query_cache.cache_tables(*getattr(apps, 'query_cache_tables', ()))
+# 只读副本, apps.replica_pools 为副本的 PooledDB 列表, apps.replica_max_lag 为允许的复制延迟(秒)
+replicas = ReplicaSet(getattr(apps, 'replica_pools', ()), getattr(apps, 'replica_sticky_seconds', STICKY_SECONDS),
+                      max_lag=getattr(apps, 'replica_max_lag', MAX_LAG),
+                      lag_sql=getattr(apps, 'replica_lag_sql', LAG_SQL.get(curr_db_engine_name)),
+                      probe_sql=curr_db_engine_name=="oracle" and "select 1 from dual" or PROBE_SQL)
+# sql语句目录
+sql_catalog = load_catalog(workspace)
+
+def placeholder(index):
+    u"""
+        @desc: 第 index 个(从1开始)绑定参数在sql中的占位符
+    """
+    if curr_paramstyle == 'qmark':
+        return '?'
+    elif curr_paramstyle == 'numeric':
+        return ':%s'%index
+    elif curr_paramstyle == 'named':
+        return ':p%s'%index
+    return '%s'
+
+def bind_params(values):
+    u"""
+        @desc: 将按顺序收集的参数值转为驱动需要的参数对象
+        @params:
+            values: type<list> 与占位符顺序一致的参数值
+        @return: named 风格返回字典, 其他返回 tuple
+    """
+    if curr_paramstyle == 'named':
+        return dict([('p%s'%(i+1), v) for i, v in enumerate(values)])
+    return tuple(values)
+
+class Statement(object):
+    u"""
+        @desc: 编译为当前驱动占位符的sql语句(见 get_statement), 参数按名称绑定
+    """
+    def __init__(self,sql,names):
+        self.sql = sql
+        self.names = names
+
+    def bind(self,params=None):
+        u"""
+            @desc: 按占位符顺序取参数值
+            @params:
+                params: type<dict> 参数名和参数值
+            @return: 驱动需要的参数对象(见 bind_params), 语句没有参数时返回 None
+        """
+        if not self.names:
+            return None
+        params = params or {}
+        missing = [n for n in self.names if n not in params]
+        if missing:
+            raise Exception(u"========>参数错误:\n\t sql语句缺少参数 %s"%missing)
+        return bind_params([params[n] for n in self.names])
 
-def p_query(sql):
+    def __repr__(self):
+        return self.sql
+
+def _prepare(sql,params):
+    u"""
+        @desc: Statement 按名称绑定参数
+        @return: (sql, 驱动参数)
+    """
+    if isinstance(sql,Statement):
+        return sql.sql,sql.bind(params)
+    return sql,params
+
+def p_query(sql,params=None,timeout=None,qid=None,cache=None):
     """
         dbutils 数据连接池
                     只能 执行 数据查询 sql 语句, 否则会抛错 
         
-        @parm: 要执行的sql 语句
+        @parm: 要执行的sql 语句, 或 get_statement 返回的 Statement
+        @parm: params 绑定参数(见 bind_params),sql中有参数时 '%' 需写为 '%%'; sql 为 Statement 时为 {参数名:值}
+        @parm: timeout 超时秒数, 超时后取消查询并抛出 QueryTimeout
+        @parm: qid 查询编号, 可用 sql_timeout.cancel_query(qid) 取消, 取消后抛出 QueryTimeout
+        @parm: cache 结果缓存(见 sql_cache): None 只缓存涉及的表全部可缓存的查询, True 或秒数 缓存本次结果, False 不使用缓存
         @return:
             []: 查询结果为空
             None: sql 语句执行失败
                                 二维list: 正常结果
     """
-    if develop_model:
-        print u"p_query()=============>sql: %s"%sql
+    sql,params = _prepare(sql,params)
+    m_cache = cache is not False and (cache or query_cache.cacheable(sql))
+    if m_cache:
+        hit,res = query_cache.get(sql,params)
+        if hit:
+            return res
+        m_generation = query_cache.generation
     conn = None
-    cur = None
     res = None    
     try:
-        conn = getConn()
-        cur = conn.cursor()            
-        cur.execute(sql)
-        res = cur.fetchall()
+        conn,pool = _read_conn()
+        try:
+            res = _fetch_all(conn,pool,sql,params,timeout,qid)
+        except QueryTimeout:
+            raise
+        except Exception, e:
+            if not replicas.query_failed(pool,e):
+                raise
+            ''' 副本的连接出错, 已暂停该副本, 改用主库重新查询 '''
+            traceback.print_exc()
+            m_conn,conn = conn,None
+            m_conn.close()
+            conn,pool = getConn(),dbpool
+            res = _fetch_all(conn,pool,sql,params,timeout,qid)
+    except QueryTimeout:
+        raise
     except:
         traceback.print_exc()
     finally:
-        if cur:
-            cur.close()
         if conn:
             conn.close()
+    if m_cache and res is not None:
+        query_cache.put(sql,params,res,cache is not True and cache or None,m_generation)
+    return res
+    
+    
+def _fetch_all(conn,pool,sql,params,timeout,qid):
+    u"""
+        @desc: p_query 在一个连接上执行查询, 超时或被取消时抛出 QueryTimeout
+        @return: 二维list
+    """
+    cur = conn.cursor()
+    query = None
+    try:
+        if timeout or qid:
+            query = RunningQuery(curr_timeout_support,conn,cur,timeout,qid,pool)
+            query.start()
+        m_start = time.time()
+        try:
+            if params:
+                cur.execute(sql,params)
+            else:
+                cur.execute(sql)
+            res = cur.fetchall()
+        finally:
+            if query:
+                query.finish()
+        record('query',sql,params,time.time()-m_start,len(res),lambda: curr_estimator.plan(cur,sql,params))
         return res
+    except:
+        if query and query.expired():
+            raise query.error()
+        raise
+    finally:
+        cur.close()
+    
+def p_iter(sql,params=None,chunk=500):
+    """
+        dbutils 数据连接池
+                    逐行迭代查询结果,用 fetchmany 每次读取 chunk 条,适合大结果集的导出
+                    驱动支持时使用服务器端游标(见 sql_stream), 结果不会全部读入内存
+                    迭代期间占用一个连接,迭代结束、生成器关闭或出错时归还连接
+        
+        @parm: 要执行的sql 语句
+        @parm: params 绑定参数
+        @parm: chunk 每次从游标读取的记录数
+        @return: 生成器,每次返回一条记录; sql执行出错时抛出异常
+    """
+    sql,params = _prepare(sql,params)
+    conn = None
+    cur = None
+    pool = None
+    try:
+        conn,pool = _read_conn()
+        cur = curr_stream.cursor(conn,chunk)
+        m_start = time.time()
+        if params:
+            cur.execute(sql,params)
+        else:
+            cur.execute(sql)
+        record('iter',sql,params,time.time()-m_start)
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            for r in rows:
+                yield r
+    except Exception, e:
+        ''' 已返回部分记录, 不能改用主库重试, 只暂停出错的副本 '''
+        replicas.query_failed(pool,e)
+        raise
+    finally:
+        try:
+            if cur:
+                curr_stream.close(conn,cur)
+        finally:
+            if conn:
+                conn.close()
     
+def p_estimate(sql,params=None):
+    """
+        dbutils 数据连接池
+                    按执行计划估算查询的记录数, 不执行查询本身
+        
+        @parm: 要估算的sql 语句
+        @parm: params 绑定参数
+        @return:
+            None: 数据库不支持估算或估算失败
+            number: 估算的记录数
+    """
+    sql,params = _prepare(sql,params)
+    conn = None
+    cur = None
+    res = None
+    pool = None
+    try:
+        conn,pool = _read_conn()
+        cur = conn.cursor()
+        m_start = time.time()
+        res = curr_estimator.estimate(cur,sql,params)
+        record('estimate',sql,params,time.time()-m_start,res)
+    except:
+        replicas.query_failed(pool,sys.exc_info()[1])
+        traceback.print_exc()
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+    return res
     
-def p_query_one(sql):
+def p_query_one(sql,params=None):
     """
         dbutils 数据连接池
                     只能 执行 数据查询 sql 语句, 否则会抛错 
         
                 执行sql查询语句,获取第一条记录
         @parm: 要执行的sql 语句
+        @parm: params 绑定参数
         @return:
             []: 查询结果为空
             None: sql 语句执行失败
             list: 正常结果
     """
-    if develop_model:
-        print u"p_query_one()=============>sql: %s"%sql
+    sql,params = _prepare(sql,params)
     conn = None
     cur = None
     res = None    
+    pool = None
     try:
-        conn = getConn()
+        conn,pool = _read_conn()
         cur = conn.cursor()            
-        cur.execute(sql)
+        m_start = time.time()
+        if params:
+            cur.execute(sql,params)
+        else:
+            cur.execute(sql)
         res = cur.fetchone()
+        record('query_one',sql,params,time.time()-m_start,res and 1 or 0,lambda: curr_estimator.plan(cur,sql,params))
     except:
+        replicas.query_failed(pool,sys.exc_info()[1])
         traceback.print_exc()
     finally:
         if cur:
@@ -96,27 +334,76 @@ def p_query_one(sql):
             conn.close()
         return res
     
-def p_execute(sql):
+def _parallel_args(query):
+    if isinstance(query,(tuple,list)):
+        return tuple(query)+(None,)*(3-len(query))
+    return query,None,None
+
+def run_parallel(queries,timeout=None,qid=None,cache=None):
+    u"""
+        @desc: 并发执行互不依赖的查询(见 sql_parallel), 每个查询使用自己的连接, 耗时接近最慢的一个查询
+        @params:
+            queries: type<list> 每项为 sql、Statement、(sql, params) 或 (sql, params, timeout)
+            timeout: 未单独指定超时的查询的超时秒数
+            qid: 查询编号, sql_timeout.cancel_query(qid) 取消全部查询
+            cache: 同 p_query
+        @return: 与 queries 顺序一致的结果列表, 每项与 p_query 的返回值相同;
+                 有查询超时或被取消时等全部查询结束后抛出 QueryTimeout
+    """
+    def task(query):
+        sql,params,m_timeout = _parallel_args(query)
+        return lambda: p_query(sql,params,m_timeout or timeout,qid,cache)
+    res = run_all([task(q) for q in queries],replicas.use_primary())
+    for r in res:
+        if isinstance(r,QueryTimeout):
+            raise r
+    return [None if isinstance(r,Exception) else r for r in res]
+
+def p_query_partitioned(sql,partitions,keys=0,agg=None,timeout=None,qid=None):
+    u"""
+        @desc: 把大的统计查询按部门或日期范围拆分后并发执行, 合并各段的结果
+            stmt = get_statement(sqlfilename,sqlid)
+            ranges = date_ranges(start,end,4)
+            p_query_partitioned(stmt,[dict(params,low=a,high=b) for a,b in ranges],keys=1,agg=['sum','max'])
+        @params:
+            sql: 含范围参数的sql 或 Statement, 如 ... where checktime >= :low and checktime < :high
+            partitions: type<list> 各段的参数, 用 date_ranges(日期, 左闭右开) 或 value_ranges(部门编号, between) 生成范围
+            keys, agg: 合并方式, 见 sql_parallel.merge_rows
+        @return: 合并后的结果, 任何一段执行失败时返回 None
+    """
+    res = run_parallel([(sql,p) for p in partitions],timeout,qid,False)
+    if None in res:
+        return None
+    return merge_rows(res,keys,agg)
+
+def p_execute(sql,params=None):
     """
         dbutils 数据连接池
                     执行 数据操作语句, 包括  update,insert,delete    
                         
         @parm: 要执行的sql 语句
+        @parm: params 绑定参数
         @return:
             None: sql 语句执行失败
             number: 影响记录条数
     """
-    if develop_model:
-        print u"p_execute()=============>sql: %s"%sql
+    sql,params = _prepare(sql,params)
     conn = None
     cur = None
     res = None 
     try:
         conn =  getConn()
         cur = conn.cursor()            
-        cur.execute(sql)
+        m_start = time.time()
+        if params:
+            cur.execute(sql,params)
+        else:
+            cur.execute(sql)
         res = cur._cursor.rowcount
         conn.commit()
+        replicas.note_write()
+        record('execute',sql,params,time.time()-m_start,res)
+        query_cache.invalidate_sql(sql)
     except:
         if conn:
             conn.rollback()
@@ -143,16 +430,19 @@ def p_mutiexec(sql_list):
     cur = None
     res = []
     flag = True
-    if develop_model:
-        print u"p_mutiexec()=============>sql: %s"%sql_list
     try:
         conn = getConn()
         cur = conn.cursor()
         for sql in  sql_list:           
+            m_start = time.time()
             cur.execute(sql)
             num = cur._cursor.rowcount
+            record('mutiexec',sql,None,time.time()-m_start,num)
             res.append(num)
         conn.commit()
+        replicas.note_write()
+        for sql in sql_list:
+            query_cache.invalidate_sql(sql)
     except:
         flag = False
         if conn:
@@ -166,6 +456,136 @@ def p_mutiexec(sql_list):
         return flag,res
     
 
+def _batches(rows,batch_size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _rowcount(cur,default):
+    count = cur._cursor.rowcount
+    if count is None or count < 0:
+        return default
+    return count
+
+def p_executemany(sql,rows,batch_size=1000):
+    """
+        dbutils 数据连接池
+                    同一语句批量执行多组参数(驱动的 executemany), 每批提交一次
+                        
+        @parm: 要执行的sql 语句, 或 get_statement 返回的 Statement
+        @parm: rows 参数列表, 每项为与占位符顺序一致的值列表; sql 为 Statement 时为 {参数名:值}
+        @parm: batch_size 每批的行数
+        @return:
+            (flag,res):
+                    flag<True or False>:是否全部执行成功
+                    res<list> : 已提交的每批影响的行数, 出错时出错的批次已回滚, 之前的批次已提交
+    """
+    if isinstance(sql,Statement):
+        m_sql,m_bind = sql.sql,sql.bind
+    else:
+        m_sql,m_bind = sql,bind_params
+    conn = None
+    cur = None
+    res = []
+    flag = True
+    try:
+        conn = getConn()
+        cur = conn.cursor()
+        for batch in _batches(rows,batch_size):
+            try:
+                m_start = time.time()
+                cur.executemany(m_sql,[m_bind(r) for r in batch])
+                count = _rowcount(cur,len(batch))
+                conn.commit()
+                record('executemany',m_sql,None,time.time()-m_start,count)
+            except:
+                conn.rollback()
+                raise
+            finally:
+                replicas.note_write()
+                query_cache.invalidate_sql(m_sql)
+            res.append(count)
+    except:
+        flag = False
+        traceback.print_exc()
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+    return flag,res
+
+def p_bulk_insert(table,columns,rows,batch_size=500):
+    """
+        dbutils 数据连接池
+                    批量插入, 数据库支持时一条 insert 插入多行(多行 values), 否则使用驱动的 executemany; 每批提交一次
+                        
+        @parm: table 表名
+        @parm: columns 字段名列表
+        @parm: rows 数据, 每项为与 columns 顺序一致的值列表
+        @parm: batch_size 每批(每次提交)的行数
+        @return:
+            (flag,res): 同 p_executemany
+    """
+    m_size = curr_dialect.insert_rows(len(columns))
+    m_single = curr_dialect.insert(table,columns,[[placeholder(i+1) for i in range(len(columns))]])
+    conn = None
+    cur = None
+    res = []
+    flag = True
+    try:
+        conn = getConn()
+        cur = conn.cursor()
+        for batch in _batches(rows,batch_size):
+            try:
+                m_start = time.time()
+                if m_size==1:
+                    cur.executemany(m_single,[bind_params(r) for r in batch])
+                    count = _rowcount(cur,len(batch))
+                else:
+                    count = 0
+                    for part in _batches(batch,m_size):
+                        cur.execute(_insert_sql(table,columns,len(part)),bind_params([v for r in part for v in r]))
+                        count += _rowcount(cur,len(part))
+                conn.commit()
+                record('bulk_insert',m_single,None,time.time()-m_start,count)
+            except:
+                conn.rollback()
+                raise
+            finally:
+                replicas.note_write()
+                query_cache.invalidate_sql(m_single)
+            res.append(count)
+    except:
+        flag = False
+        traceback.print_exc()
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+    return flag,res
+
+_insert_sqls = {}
+
+def _insert_sql(table,columns,count):
+    u"""
+        @desc: count 行的多行 insert 语句, 相同表和行数的语句只生成一次
+    """
+    key = (table,tuple(columns),count)
+    ret = _insert_sqls.get(key)
+    if ret is None:
+        n = len(columns)
+        marks = [[placeholder(i*n+j+1) for j in range(n)] for i in range(count)]
+        ret = curr_dialect.insert(table,columns,marks)
+        _insert_sqls[key] = ret
+    return ret
+
 def get_sql_exe_result(sql,params=None):
     if params:
         sql = sql%params
@@ -179,6 +599,7 @@ def get_sql_file_dir(config_file,app = None):
                 app: type<str> ,指定的app名称,参考 sqlconfig中的配置
             @return : type<list> sql 的 xml文件 所在目录列表
     """
+    from lxml import etree
     file_dir_list = []
     xpath_exp = "dirs/dir/@path"
     if app:
@@ -200,8 +621,8 @@ def get_sql_file(dir_list,sqlfile):
     for file in dir_list:
         if os.path.exists(workspace+"/"+file+"/"+sqlfile+".xml"):
             sql_xml_files.append(workspace+"/"+file+"/"+sqlfile+".xml")
-    if develop_model and not sql_xml_files:
-        print u"========> 无法得到指定的存放 sql语句的xml文件!" 
+    if not sql_xml_files:
+        logger.debug(u"========> 无法得到指定的存放 sql语句的xml文件!")
     return sql_xml_files
 
 def get_sql_by_dict(ele_dict,params={},id_part={},only_content=False):
@@ -256,6 +677,7 @@ def  get_sql_ele_content(sqlfiles,engine_name=curr_db_engine_name,sqlid=None):
                 sqlid: type(str), sql语句的sql标签 id
             @return: type<Ele> sql语句节点
     """
+    from lxml import etree
     sql_ele = None
     for f in sqlfiles:
         if os.path.exists(f):
@@ -302,13 +724,61 @@ def update_ele_to_dict(sql_ele):
             }
         }
     """
-    part = {}
-    sql_text = sql_ele.text.strip().replace("\n\t","  ").replace("\n","  ")
-    part_ele = sql_ele.xpath("part")
-    for p in part_ele:
-        part[p.attrib["id"].strip()] = p.text.strip()
-    return {"sql_text":sql_text,"part":part}
+    return compile_content(sql_ele)
   
+_statements = {}
+
+def get_statement(sqlfilename,sqlid=None,app=None,parts=None):
+    u"""
+        @desc: 获取使用命名参数(:name)的sql语句, 命名参数转为当前驱动的占位符, 参数值在执行时绑定
+                    同一语句和同一组 part 每次得到相同的sql文本, 数据库可以缓存执行计划
+        @params:
+            sqlfilename, sqlid, app: 同 get_sql
+            parts: type<dict> 启用的 part, 格式同 get_sql 的 id_part, 未启用的 part 位置为空;
+                   part 中的命名参数只在启用时需要; 启用的 part 中不能有 %(name)s, 否则抛出 ValueError
+        @return: Statement, 用于 p_query 等: p_query(get_statement("sqls","emp_select"),{"userid":1})
+    """
+    parts = parts or {}
+    m_parts = tuple(sorted([(k, tuple(v if isinstance(v,(list,tuple)) else [v])) for k,v in parts.items()]))
+    key = (sqlfilename,sqlid,app,m_parts)
+    sql_dict = sql_catalog.get(sqlfilename,sqlid,app,curr_db_engine_name)
+    if sql_dict is None:
+        raise Exception(u"========> 无法得到 sql语句: %s.%s"%(sqlfilename,sqlid))
+    m_cached = _statements.get(key)
+    if m_cached and m_cached[0] is sql_dict:
+        return m_cached[1]
+    ret = _compile_statement(sql_dict,dict(m_parts))
+    _statements[key] = (sql_dict,ret)
+    return ret
+
+def _compile_statement(sql_dict,parts):
+    u"""
+        @desc: 拼接启用的 part, 命名参数替换为占位符
+    """
+    segments = []
+    for t in sql_dict["tokens"]:
+        if isinstance(t,tuple) and t[0]=='%':
+            for part_id in parts.get(t[1],()):
+                for e in sql_dict["part_tokens"].get(part_id,[]):
+                    if isinstance(e,tuple) and e[0]=='%':
+                        raise ValueError(u"part %s 中的 %%(%s)s 不能用于 get_statement, 应改为命名参数(:name)"%(part_id,e[1]))
+                    segments.append(e)
+                segments.append(" ")
+        else:
+            segments.append(t)
+    names = [t[1] for t in segments if isinstance(t,tuple)]
+    ''' 有参数时 format 风格的驱动会格式化sql, 文本中的 % 需要转义 '''
+    escape = names and curr_paramstyle in ('format','pyformat')
+    sql = []
+    index = 0
+    for t in segments:
+        if isinstance(t,tuple):
+            index += 1
+            sql.append(placeholder(index))
+        else:
+            sql.append(escape and t.replace('%','%%') or t)
+    return Statement(''.join(sql),names)
+
 def get_sql(sqlfilename,sqlid=None,app = None,params={},id_part={},only_content=False):
     u"""
         @desc:获取sql语句内容
@@ -321,29 +791,13 @@ def get_sql(sqlfilename,sqlid=None,app = None,params={},id_part={},only_content=
             only_content: 如果设置为True,则直接返回 xml中的content 内容,不会进行参数匹配
         @return: 根据条件筛选出来的 sql 语句
     """
-    if develop_model:
-        print u"""===========> The params you given is:
-            sqlfilename:%s
-            sqlid:%s
-            app:%s
-            params:%s
-            id_part:%s
-            only_content:%s
-        """%(str(sqlfilename),str(sqlid),str(app),str(params),str(id_part),str(only_content))
     sql = " "
     try: 
-        key = "%s_%s_%s"%(sqlfilename,sqlid,app)
-        sql_dict = None#cache.get(key)
-        if  not sql_dict: 
-            sql_ele = get_sql_ele(sqlfilename,sqlid,app)
-            sql_dict = update_ele_to_dict(sql_ele)
-            #cache.set(key,sql_dict,TIMEOUT)
-        else:
-            if develop_model:
-                print "===========>The sql is come from cache."
+        sql_dict = sql_catalog.get(sqlfilename,sqlid,app,curr_db_engine_name)
+        if sql_dict is None:
+            raise Exception(u"========> 无法得到 sql语句: %s.%s"%(sqlfilename,sqlid))
         sql = get_sql_by_dict(sql_dict,params,id_part,only_content)
     except:
         traceback.print_exc()    
-    if develop_model:
-         print u"============> sql_result:\n\t%s"%sql
+    logger.debug(u"get_sql %s.%s params: %s id_part: %s => %s",sqlfilename,sqlid,params,id_part,sql)
     return sql
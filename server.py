@@ -22,4 +22,6 @@ app = SessionMiddleware(app=apps.app, cookie_key=apps.COOKIE_KEY,no_datastore=Tr
 #运行服务器
 from mole import run
 if __name__  == "__main__":
+    #预先建立空闲连接, 连接失败时只记录日志, 首次请求时再连接
+    apps.dbpool.warmup()
     run(app=app,host='localhost', port=8081)
\ No newline at end of file
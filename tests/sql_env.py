@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''
+测试用的 sql_utils: 用 sqlite3 的 PooledDB 代替 apps.dbpool, 不需要数据库服务器和 apps 的依赖
+'''
+import os
+import sys
+import types
+import sqlite3
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (os.path.join(ROOT, 'lib'), os.path.join(ROOT, 'lib', 'mosys')):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+WORKSPACE = tempfile.mkdtemp()
+DATABASE = os.path.join(WORKSPACE, 'test.db')
+
+def load_sql_utils():
+    '''
+    第一次调用时安装测试用的 apps 模块并导入 sql_utils
+    '''
+    if 'sql_utils' not in sys.modules:
+        from DBUtils.PooledDB import PooledDB
+        apps = types.ModuleType('apps')
+        apps.dbpool = PooledDB(sqlite3, 0, 4, database=DATABASE, check_same_thread=False)
+        apps.workspace = WORKSPACE
+        sys.modules['apps'] = apps
+    import sql_utils
+    return sql_utils
+
+def execute(*statements):
+    conn = sqlite3.connect(DATABASE)
+    try:
+        for e in statements:
+            conn.execute(e)
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+column_store.ColumnStore 的过滤、排序、取数, 以及 GridBase 的内存数据查询
+'''
+import unittest
+
+import sql_env
+
+ITEMS = [{'name': u'张三', 'dept': 'IT', 'age': 30},
+         {'name': 'Bob', 'dept': 'it', 'age': 25},
+         {'name': 'alice', 'dept': 'HR', 'age': 41},
+         {'name': u'李四', 'age': 25}]
+
+class ColumnStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        from column_store import ColumnStore
+        self.store = ColumnStore.from_items(['name', 'dept', 'age'], ITEMS)
+
+    def test_from_items(self):
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(list(self.store)[3], {'name': u'李四', 'dept': '', 'age': 25})
+
+    def test_equal_and_match(self):
+        self.assertEqual(self.store.equal('dept', 'it'), [0, 1])
+        self.assertEqual(self.store.equal('age', 25), [1, 3])
+        self.assertEqual(self.store.match('name', 'LI'), [2])
+        self.assertEqual(self.store.match('name', u'张'), [0])
+        self.assertEqual(self.store.equal('age', 25, self.store.equal('dept', 'IT')), [1])
+
+    def test_argsort_is_stable_and_cached(self):
+        self.assertEqual(self.store.argsort('age'), [1, 3, 0, 2])
+        self.assertEqual(self.store.argsort('age', desc=True), [2, 0, 3, 1])
+        self.assertTrue(self.store.argsort('age') is self.store.argsort('age'))
+        self.assertEqual(self.store.argsort('age', index=[0, 3, 2]), [3, 0, 2])
+
+    def test_take_and_rows(self):
+        index = self.store.argsort('age')
+        self.assertEqual([e['name'] for e in self.store.take(index, 1, 3)], [u'李四', u'张三'])
+        self.assertEqual(self.store.take(None, 3, 10, ['age']), [{'age': 25}])
+        self.assertEqual(self.store.take([], 0, 10), [])
+        self.assertEqual(list(self.store.rows(index, ['age'], chunk=3)), [[25], [25], [30], [41]])
+
+    def test_add(self):
+        store = self.store + [{'name': 'Eve', 'dept': 'IT', 'age': 19}]
+        self.assertEqual(len(store), 5)
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(store.equal('dept', 'it'), [0, 1, 4])
+        self.assertEqual(store.argsort('age')[0], 4)
+
+    def test_strings_are_shared(self):
+        from column_store import ColumnStore
+        store = ColumnStore.from_items(['a'], [{'a': ''.join(['x', 'y'])}, {'a': ''.join(['x', 'y'])}])
+        self.assertTrue(store.columns['a'][0] is store.columns['a'][1])
+
+class GridItemsTest(unittest.TestCase):
+
+    def setUp(self):
+        from grid_utils import GridBase
+        self.grid = GridBase([('name', u'姓名'), ('dept', u'部门'), ('age', u'年龄')], pagesize=2)
+        self.grid.CalculateItems = list(ITEMS)
+
+    def test_filter_sort_page(self):
+        self.grid.FilterItems('age', 25)
+        self.grid.SortItems('name', 'desc')
+        self.assertEqual([e['name'] for e in self.grid._PageItems(0, 2)], [u'李四', 'Bob'])
+        self.assertEqual(self.grid._PageItems(2, 4), [])
+
+    def test_unfiltered_list_is_sliced(self):
+        self.assertEqual(self.grid._PageItems(1, 3), ITEMS[1:3])
+
+    def test_store_follows_new_items(self):
+        store = self.grid.GetStore()
+        self.assertTrue(self.grid.GetStore() is store)
+        self.grid.CalculateItems = ITEMS[:1]
+        self.assertEqual(len(self.grid.GetStore()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
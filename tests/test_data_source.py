@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+data_source 的版本缓存和文件增量解析
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import sql_env
+
+class DataSourceTest(unittest.TestCase):
+
+    def test_cached_by_version(self):
+        from data_source import DataSource
+        state = {'version': 1, 'loads': 0}
+        def load():
+            state['loads'] += 1
+            return [{'a': state['version']}]
+        source = DataSource(load, lambda: state['version'])
+        items = source.get()
+        self.assertTrue(source.get() is items)
+        state['version'] = 2
+        self.assertEqual(source.get(), [{'a': 2}])
+        source.invalidate()
+        source.get()
+        self.assertEqual(state['loads'], 3)
+
+    def test_none_version_is_not_cached(self):
+        from data_source import DataSource
+        source = DataSource(lambda: [1], lambda: None)
+        self.assertFalse(source.get() is source.get())
+
+class FileDataSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'data.txt')
+        self.starts = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def parse(self, f):
+        ''' 每行一条记录, 没有换行符的最后一行留到下次 '''
+        end = f.tell()
+        self.starts.append(end)
+        rows = []
+        for line in iter(f.readline, ''):
+            if not line.endswith('\n'):
+                break
+            end += len(line)
+            rows.append({'name': line.strip()})
+        return rows, end
+
+    def _write(self, data, mode='ab'):
+        f = open(self.path, mode)
+        f.write(data)
+        f.close()
+        ''' 同一秒内改写时 mtime 可能不变 '''
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime + len(self.starts) + 1))
+
+    def _source(self, **kw):
+        from data_source import FileDataSource
+        return FileDataSource(self.path, self.parse, **kw)
+
+    def test_append_parses_only_new_lines(self):
+        self._write('a\nb\n')
+        source = self._source()
+        items = source.get()
+        self._write('c\nd')
+        new_items = source.get()
+        self.assertEqual([e['name'] for e in new_items], ['a', 'b', 'c'])
+        self.assertEqual([e['name'] for e in items], ['a', 'b'])
+        self._write('\n')
+        self.assertEqual([e['name'] for e in source.get()], ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.starts, [0, 4, 6])
+
+    def test_rewritten_file_is_parsed_again(self):
+        self._write('a\nb\n')
+        source = self._source()
+        source.get()
+        self._write('x\ny\nz\n', 'wb')
+        self.assertEqual([e['name'] for e in source.get()], ['x', 'y', 'z'])
+        self._write('q\n', 'wb')
+        self.assertEqual([e['name'] for e in source.get()], ['q'])
+        self.assertEqual(self.starts, [0, 0, 0])
+
+    def test_not_incremental(self):
+        self._write('a\n')
+        source = self._source(incremental=False)
+        source.get()
+        self._write('b\n')
+        self.assertEqual(len(source.get()), 2)
+        self.assertEqual(self.starts, [0, 0])
+
+    def test_columns(self):
+        from column_store import ColumnStore
+        self._write('b\na\n')
+        source = self._source(columns=['name'])
+        self.assertTrue(isinstance(source.get(), ColumnStore))
+        self._write('c\n')
+        store = source.get()
+        self.assertTrue(isinstance(store, ColumnStore))
+        self.assertEqual([e['name'] for e in store.take(store.argsort('name'))], ['a', 'b', 'c'])
+        self.assertEqual(self.starts, [0, 4])
+
+if __name__ == '__main__':
+    unittest.main()
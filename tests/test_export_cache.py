@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+export_cache 的缓存键、缓存文件和 ./tmpfile 清理
+'''
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import sql_env
+from mole.structs import MultiDict
+
+class GridA(object):
+    pass
+
+class GridB(object):
+    pass
+
+def _params(*items):
+    ret = MultiDict()
+    for k, v in items:
+        ret.append(k, v)
+    return ret
+
+class ExportKeyTest(unittest.TestCase):
+
+    def _key(self, params, model_class=GridA, hide_index=None, format='csv', version=1, user='u'):
+        from export_cache import export_key
+        return export_key(model_class, params, hide_index, format, version, user)
+
+    def test_volatile_and_empty_params_ignored(self):
+        key = self._key(_params(('dept', '1')))
+        self.assertEqual(self._key(_params(('page', '3'), ('rp', '50'), ('dept', '1'), ('_', '123'),
+                                           ('name', ''), ('qid', 'x'), ('bg', '1'))), key)
+        self.assertEqual(len(key), 20)
+
+    def test_multi_values_and_hide_order(self):
+        key = self._key(_params(('dept', '1'), ('dept', '2')), hide_index=[3, 1])
+        self.assertEqual(self._key(_params(('dept', '2'), ('dept', '1')), hide_index=[1, 3]), key)
+
+    def test_content_changes_key(self):
+        key = self._key(_params(('dept', '1')))
+        self.assertNotEqual(self._key(_params(('dept', '2'))), key)
+        self.assertNotEqual(self._key(_params(('dept', '1')), model_class=GridB), key)
+        self.assertNotEqual(self._key(_params(('dept', '1')), hide_index=[0]), key)
+        self.assertNotEqual(self._key(_params(('dept', '1')), format='xlsx'), key)
+        self.assertNotEqual(self._key(_params(('dept', '1')), version=2), key)
+        self.assertNotEqual(self._key(_params(('dept', '1')), user='v'), key)
+
+class TmpfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _file(self, name, size, age=0, used=None):
+        path = os.path.join(self.root, name)
+        open(path, 'wb').write('x'*size)
+        now = time.time()
+        os.utime(path, (now - (age if used is None else used), now - age))
+        return path
+
+    def test_cached_file(self):
+        from export_cache import cached_file
+        self._file('a.csv', 1, age=100)
+        self.assertEqual(cached_file('a.csv', self.root), 'a.csv')
+        self.assertEqual(cached_file('a.csv', self.root, max_age=200), 'a.csv')
+        self.assertEqual(cached_file('missing.csv', self.root), None)
+        self.assertEqual(cached_file('a.csv', self.root, max_age=50), None)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_cached_file_marks_use(self):
+        from export_cache import cached_file
+        path = self._file('a.csv', 1, age=100)
+        cached_file('a.csv', self.root)
+        st = os.stat(path)
+        self.assertTrue(time.time() - st.st_atime < 10)
+        self.assertTrue(time.time() - st.st_mtime > 90)
+
+    def test_clean_by_age(self):
+        from export_cache import clean_tmpfile
+        self._file('old.csv', 1, age=1000)
+        self._file('used.csv', 1, age=1000, used=10)
+        self._file('new.csv', 1)
+        self.assertEqual(clean_tmpfile(self.root, max_age=500, max_bytes=100), 1)
+        self.assertEqual(sorted(os.listdir(self.root)), ['new.csv', 'used.csv'])
+
+    def test_clean_by_size(self):
+        from export_cache import clean_tmpfile
+        self._file('a.csv', 40, age=30)
+        self._file('b.csv', 40, age=20)
+        self._file('c.csv', 40, age=50, used=10)
+        self._file('d.csv.part', 40, age=40)
+        self.assertEqual(clean_tmpfile(self.root, max_age=500, max_bytes=80), 1)
+        self.assertEqual(sorted(os.listdir(self.root)), ['b.csv', 'c.csv', 'd.csv.part'])
+
+    def test_missing_root(self):
+        from export_cache import clean_tmpfile
+        self.assertEqual(clean_tmpfile(os.path.join(self.root, 'none')), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+export_jobs 的任务队列
+'''
+import time
+import unittest
+
+import sql_env
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status in ('pending', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+class ErrorMessageTest(unittest.TestCase):
+
+    def test_byte_string(self):
+        from export_jobs import error_message
+        self.assertEqual(error_message(Exception('\xe8\xbf\x9e\xe6\x8e\xa5')), u'连接')
+        self.assertTrue(isinstance(error_message(Exception('\xff\xfe')), unicode))
+
+    def test_unicode(self):
+        from export_jobs import error_message
+        self.assertEqual(error_message(ValueError(u'超时')), u'超时')
+
+class ExportJobManagerTest(unittest.TestCase):
+
+    def test_failures_do_not_stall_the_queue(self):
+        from export_jobs import ExportJobManager
+        manager = ExportJobManager(max_workers=1)
+        def fail(job):
+            raise Exception('\xe8\xbf\x9e\xe6\x8e\xa5\xe5\xa4\xb1\xe8\xb4\xa5')
+        failed = [manager.submit('u', 'bad', fail) for i in range(2)]
+        for job in failed:
+            self.assertEqual(_wait(job), 'failed')
+            self.assertEqual(job.error, u'连接失败')
+        job = manager.submit('u', 'good', lambda job: 'a.csv')
+        self.assertEqual(_wait(job), 'done')
+        self.assertEqual(job.to_dict()['url'], '/tmpfile/a.csv')
+        self.assertEqual(manager.running['u'], 0)
+
+    def test_active_limit(self):
+        from export_jobs import ExportJobManager, ExportJobError
+        manager = ExportJobManager(max_workers=1, max_active_per_user=1)
+        job = manager.submit('u', 'slow', lambda job: time.sleep(0.2) or 'a.csv')
+        self.assertRaises(ExportJobError, manager.submit, 'u', 'more', lambda job: 'b.csv')
+        other = manager.submit('v', 'other', lambda job: 'c.csv')
+        self.assertEqual(_wait(job), 'done')
+        self.assertEqual(_wait(other), 'done')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+grid_export 的 CSV 导出
+'''
+import os
+import codecs
+import shutil
+import tempfile
+import unittest
+
+import sql_env
+
+class CSVEmitterTest(unittest.TestCase):
+
+    def setUp(self):
+        from grid_export import CSVEmitter
+        self.root = tempfile.mkdtemp()
+        self.emitter = CSVEmitter()
+        self.emitter.file_path = self.root
+        self.emitter.batch_rows = 2
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_generate_in_batches(self):
+        chunks = list(self.emitter.generate(['a', 'b'], {'a': u'甲', 'b': 'B'},
+                                            [[1, None], [u'乙', 'x'], [3, 4]]))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(''.join(chunks),
+                         codecs.BOM_UTF8 + '\xe7\x94\xb2,B\r\n1,\r\n\xe4\xb9\x99,x\r\n3,4\r\n')
+
+    def test_save_uses_given_filename(self):
+        name = self.emitter.save(u'标题', ['a'], {'a': 'A'}, iter([[1], [2]]), 'cached_key.csv')
+        self.assertEqual(name, 'cached_key.csv')
+        self.assertEqual(sorted(os.listdir(self.root)), ['cached_key.csv'])
+        data = open(os.path.join(self.root, name), 'rb').read()
+        self.assertEqual(data, codecs.BOM_UTF8 + 'A\r\n1\r\n2\r\n')
+
+    def test_failed_save_leaves_no_file(self):
+        def rows():
+            yield [1]
+            raise ValueError('boom')
+        self.assertRaises(ValueError, self.emitter.save, 't', ['a'], {'a': 'A'}, rows(), 'x.csv')
+        self.assertEqual(os.listdir(self.root), [])
+
+if __name__ == '__main__':
+    unittest.main()
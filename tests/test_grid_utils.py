@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+'''
+grid_utils.GridBase 的原型复制和查询条件
+'''
+import unittest
+
+import sql_env
+
+class CloneTest(unittest.TestCase):
+
+    def setUp(self):
+        from grid_utils import GridBase
+        self.grid = GridBase([('a', 'A'), ('b', 'B')])
+        self.grid.fields['a']['editoptions'] = {'size': 10}
+
+    def _plan(self, grid):
+        return [conv(r, r[i]) for r in [(1, 2)] for e, i, conv in grid._CompileRowPlan([(1, 2)])]
+
+    def test_fields_are_not_shared(self):
+        clone = self.grid.Clone()
+        clone.fields['a']['width'] = 80
+        clone.fields['a']['editoptions']['size'] = 20
+        self.assertFalse('width' in self.grid.fields['a'])
+        self.assertEqual(self.grid.fields['a']['editoptions'], {'size': 10})
+
+    def test_colum_trans_is_not_shared(self):
+        self.assertEqual(self._plan(self.grid), [1, 2])
+        clone = self.grid.Clone()
+        clone.colum_trans['a'] = lambda r, v: v*10
+        self.assertEqual(self.grid.colum_trans, {})
+        self.assertEqual(self._plan(clone), [10, 2])
+        self.assertEqual(self._plan(self.grid.Clone()), [1, 2])
+
+class AddInTest(unittest.TestCase):
+
+    def setUp(self):
+        sql_env.load_sql_utils()
+        from grid_utils import GridBase
+        self.grid = GridBase([('a', 'A')])
+        self.grid.sql = 'select * from t where 1=1'
+
+    def test_padded_to_power_of_two(self):
+        self.grid.AddIn('a', [3, 1, 2])
+        self.assertEqual(self.grid.sql, 'select * from t where 1=1 and a in (?,?,?,?)')
+        self.assertEqual(self.grid.params, [3, 1, 2, 2])
+
+    def test_same_text_for_similar_lengths(self):
+        from grid_utils import GridBase
+        other = GridBase([('a', 'A')])
+        other.sql = self.grid.sql
+        self.grid.AddIn('a', '5, 6,7')
+        other.AddIn('a', [1, 2, 3, 4])
+        self.assertEqual(self.grid.sql, other.sql)
+        self.assertEqual(self.grid.params, ['5', '6', '7', '7'])
+
+    def test_single_and_empty(self):
+        self.grid.AddIn('a', [9])
+        self.assertEqual(self.grid.sql, 'select * from t where 1=1 and a in (?)')
+        self.grid.AddIn('a', ' , ')
+        self.grid.AddIn('a', [])
+        self.assertEqual(self.grid.params, [9])
+
+    def test_rows_match_unpadded_query(self):
+        sql_env.execute("drop table if exists addin_t", "create table addin_t (a int)",
+                        "insert into addin_t values (1)", "insert into addin_t values (2)",
+                        "insert into addin_t values (3)")
+        self.grid.sql = 'select a from addin_t where 1=1'
+        self.grid.AddIn('a', [1, 3, 5])
+        from sql_utils import p_query
+        self.assertEqual(sorted(p_query(self.grid.sql, self.grid.GetParams())), [(1,), (3,)])
+
+if __name__ == '__main__':
+    unittest.main()
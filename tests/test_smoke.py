@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+'''
+启动冒烟测试: server.py 的导入顺序(lib 加入 sys.path, 导入 apps 和 mosys)
+用法: python -m unittest discover -s tests
+'''
+import os
+import sys
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code):
+    p = subprocess.Popen([sys.executable, '-c', "import sys; sys.path.append('./lib'); " + code],
+                         cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.communicate()[0]
+    return p.returncode, output
+
+class SmokeTest(unittest.TestCase):
+
+    def test_install_trace_hooks(self):
+        code, output = _run("from mole.mole import default_app; app = default_app(); "
+                            "sys.path.append('./lib/mosys'); import sql_trace; sql_trace.install(); "
+                            "assert sql_trace.begin_request in app.hooks['before_request']; "
+                            "assert sql_trace.end_request in app.hooks['after_request']")
+        self.assertEqual(code, 0, output)
+
+    def test_import_mosys(self):
+        code, output = _run("import apps")
+        if code and 'No module named' in output and 'pymssql' in output:
+            self.skipTest('pymssql is not installed')
+        self.assertEqual(code, 0, output)
+        code, output = _run("import apps, mocrud, mosys")
+        self.assertEqual(code, 0, output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+sql_cache 的表名解析、LRU/TTL 和写入失效, 以及 p_query 使用缓存
+'''
+import time
+import unittest
+
+import sql_env
+
+class TablesOfTest(unittest.TestCase):
+
+    def test_select(self):
+        from sql_cache import tables_of
+        self.assertEqual(tables_of("select * from dbo.[UserInfo] u left join departments d on u.d=d.id"),
+                         frozenset(['userinfo', 'departments']))
+        self.assertEqual(tables_of("select * from a, b as x, c where a.id in (select id from d)"),
+                         frozenset(['a', 'b', 'c', 'd']))
+        self.assertEqual(tables_of("select 1"), frozenset())
+
+    def test_writes(self):
+        from sql_cache import tables_of
+        self.assertEqual(tables_of("update personnel_area set name='x' where id=1"), frozenset(['personnel_area']))
+        self.assertEqual(tables_of("insert into t (a) values (1)"), frozenset(['t']))
+        self.assertEqual(tables_of("delete from t where a=1"), frozenset(['t']))
+        self.assertEqual(tables_of("truncate table t"), frozenset(['t']))
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        from sql_cache import QueryCache
+        self.cache = QueryCache(max_entries=2, ttl=60)
+
+    def test_hit_returns_copy(self):
+        self.cache.put("select * from t", None, [(1,)])
+        hit, res = self.cache.get("select * from t", None)
+        self.assertTrue(hit)
+        res.append((2,))
+        self.assertEqual(self.cache.get("select * from t", None), (True, [(1,)]))
+        self.assertEqual(self.cache.get("select * from t", [1]), (False, None))
+
+    def test_lru_eviction(self):
+        self.cache.put("select * from a", None, [1])
+        self.cache.put("select * from b", None, [2])
+        self.cache.get("select * from a", None)
+        self.cache.put("select * from c", None, [3])
+        self.assertFalse(self.cache.get("select * from b", None)[0])
+        self.assertTrue(self.cache.get("select * from a", None)[0])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertFalse('b' in self.cache.tags)
+
+    def test_ttl(self):
+        self.cache.put("select * from a", None, [1], ttl=0.05)
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get("select * from a", None), (False, None))
+        self.assertEqual(self.cache.entries, {})
+        self.assertEqual(self.cache.tags, {})
+
+    def test_invalidate(self):
+        self.cache.put("select * from a join b on a.id=b.id", None, [1])
+        self.cache.put("select * from a", {'x': 1}, [2])
+        version = self.cache.data_version(['B'])
+        self.assertEqual(self.cache.invalidate_sql("update b set x=1"), 1)
+        self.assertTrue(self.cache.get("select * from a", {'x': 1})[0])
+        self.assertNotEqual(self.cache.data_version(['B']), version)
+
+    def test_write_during_query_is_not_cached(self):
+        generation = self.cache.generation
+        self.assertEqual(self.cache.invalidate_sql("delete from a"), 0)
+        self.cache.put("select * from a", None, [1], generation=generation)
+        self.assertFalse(self.cache.get("select * from a", None)[0])
+
+    def test_cacheable(self):
+        self.assertFalse(self.cache.cacheable("select * from a"))
+        self.cache.cache_tables('A', 'b')
+        self.assertTrue(self.cache.cacheable("select * from a join b on a.id=b.id"))
+        self.assertFalse(self.cache.cacheable("select * from a join c on a.id=c.id"))
+        self.assertFalse(self.cache.cacheable("select 1"))
+
+class PQueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sql_utils = sql_env.load_sql_utils()
+        sql_env.execute("drop table if exists cache_t", "create table cache_t (a int)",
+                        "insert into cache_t values (1)")
+        self.sql_utils.query_cache.clear()
+
+    def tearDown(self):
+        self.sql_utils.query_cache.clear()
+
+    def test_cached_until_written(self):
+        sql = "select a from cache_t"
+        self.assertEqual(self.sql_utils.p_query(sql, cache=True), [(1,)])
+        sql_env.execute("insert into cache_t values (2)")
+        self.assertEqual(self.sql_utils.p_query(sql, cache=True), [(1,)])
+        self.assertEqual(sorted(self.sql_utils.p_query(sql, cache=False)), [(1,), (2,)])
+        self.sql_utils.p_execute("insert into cache_t values (3)")
+        self.assertEqual(sorted(self.sql_utils.p_query(sql, cache=True)), [(1,), (2,), (3,)])
+
+    def test_failed_query_is_not_cached(self):
+        self.assertEqual(self.sql_utils.p_query("select * from no_such_table", cache=True), None)
+        self.assertEqual(self.sql_utils.query_cache.entries, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+sql_catalog.tokenize 和 sql_utils.get_statement
+'''
+import unittest
+
+import sql_env
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_tokens(self):
+        from sql_catalog import tokenize
+        self.assertEqual(tokenize("select * from t where a = :a %(more)s"),
+                         ['select * from t where a = ', (':', 'a'), ' ', ('%', 'more')])
+
+    def test_quoted_and_casts(self):
+        from sql_catalog import tokenize
+        self.assertEqual(tokenize("select ':x', a::text from t where b=:b"),
+                         ["select ':x', a::text from t where b=", (':', 'b')])
+
+    def test_plain_text(self):
+        from sql_catalog import tokenize
+        self.assertEqual(tokenize("select 1"), ["select 1"])
+        self.assertEqual(tokenize(""), [])
+
+class _Catalog(object):
+
+    def __init__(self, content, parts):
+        from sql_catalog import tokenize
+        self.sql_dict = {"sql_text": content, "part": parts, "tokens": tokenize(content),
+                         "part_tokens": dict([(k, tokenize(v)) for k,v in parts.items()])}
+
+    def get(self, sqlfilename, sqlid, app, engine_name):
+        return self.sql_dict
+
+class GetStatementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sql_utils = sql_env.load_sql_utils()
+        self.m_catalog = self.sql_utils.sql_catalog
+        self.sql_utils._statements.clear()
+
+    def tearDown(self):
+        self.sql_utils.sql_catalog = self.m_catalog
+        self.sql_utils._statements.clear()
+
+    def _use(self, content, parts={}):
+        self.sql_utils.sql_catalog = _Catalog(content, parts)
+
+    def test_named_params(self):
+        self._use("select * from t where a = :a and b = :b and c = :a")
+        stmt = self.sql_utils.get_statement("f", "s")
+        self.assertEqual(stmt.sql, "select * from t where a = ? and b = ? and c = ?")
+        self.assertEqual(list(stmt.bind({'a': 1, 'b': 2})), [1, 2, 1])
+        self.assertRaises(Exception, stmt.bind, {'a': 1})
+
+    def test_parts(self):
+        self._use("select * from t where 1=1 %(cond)s", {'dept': "and dept = :dept", 'name': "and name = :name"})
+        stmt = self.sql_utils.get_statement("f", "s", parts={'cond': ['dept', 'name']})
+        self.assertEqual(stmt.names, ['dept', 'name'])
+        self.assertTrue(self.sql_utils.get_statement("f", "s", parts={'cond': 'dept'}).sql.endswith("dept = ? "))
+        self.assertEqual(self.sql_utils.get_statement("f", "s").names, [])
+
+    def test_empty_part_list(self):
+        self._use("select * from t %(cond)s", {'dept': "where dept = :dept"})
+        stmt = self.sql_utils.get_statement("f", "s", parts={'cond': []})
+        self.assertEqual(stmt.names, [])
+        self.assertTrue(self.sql_utils.get_statement("f", "s", parts={'cond': ()}) is stmt)
+
+    def test_same_text_is_cached(self):
+        self._use("select * from t where a = :a")
+        self.assertTrue(self.sql_utils.get_statement("f", "s") is self.sql_utils.get_statement("f", "s"))
+
+    def test_format_param_in_part(self):
+        self._use("select * from t %(cond)s", {'dept': "where dept in (%(ids)s)"})
+        self.assertRaises(ValueError, self.sql_utils.get_statement, "f", "s", parts={'cond': 'dept'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+sql_dialect 的分页、计数和包装; LIMIT/OFFSET 方言生成的语句在 sqlite 上执行验证
+'''
+import sqlite3
+import unittest
+
+import sql_env
+
+class DialectChoiceTest(unittest.TestCase):
+
+    def test_defaults(self):
+        from sql_dialect import get_dialect, RowNumberDialect, LimitOffsetDialect, OffsetFetchDialect
+        self.assertTrue(isinstance(get_dialect('sqlserver'), RowNumberDialect))
+        self.assertTrue(isinstance(get_dialect('sqlserver2005'), RowNumberDialect))
+        self.assertTrue(isinstance(get_dialect('sqlserver2012'), OffsetFetchDialect))
+        self.assertTrue(isinstance(get_dialect('sqlite'), LimitOffsetDialect))
+        self.assertTrue(isinstance(get_dialect('unknown'), RowNumberDialect))
+
+class PageSqlTest(unittest.TestCase):
+
+    def test_row_number(self):
+        from sql_dialect import RowNumberDialect
+        sql = RowNumberDialect().page('select * from (select id from t) a', 'order by id asc', 20, 10)
+        self.assertEqual(sql, 'select * from (select a.*,row_number() over (order by id asc) as r from '
+                              '(select * from (select id from t) a) a) t where t.r>20 and t.r<=30')
+
+    def test_offset_fetch(self):
+        from sql_dialect import OffsetFetchDialect
+        self.assertEqual(OffsetFetchDialect().page('select * from (x) a', 'order by id desc', 0, 15),
+                         'select * from (x) a order by id desc offset 0 rows fetch next 15 rows only')
+
+    def test_count_and_insert(self):
+        from sql_dialect import SqlDialect, LimitOffsetDialect
+        self.assertEqual(SqlDialect().count('select 1'), 'select count(1) from (select 1) m')
+        self.assertEqual(SqlDialect().insert_rows(3), 1)
+        self.assertEqual(LimitOffsetDialect().insert_rows(3), 333)
+        self.assertEqual(LimitOffsetDialect().insert('t', ['a', 'b'], [['?', '?'], ['?', '?']]),
+                         'insert into t (a,b) values (?,?),(?,?)')
+
+class PlainSelectTest(unittest.TestCase):
+
+    def test_plain(self):
+        from sql_dialect import is_plain_select
+        self.assertTrue(is_plain_select("select * from t where a in (select b from u order by b limit 1)"))
+        self.assertTrue(is_plain_select("select 'order by', \"limit\" from t -- union\n where a=1"))
+        self.assertTrue(is_plain_select("select a, count(1) from t group by a having count(1) > 1"))
+
+    def test_not_plain(self):
+        from sql_dialect import is_plain_select
+        self.assertFalse(is_plain_select("select a from t order by a"))
+        self.assertFalse(is_plain_select("select a from t limit 5"))
+        self.assertFalse(is_plain_select("select a from t union all select a from u"))
+        self.assertFalse(is_plain_select("select a from t UNION select a from u"))
+
+class LimitOffsetSqliteTest(unittest.TestCase):
+
+    def setUp(self):
+        from sql_dialect import LimitOffsetDialect
+        self.dialect = LimitOffsetDialect()
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute("create table t (id int, name text)")
+        self.conn.execute("create table u (id int, name text)")
+        self.conn.executemany("insert into t values (?, ?)", [(i, 'n%s'%i) for i in range(10)])
+        self.conn.executemany("insert into u values (?, ?)", [(i, 'u%s'%i) for i in range(10, 13)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _page(self, sql, where=None, begin=0, pagesize=3):
+        sql = self.dialect.wrap(sql, where)
+        count = self.conn.execute(self.dialect.count(sql)).fetchone()[0]
+        rows = self.conn.execute(self.dialect.page(sql, self.dialect.order_by('id', 'desc'), begin, pagesize)).fetchall()
+        return count, [r[0] for r in rows]
+
+    def test_plain_sql_is_not_wrapped(self):
+        self.assertEqual(self.dialect.wrap("select * from t"), "select * from t")
+        self.assertEqual(self._page("select * from t", begin=3), (10, [6, 5, 4]))
+
+    def test_where(self):
+        self.assertEqual(self._page("select * from t", "id < 5"), (5, [4, 3, 2]))
+
+    def test_own_order_and_limit(self):
+        self.assertEqual(self._page("select * from t order by id limit 4"), (4, [3, 2, 1]))
+
+    def test_union(self):
+        self.assertEqual(self._page("select * from t union all select * from u"), (13, [12, 11, 10]))
+
+if __name__ == '__main__':
+    unittest.main()
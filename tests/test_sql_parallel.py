@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+'''
+sql_parallel 和 sql_utils.run_parallel / p_query_partitioned
+'''
+import datetime
+import unittest
+
+import sql_env
+
+class RunAllTest(unittest.TestCase):
+
+    def test_order_and_errors(self):
+        from sql_parallel import run_all
+        res = run_all([lambda: 1, lambda: 1/0, lambda: 3])
+        self.assertEqual(res[0], 1)
+        self.assertTrue(isinstance(res[1], ZeroDivisionError))
+        self.assertEqual(res[2], 3)
+
+    def test_nested_runs_serially(self):
+        from sql_parallel import run_all
+        res = run_all([lambda: run_all([lambda: 'a', lambda: 'b']), lambda: 'c'])
+        self.assertEqual(res, [['a', 'b'], 'c'])
+
+class RangesTest(unittest.TestCase):
+
+    def test_date_ranges(self):
+        from sql_parallel import date_ranges
+        start, end = datetime.date(2026, 1, 1), datetime.date(2026, 1, 31)
+        ranges = date_ranges(start, end, 3)
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(ranges[0][0], start)
+        self.assertEqual(ranges[-1][1], end)
+        for (a, b), (c, d) in zip(ranges, ranges[1:]):
+            self.assertEqual(b, c)
+
+    def test_date_ranges_too_short(self):
+        from sql_parallel import date_ranges
+        day = datetime.date(2026, 1, 1)
+        self.assertEqual(date_ranges(day, day, 4), [(day, day)])
+
+    def test_value_ranges(self):
+        from sql_parallel import value_ranges
+        self.assertEqual(value_ranges([5, 1, 3, 3, 2, 4], 2), [(1, 2), (3, 5)])
+        self.assertEqual(value_ranges([1], 4), [(1, 1)])
+        self.assertEqual(value_ranges([], 4), [])
+
+class MergeRowsTest(unittest.TestCase):
+
+    def test_concat(self):
+        from sql_parallel import merge_rows
+        self.assertEqual(merge_rows([[(1,)], [], [(2,)]]), [(1,), (2,)])
+
+    def test_aggregate(self):
+        from sql_parallel import merge_rows
+        res = merge_rows([[('a', 1, 5, None)], [('b', 2, 1, 7), ('a', 3, 9, 2)]],
+                         keys=1, agg=['sum', 'max', 'min'])
+        self.assertEqual(res, [('a', 4, 9, 2), ('b', 2, 1, 7)])
+
+class RunParallelTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sql_utils = sql_env.load_sql_utils()
+        sql_env.execute("drop table if exists part_t",
+                        "create table part_t (dept int, amount int)",
+                        "insert into part_t values (1, 10)",
+                        "insert into part_t values (1, 5)",
+                        "insert into part_t values (3, 7)")
+
+    def test_empty_results_are_not_failures(self):
+        res = self.sql_utils.run_parallel(["select 1 where 0", "select 2 where 0"])
+        self.assertEqual(res, [[], []])
+
+    def test_failed_query_is_none(self):
+        res = self.sql_utils.run_parallel(["select * from no_such_table", "select 2"])
+        self.assertEqual(res, [None, [(2,)]])
+
+    def test_partitioned_with_empty_partition(self):
+        sql = "select dept, sum(amount) from part_t where dept between ? and ? group by dept"
+        res = self.sql_utils.p_query_partitioned(sql, [(1, 1), (2, 2), (3, 3)], keys=1, agg=['sum'])
+        self.assertEqual(sorted(res), [(1, 15), (3, 7)])
+
+    def test_partitioned_failure(self):
+        sql = "select dept from no_such_table where dept between ? and ?"
+        self.assertEqual(self.sql_utils.p_query_partitioned(sql, [(1, 1), (2, 2)]), None)
+
+if __name__ == '__main__':
+    unittest.main()